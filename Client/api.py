@@ -0,0 +1,342 @@
+
+
+import time
+import queue
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+
+from Server import protocol, compression as codecs
+from .commands import Commands
+from .database_client import Client
+
+class DatabaseClient(Commands):
+    """Thread-safe client keeping a pool of binary sessions, for programs rather than the menu.
+
+    Reads that fail on a broken connection or a timeout are retried on another connection;
+    writes are not, since the server may have applied them before the failure.
+    """
+
+    def __init__(self, host: str, port: int, pool_size: int = 8, timeout: float = 10.0, retries: int = 2, retry_delay: float = 0.05,
+                 compression: str = None) -> None:
+        """Initialize the client, connections open on first use
+        :param host: The host address of the server
+        :param port: The port of the server
+        :param pool_size: The maximum number of connections, and of requests in flight
+        :param timeout: The seconds to wait for a connection or a response
+        :param retries: The extra attempts of a read
+        :param retry_delay: The seconds before the first retry, doubling after each
+        :param compression: The codecs to accept large responses in, as by Client
+        """
+
+        self.address: Tuple = (host, port)
+        self.compression: str = compression
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self.retryDelay: float = retry_delay
+
+        # Idle connections, most recently used first, and the connections left to open
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.slots: threading.BoundedSemaphore = threading.BoundedSemaphore(pool_size)
+
+    @contextmanager
+    def connection(self) -> Iterator[Client]:
+        """Borrow a connection from the pool
+        :return: A context manager giving a connected binary Client
+        """
+
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No free connection in the pool")
+
+        try:
+            # Reuse an idle connection, or open one
+            try:
+                client = self.idle.get_nowait()
+            except queue.Empty:
+                client = Client(*self.address, binary=True, timeout=self.timeout, compression=self.compression)
+            client.open()
+
+            try:
+                yield client
+            except BaseException:
+                # A request may be half sent or half read
+                client.close()
+                raise
+
+            self.idle.put(client)
+        finally:
+            self.slots.release()
+
+    def connect(self) -> bool:
+        """Checks that the server accepts connections
+        :return: True if a connection could be opened, False otherwise
+        """
+
+        try:
+            with self.connection():
+                return True
+        except OSError:
+            print("Connection failed\n")
+            return False
+
+    def call(self, command: str, *fields) -> str:
+        """Runs a command on a pooled connection, retrying reads
+        :param command: The command name
+        :param fields: The command fields
+        :return: The server response
+        """
+
+        attempts = 1 + (self.retries if command in Client.reads else 0)
+        for attempt in range(attempts):
+            try:
+                with self.connection() as client:
+                    client.send_command(command, *fields)
+                    return client.get_server_response()
+            except OSError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(self.retryDelay * 2 ** attempt)
+
+    def pipeline(self, requests: List[Tuple], depth: int = 64) -> List[str]:
+        """Pipelines requests on one pooled connection
+        :param requests: The (command, *fields) requests
+        :param depth: The maximum number of requests in flight
+        :return: The responses, in request order
+        """
+
+        with self.connection() as client:
+            return client.pipeline(requests, depth)
+
+    def close(self) -> None:
+        """Ends the idle sessions"""
+
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+class AsyncConnection:
+    """One binary session carrying many requests at once, responses matched by request ID."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_in_flight: int, codec: str = None) -> None:
+        """Start reading responses
+        :param reader: The connection reader
+        :param writer: The connection writer
+        :param max_in_flight: The maximum number of requests awaiting a response
+        :param codec: The codec the server picked for large responses, None for none
+        """
+
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.codec: str = codec
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(max_in_flight)
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.streams: Dict[int, protocol.StreamedResponse] = {}
+        self.requestId: int = 0
+        self.closed: bool = False
+        self.task: asyncio.Task = asyncio.get_running_loop().create_task(self.receive())
+
+    @staticmethod
+    async def open(address: Tuple, max_in_flight: int, timeout: float, compression: str = None) -> "AsyncConnection":
+        """Connect and negotiate the binary protocol
+        :param address: The (host, port) of the server
+        :param max_in_flight: The maximum number of requests awaiting a response
+        :param timeout: The seconds to wait for the server
+        :param compression: The codecs to accept large responses in, as by Client
+        :return: The connection
+        """
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*address), timeout)
+        offered = codecs.negotiate(compression) if compression else None
+        try:
+            # The acknowledgement names the codec the server picked
+            writer.write((protocol.BINARY + (" " + offered if offered else "") + "\n").encode())
+            _, _, fields = await asyncio.wait_for(AsyncConnection.read_frame(reader), timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            writer.close()
+            raise ConnectionError("Could not open the session")
+
+        return AsyncConnection(reader, writer, max_in_flight, fields[2] if len(fields) > 2 else None)
+
+    @staticmethod
+    async def read_frame(reader: asyncio.StreamReader, codec: str = None) -> Tuple[int, int, List]:
+        """Read the next frame
+        :param reader: The connection reader
+        :param codec: The negotiated codec of compressed frames
+        :return: The opcode, the request ID and the fields
+        """
+
+        length, opcode, request_id = protocol.HEADER.unpack(await reader.readexactly(protocol.HEADER.size))
+        opcode, fields = protocol.decode_payload(opcode, memoryview(await reader.readexactly(length)), codec)
+        return opcode, request_id, fields
+
+    async def receive(self) -> None:
+        """Hand each response to the request waiting for it, until the connection ends"""
+
+        try:
+            while True:
+                opcode, request_id, fields = await AsyncConnection.read_frame(self.reader, self.codec)
+
+                # Gather a streamed response up to the frame ending it
+                if opcode == protocol.STREAM:
+                    if request_id not in self.streams:
+                        self.streams[request_id] = protocol.StreamedResponse(self.codec)
+                    self.streams[request_id].add(fields[0])
+                    continue
+                streamed = self.streams.pop(request_id, None)
+
+                # Requests that timed out are no longer waiting
+                future = self.pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(protocol.response_text(opcode, fields) if streamed is None else streamed.text())
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            # Fail the requests still waiting
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed by server"))
+            self.pending.clear()
+
+    async def request(self, command: str, fields: List, timeout: float) -> str:
+        """Send a request and wait for its response
+        :param command: The command name
+        :param fields: The command fields
+        :param timeout: The seconds to wait for the response
+        :return: The server response
+        """
+
+        async with self.slots:
+            if self.closed:
+                raise ConnectionError("Connection closed by server")
+
+            # Zero is left to frames outside any request
+            self.requestId = self.requestId % 0xFFFFFFFF + 1
+            request_id = self.requestId
+            future = asyncio.get_running_loop().create_future()
+            self.pending[request_id] = future
+
+            try:
+                self.writer.write(protocol.encode_frame(protocol.OPCODES[command], request_id, list(fields)))
+                await asyncio.wait_for(self.writer.drain(), timeout)
+                return await asyncio.wait_for(future, timeout)
+            finally:
+                self.pending.pop(request_id, None)
+
+    async def close(self) -> None:
+        """End the session"""
+
+        self.closed = True
+        try:
+            self.writer.write(protocol.encode_frame(protocol.END, 0, []))
+            self.writer.close()
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        self.task.cancel()
+
+class AsyncDatabaseClient(Commands):
+    """Asyncio client spreading concurrent requests over a pool of multiplexed binary sessions.
+
+    The named commands return awaitables, and the report is an async iterator.
+    Reads are retried as by DatabaseClient.
+    """
+
+    def __init__(self, host: str, port: int, pool_size: int = 4, max_in_flight: int = 256, timeout: float = 10.0, retries: int = 2, retry_delay: float = 0.05,
+                 compression: str = None) -> None:
+        """Initialize the client, connections open on first use
+        :param host: The host address of the server
+        :param port: The port of the server
+        :param pool_size: The maximum number of connections
+        :param max_in_flight: The maximum number of requests awaiting a response on each connection
+        :param timeout: The seconds to wait for a connection or a response
+        :param retries: The extra attempts of a read
+        :param retry_delay: The seconds before the first retry, doubling after each
+        :param compression: The codecs to accept large responses in, as by Client
+        """
+
+        self.address: Tuple = (host, port)
+        self.compression: str = compression
+        self.poolSize: int = pool_size
+        self.maxInFlight: int = max_in_flight
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self.retryDelay: float = retry_delay
+
+        self.connections: List[AsyncConnection] = []
+        self.opening: asyncio.Lock = None
+
+    async def connection(self) -> AsyncConnection:
+        """Pick the least busy connection, opening one while the pool is not full
+        :return: The connection
+        """
+
+        # Forget connections the server closed
+        self.connections = [connection for connection in self.connections if not connection.closed]
+
+        if len(self.connections) < self.poolSize:
+            if self.opening is None:
+                self.opening = asyncio.Lock()
+
+            # One connection opens at a time, the others wait for it
+            async with self.opening:
+                if len(self.connections) < self.poolSize:
+                    connection = await AsyncConnection.open(self.address, self.maxInFlight, self.timeout, self.compression)
+                    self.connections.append(connection)
+
+        return min(self.connections, key=lambda connection: len(connection.pending))
+
+    async def call(self, command: str, *fields) -> str:
+        """Runs a command on a pooled connection, retrying reads
+        :param command: The command name
+        :param fields: The command fields
+        :return: The server response
+        """
+
+        attempts = 1 + (self.retries if command in Client.reads else 0)
+        for attempt in range(attempts):
+            try:
+                connection = await self.connection()
+                return await connection.request(command, fields, self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(self.retryDelay * 2 ** attempt)
+
+    async def report(self, page_size: int = Commands.page_size) -> AsyncIterator[str]:
+        """Walks the report a page at a time
+        :param page_size: The customers per page
+        :return: An async iterator over the customer database strings
+        """
+
+        cursor = ""
+        while True:
+            # The first line is the next cursor
+            lines = (await self.call("report_page", cursor, page_size)).split("\n")[:-1]
+            for line in lines[1:]:
+                yield line
+            cursor = lines[0] if lines else ""
+            if not cursor:
+                return
+
+    async def close(self) -> None:
+        """Ends the sessions"""
+
+        connections, self.connections = self.connections, []
+        for connection in connections:
+            await connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
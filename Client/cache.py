@@ -0,0 +1,100 @@
+
+
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+class LRUCache:
+    """Size-bounded cache evicting the least recently used entry, entries expire after a TTL."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30.0) -> None:
+        """Initialize the cache
+        :param max_size: The maximum number of entries
+        :param ttl: The seconds an entry stays valid, None for no expiry
+        """
+
+        # Entries in recency order, each with its expiry time
+        self.entries: OrderedDict = OrderedDict()
+        self.maxSize: int = max_size
+        self.ttl: float = ttl
+
+        # Counters
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.expirations: int = 0
+        self.invalidations: int = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable):
+        """Get a cached value
+        :param key: The key
+        :return: The value, or None on a miss
+        """
+
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Drop expired entries
+        value, expires = entry
+        if expires is not None and time.monotonic() >= expires:
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        # Mark as most recently used
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value) -> None:
+        """Cache a value
+        :param key: The key
+        :param value: The value
+        """
+
+        if self.maxSize <= 0:
+            return
+
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self.entries[key] = (value, expires)
+        self.entries.move_to_end(key)
+
+        # Evict the least recently used entries
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a cached value
+        :param key: The key
+        """
+
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every cached value"""
+
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Get the cache counters
+        :return: The counters and the hit ratio
+        """
+
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,134 @@
+
+
+from typing import Iterator
+
+class Commands:
+    """Named database commands over call(command, *fields), shared by the clients.
+
+    On the asyncio client call() is a coroutine function, so these return awaitables.
+    """
+
+    # Customers per report page
+    page_size: int = 1000
+
+    def call(self, command: str, *fields) -> str:
+        """Runs a command and waits for its response
+        :param command: The command name
+        :param fields: The command fields
+        :return: The server response
+        """
+
+        raise NotImplementedError
+
+    def find_customer(self, name: str) -> str:
+        """Finds a customer
+        :param name: The customer name
+        :return: The customer database string, or "Customer not found"
+        """
+
+        return self.call("find_customer", name)
+
+    def add_customer(self, name: str, age: int, address: str, phone: str) -> str:
+        """Adds a customer
+        :param name: The customer name
+        :param age: The customer age
+        :param address: The customer address
+        :param phone: The customer phone
+        :return: The server response
+        """
+
+        return self.call("add_customer", name, age, address, phone)
+
+    def delete_customer(self, name: str) -> str:
+        """Deletes a customer
+        :param name: The customer name
+        :return: The server response
+        """
+
+        return self.call("delete_customer", name)
+
+    def update_age(self, name: str, age: int) -> str:
+        """Updates a customer's age
+        :param name: The customer name
+        :param age: The new age
+        :return: The server response
+        """
+
+        return self.call("update_age", name, age)
+
+    def update_address(self, name: str, address: str) -> str:
+        """Updates a customer's address
+        :param name: The customer name
+        :param address: The new address
+        :return: The server response
+        """
+
+        return self.call("update_address", name, address)
+
+    def update_phone(self, name: str, phone: str) -> str:
+        """Updates a customer's phone
+        :param name: The customer name
+        :param phone: The new phone
+        :return: The server response
+        """
+
+        return self.call("update_phone", name, phone)
+
+    def find_prefix(self, prefix: str, limit: int = page_size) -> str:
+        """Finds the customers whose names start with a prefix
+        :param prefix: The name prefix
+        :param limit: The maximum number of customers
+        :return: One customer database string per line
+        """
+
+        return self.call("find_prefix", prefix, limit)
+
+    def find_by_phone(self, phone: str, limit: int = page_size) -> str:
+        """Finds the customers with a phone number
+        :param phone: The phone number
+        :param limit: The maximum number of customers
+        :return: One customer database string per line
+        """
+
+        return self.call("find_by_phone", phone, limit)
+
+    def find_by_address(self, address: str, limit: int = page_size) -> str:
+        """Finds the customers at an address
+        :param address: The address
+        :param limit: The maximum number of customers
+        :return: One customer database string per line
+        """
+
+        return self.call("find_by_address", address, limit)
+
+    def find_by_age(self, low: int, high: int, limit: int = page_size) -> str:
+        """Finds the customers in an age range
+        :param low: The lowest age
+        :param high: The highest age
+        :param limit: The maximum number of customers
+        :return: One customer database string per line
+        """
+
+        return self.call("find_by_age", low, high, limit)
+
+    def get_pid(self) -> str:
+        """Gets the process ID of the server, one per line from a sharded client
+        :return: The process ID
+        """
+
+        return self.call("get_pid")
+
+    def report(self, page_size: int = page_size) -> Iterator[str]:
+        """Walks the report a page at a time
+        :param page_size: The customers per page
+        :return: An iterator over the customer database strings
+        """
+
+        cursor = ""
+        while True:
+            # The first line is the next cursor
+            lines = self.call("report_page", cursor, page_size).split("\n")[:-1]
+            yield from lines[1:]
+            cursor = lines[0] if lines else ""
+            if not cursor:
+                return
@@ -1,314 +1,360 @@
-
-
-import os
-import signal
-import socket
-from typing import Tuple
-
-from click import prompt
-
-class Client:
-    """Client class for the database server."""
-
-    # Database query prompt
-    prompt: str = """\
-=== Menu ===
-1. Find customer
-2. Add customer
-3. Delete customer
-4. Update customer age
-5. Update customer address
-6. Update customer phone
-7. Print report
-8. Exit
-        
-Select: """
-    # Database response buffer size
-    buffer: int = 1024
-
-    def __init__(self, host: str, port: int) -> None:
-        """Initialize the client
-        :param host: The host address of the server
-        """
-
-        # Initialize the socket
-        self.active: bool = True
-        self.address: Tuple = host
-        self.sock: socket.socket = None
-
-    @staticmethod
-    def ask_query() -> int:
-        """Asks the user for a query
-        :return: The query number (1 to 8)
-        """
-
-        #Loop
-        while True:
-
-            # Ask for the query
-            query: str = prompt(Client.prompt, type=int)
-
-            # Check if the query is valid
-            if query in range(1, 9):
-                return query
-
-            # Print an error message
-            print("Invalid query")
-
-    @staticmethod
-    def ask_yn(prompt: str) -> bool:
-        """Asks the user for a yes/no answer
-        :param prompt: The prompt to display
-        :return: True if the answer is yes, False otherwise
-        """
-
-        # Loop
-        while True:
-                
-            # Ask for the answer
-            answer: str = prompt(prompt, type=str)
-
-            # Check if the answer is valid
-            if answer.lower() in ("y", "yes"):
-                return True
-            elif answer.lower() in ("n", "no"):
-                return False
-
-            # Print an error message
-            print("Invalid answer")
-
-    @staticmethod
-    def ask_string(prompt: str) -> str:
-        """Asks the user for a string
-        :param prompt: The prompt to display
-        :return: The string
-        """
-
-        # Loop
-        while True:
-
-            # Ask for the string
-            string: str = prompt(prompt, type=str)
-
-            # Check if the string is valid
-            if string and len(string) > 0:
-                return string
-
-            # Print an error message
-            print("Invalid string")
-
-    @staticmethod
-    def ask_int(prompt: str) -> int:
-        """Asks the user for an integer
-        :param prompt: The prompt to display
-        :return: The integer
-        """
-
-        # Loop
-        while True:
-
-            # Ask for the integer
-            val = input(prompt).strip()
-
-            # Parse as integer
-            try:
-                integer = int(val)
-                return integer
-            except:
-                # Print an error message
-                print("Invalid integer")
-
-    @staticmethod
-    def println(string: str) -> None:
-        """Prints a message to console with newline character
-        :param string: The message to print
-        """
-
-        print(string + "\n")
-
-    def connect(self) -> bool:
-        """Connects to the server. Client shut down if connection fails.
-        :return: True if the connection was successful, False otherwise
-        """
-
-        # Create the socket
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        # Connect to the server
-        try:
-            self.sock.connect(self.address)
-            return True
-        except:
-            # Print an error message
-            Client.println("Connection failed")
-            self.active = False
-            return False
-
-    def send_query(self, query: str) -> None:
-        """Sends a query to the server
-        :param query: The query number (1 to 8)
-        """
-
-        # Send the query
-        self.sock.sendall((query + "\n").encode())
-
-    def get_server_response(self) -> str:
-        """Gets the server response
-        :return: The server response
-        """
-
-        # Receive the response
-        return self.sock.recv(Client.buffer).decode()
-
-    def receive_response(self) -> str:
-        """Receives the server response
-        :return: The server response
-        """
-
-        # Receive the response
-        response: str = self.get_server_response()
-
-        # Return the response
-        return "Server: " + response
-
-    def query(self) -> None:
-        """Queries the server"""
-
-        # Connect to the server
-        if self.connect():
-
-            # Ask for the query
-            query: int = Client.ask_query()
-
-            #Action according to the query
-            if query == 1:
-                self.find_customer()
-            elif query == 2:
-                self.add_customer()
-            elif query == 3:
-                self.delete_customer()
-            elif query == 4:
-                self.update_age()
-            elif query == 5:
-                self.update_address()
-            elif query == 6:
-                self.update_phone()
-            elif query == 7:
-                self.print_report()
-            elif query == 8:
-                self.exit()
-            else:
-                # Print an error message (should never happen)
-                print("Invalid query")
-
-            # Close the connection
-            self.sock.close()
-
-    def find_customer(self) -> None:
-        """Queries the server for a customer"""
-
-        # Get client name
-        name = Client.ask_string("Enter customer name: ")
-
-        # Send the query
-        self.send_query("\n".join(["find_customer", name]))
-        Client.println(self.receive_response())
-
-    def add_customer(self) -> None:
-        """Adds a customer to the database"""
-
-        # Get client name
-        name = Client.ask_string("Enter customer name: ")
-
-        # Get client age
-        age = Client.ask_int("Enter customer age: ")
-
-        # Get client address
-        address = Client.ask_string("Enter customer address: ")
-
-        # Get client phone
-        phone = Client.ask_string("Enter customer phone: ")
-
-        # Send the query
-        self.send_query("\n".join(["add_customer", "{}|{}|{}|{}".format(name, age, address, phone)]))
-        Client.println(self.receive_response())
-
-    def delete_customer(self) -> None:
-        """Deletes a customer from the database"""
-
-        # Get client name
-        name = Client.ask_string("Enter customer name: ")
-
-        # Send the query
-        self.send_query("\n".join(["delete_customer", name]))
-        Client.println(self.receive_response())
-
-    def update_age(self) -> None:
-        """Updates a customer's age"""
-
-        # Get client name
-        name = Client.ask_string("Enter customer name: ")
-
-        # Get client age
-        age = Client.ask_int("Enter customer age: ")
-
-        # Send the query
-        self.send_query("\n".join(["update_age", name, str(age)]))
-        Client.println(self.receive_response())
-
-    def update_address(self) -> None:
-        """Updates a customer's address"""
-
-        # Get client name
-        name = Client.ask_string("Enter customer name: ")
-
-        # Get client address
-        address = Client.ask_string("Enter customer address: ")
-
-        # Send the query
-        self.send_query("\n".join(["update_address", name, address]))
-        Client.println(self.receive_response())
-
-    def update_phone(self) -> None:
-        """Updates a customer's phone"""
-
-        # Get client name
-        name = Client.ask_string("Enter customer name: ")
-
-        # Get client phone
-        phone = Client.ask_string("Enter customer phone: ")
-
-        # Send the query
-        self.send_query("\n".join(["update_phone", name, phone]))
-        Client.println(self.receive_response())
-
-    def print_report(self) -> None:
-        """Print full report of the database"""
-
-        # Send the query
-        self.send_query("print_report")
-        Client.println("\n=== Data Records ===\n" + self.get_server_response())
-
-    def exit(self) -> None:
-        """Closes client"""
-
-        # Send the query
-        self.active = False
-        terminate = self.ask_yn("Are you sure you want to exit? ")
-
-        # Terminate if the user wants to
-        if terminate:
-            # Send the query, get PID
-            self.send_query("get_pid")
-            pid = self.get_server_response()
-
-            # kill the server
-            try:
-                # On Windows
-                if os.name == "nt":
-                    os.system("taskkill /F /PID " + pid)
-                else:
-                    os.kill(int(pid), signal.SIGTERM)
-            except:
-                # Print an error message
-                Client.println("Could not kill server, manual termination required. PID: " + pid)
+
+
+import json
+import select
+import socket
+from typing import Tuple, List, Iterator
+
+from Server import protocol, compression as codecs
+from Server.changes import ChangeFeed
+from .cache import LRUCache
+from .commands import Commands
+
+class Client(Commands):
+    """Client class for the database server, one connection at a time."""
+
+    # Database response buffer size
+    buffer: int = 65536
+    # Commands a replica can serve
+    reads: set = {"find_customer", "find_many", "report_page", "find_range", "find_prefix", "find_by_age", "find_by_address", "find_by_phone", "stats"}
+    # Writes invalidating cached customers, with the fields per item holding a name
+    writes: dict = dict({"add_customer": 4, "delete_customer": 1, "update_age": 2, "update_address": 2, "update_phone": 2},
+                        **{command: size for command, size in protocol.BATCH_FIELDS.items() if command != "find_many"})
+
+    def __init__(self, host: str, port: int, session: bool = False, binary: bool = False, cache_size: int = 0, cache_ttl: float = 30.0, replicas: List[Tuple] = (), timeout: float = None,
+                 compression: str = None) -> None:
+        """Initialize the client
+        :param host: The host address of the server
+        :param port: The port of the server
+        :param session: Whether to keep one connection open for all queries
+        :param binary: Whether to use the binary framed protocol (implies a session)
+        :param cache_size: The number of find_customer responses to cache, 0 to disable the cache
+        :param cache_ttl: The seconds a cached response stays valid, bounding staleness from other clients' writes
+        :param replicas: The (host, port) of read-only replicas taking the reads of a session round-robin,
+                         a read right after a write may not see it yet
+        :param timeout: The seconds to wait for the server before raising TimeoutError, None to wait forever
+        :param compression: The codecs to accept large responses in, comma-separated in order of preference
+                            (zlib, lz4 if installed), None for uncompressed responses
+        """
+
+        # Initialize the socket
+        self.active: bool = True
+        self.address: Tuple = (host, port)
+        self.timeout: float = timeout
+        self.binary: bool = binary
+        self.session: bool = session or binary
+        self.sock: socket.socket = None
+        self.reader: protocol.FrameReader = None
+        self.rfile = None
+        self.request_id: int = 0
+        self.cache: LRUCache = LRUCache(cache_size, cache_ttl) if cache_size > 0 else None
+
+        # Offer only the codecs this side can decode, the server picks one
+        self.compression: str = codecs.negotiate(compression) if compression else None
+
+        # Reads go to the replicas in turn, writes to the primary
+        self.replicas: List[Client] = [Client(replica_host, replica_port, session, binary, compression=compression) for replica_host, replica_port in replicas]
+        self.nextReplica: int = 0
+        self.target: Client = self
+
+    def is_connected(self) -> bool:
+        """Checks whether the session connection is still open
+        :return: True if the server has not closed the connection, False otherwise
+        """
+
+        if self.sock is None:
+            return False
+
+        # A readable socket between requests means the server closed it
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        if readable:
+            self.disconnect()
+            return False
+
+        return True
+
+    def connect(self) -> bool:
+        """Connects to the server. Client shut down if connection fails.
+        :return: True if the connection was successful, False otherwise
+        """
+
+        try:
+            self.open()
+            return True
+        except OSError:
+            # Print an error message
+            print("Connection failed\n")
+            self.active = False
+            return False
+
+    def open(self) -> None:
+        """Connects to the server, raising OSError if it cannot"""
+
+        # Reuse the session connection
+        if self.session and self.is_connected():
+            return
+
+        # Connect to the server, session responses are read through a buffer rather than a recv per header byte
+        self.sock = socket.create_connection(self.address, timeout=self.timeout)
+        self.rfile = self.sock.makefile("rb") if self.session and not self.binary else None
+        offer = " " + self.compression if self.compression else ""
+        try:
+            # Open the session, the acknowledgement names the codec the server picked
+            if self.binary:
+                self.sock.sendall((protocol.BINARY + offer + "\n").encode())
+                self.reader = protocol.FrameReader(self.sock.recv_into)
+                hello = self.reader.read()
+                if hello is None or hello[0] != protocol.HELLO:
+                    raise ValueError("Invalid acknowledgement")
+                self.reader.codec = hello[2][2] if len(hello[2]) > 2 else None
+            elif self.session:
+                self.sock.sendall(("session" + offer + "\n").encode())
+                if not self.get_server_response().startswith("OK"):
+                    raise ValueError("Session refused")
+            elif self.compression:
+                # A one-shot response comes after the line of its codec
+                self.sock.sendall((codecs.COMPRESS + offer + "\n").encode())
+        except (OSError, ValueError):
+            self.disconnect()
+            raise ConnectionError("Could not open the session")
+
+    def encode_command(self, command: str, *fields) -> bytes:
+        """Encodes a command with its fields in the negotiated protocol
+        :param command: The command name
+        :param fields: The command fields
+        :return: The encoded request
+        """
+
+        # Drop the cached customers a write touches
+        if self.cache is not None and command in Client.writes:
+            self.invalidate(command, fields)
+
+        if not self.binary:
+            # One line per field
+            return ("\n".join([command] + protocol.text_lines(command, list(fields))) + "\n").encode()
+
+        # A typed frame
+        self.request_id += 1
+        return protocol.encode_frame(protocol.OPCODES[command], self.request_id, list(fields))
+
+    def invalidate(self, command: str, fields: Tuple) -> None:
+        """Drops the cached customers named by a write
+        :param command: The write command
+        :param fields: The command fields
+        """
+
+        size = Client.writes[command]
+        for i in range(0, len(fields), size):
+            self.cache.invalidate(str(fields[i]))
+
+    def lookup(self, name: str) -> str:
+        """Finds a customer, through the cache when enabled
+        :param name: The customer name
+        :return: The server response
+        """
+
+        # Serve a cached response
+        if self.cache is not None:
+            response = self.cache.get(name)
+            if response is not None:
+                return response
+
+        # Read through to the server
+        response = self.call("find_customer", name)
+
+        if self.cache is not None:
+            self.cache.put(name, response)
+        return response
+
+    def find_customer(self, name: str) -> str:
+        """Finds a customer, through the cache when enabled
+        :param name: The customer name
+        :return: The server response
+        """
+
+        return self.lookup(name)
+
+    def call(self, command: str, *fields) -> str:
+        """Runs a command and waits for its response, over a new connection unless in a session
+        :param command: The command name
+        :param fields: The command fields
+        :return: The server response
+        """
+
+        if not self.session:
+            self.open()
+
+        try:
+            self.send_command(command, *fields)
+            return self.get_server_response()
+        finally:
+            if not self.session:
+                self.close()
+
+    def route(self, command: str) -> "Client":
+        """Picks the server for a command
+        :param command: The command name
+        :return: The next reachable replica for the reads of a session, else this client
+        """
+
+        if command not in Client.reads or not self.session:
+            return self
+
+        # Round-robin, skipping replicas that are down
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self.nextReplica]
+            self.nextReplica = (self.nextReplica + 1) % len(self.replicas)
+            if replica.connect():
+                return replica
+
+        return self
+
+    def send_command(self, command: str, *fields) -> None:
+        """Sends a command with its fields in the negotiated protocol
+        :param command: The command name
+        :param fields: The command fields
+        """
+
+        # Hand reads to a replica
+        self.target = self.route(command)
+        if self.target is not self:
+            self.target.send_command(command, *fields)
+            return
+
+        # Reopen a session the server closed while the user was typing
+        if self.session and not self.is_connected():
+            self.open()
+
+        # Send the request
+        self.sock.sendall(self.encode_command(command, *fields))
+
+    def pipeline(self, requests: List[Tuple], depth: int = 64) -> List[str]:
+        """Sends commands without waiting for each response, a window at a time
+        :param requests: The (command, *fields) requests
+        :param depth: The maximum number of requests in flight
+        :return: The responses, in request order
+        """
+
+        # Responses share the connection
+        if not self.session:
+            raise ValueError("Pipelining requires a session")
+
+        # Check the connection once, responses in flight would look like a closed socket
+        if not self.connect():
+            return []
+
+        responses = []
+        for start in range(0, len(requests), depth):
+            window = requests[start:start + depth]
+
+            # Send the window in one write, then collect its responses
+            self.sock.sendall(b"".join(self.encode_command(*request) for request in window))
+            responses.extend(self.get_server_response() for _ in window)
+
+        return responses
+
+    def subscribe(self, after: int = None, epoch: str = None, invalidate: bool = True) -> Iterator[List]:
+        """Streams change events on a dedicated connection
+        :param after: Resume after this version, None for new events only
+        :param epoch: The epoch of that version, from the subscribed event
+        :param invalidate: Whether to drop the cached customers the events touch
+        :return: An iterator over [version, op, *args] events, ending after an "o" event (missed events, resync)
+        """
+
+        with socket.create_connection(self.address) as sock:
+            if self.binary:
+                # Switch a binary session to event frames
+                sock.sendall((protocol.BINARY + "\n").encode())
+                reader = protocol.FrameReader(sock.recv_into)
+                reader.read()
+                sock.sendall(protocol.encode_frame(protocol.SUBSCRIBE, 0, ["" if after is None else after, epoch or ""]))
+                events = (frame[2] for frame in iter(reader.read, None))
+            else:
+                # One JSON event per line
+                sock.sendall("subscribe\n{}\n{}\n".format("" if after is None else after, epoch or "").encode())
+                events = (json.loads(line) for line in sock.makefile("rb"))
+
+            for event in events:
+                # Keep the cache coherent with writes from other clients
+                if invalidate and self.cache is not None and len(event) > 2 and event[1] != ChangeFeed.SUBSCRIBED:
+                    self.cache.invalidate(str(event[2]))
+                yield event
+
+    def get_server_response(self) -> str:
+        """Gets the server response
+        :return: The server response
+        """
+
+        # Read from the replica that got the request
+        target, self.target = self.target, self
+        if target is not self:
+            return target.get_server_response()
+
+        if self.binary:
+            # Read the next frame into the reusable buffer, gathering a streamed response up to the frame ending it
+            frame = self.reader.read()
+            streamed = None
+            while frame is not None and frame[0] == protocol.STREAM:
+                if streamed is None:
+                    streamed = protocol.StreamedResponse(self.reader.codec)
+                streamed.add(frame[2][0])
+                frame = self.reader.read()
+
+            if frame is None:
+                raise ConnectionError("Connection closed by server")
+            return protocol.response_text(frame[0], frame[2]) if streamed is None else streamed.text()
+
+        if self.session:
+            # Read the length line, then the framed payload, followed by its codec when compressed
+            header = self.rfile.readline()
+            if not header.endswith(b"\n"):
+                raise ConnectionError("Connection closed by server")
+            length, _, codec = header.decode().partition(" ")
+            payload = self.rfile.read(int(length))
+            if len(payload) < int(length):
+                raise ConnectionError("Connection closed by server")
+            if codec.strip():
+                payload = codecs.decompress(codec.strip(), payload)
+            return payload.decode()
+
+        # Receive until the server closes the connection
+        response = bytearray()
+        while True:
+            chunk = self.sock.recv(Client.buffer)
+            if not chunk:
+                break
+            response += chunk
+
+        if not self.compression:
+            return response.decode()
+
+        # Decompress after the codec line
+        codec, _, payload = bytes(response).partition(b"\n")
+        if codec.decode() == codecs.NONE:
+            return payload.decode()
+        return codecs.decompress(codec.decode(), payload).decode()
+
+    def close(self) -> None:
+        """Ends the sessions and closes the connections"""
+
+        for replica in self.replicas:
+            replica.close()
+
+        if self.sock is not None:
+            try:
+                if self.binary:
+                    self.sock.sendall(protocol.encode_frame(protocol.END, 0, []))
+                elif self.session:
+                    self.sock.sendall(b"end\n")
+            except OSError:
+                pass
+            self.disconnect()
+
+    def disconnect(self) -> None:
+        """Closes the connection without ending the session"""
+
+        if self.rfile is not None:
+            self.rfile.close()
+            self.rfile = None
+        self.sock.close()
+        self.sock = None
@@ -0,0 +1,327 @@
+
+
+import os
+import signal
+
+from click import prompt
+
+from .commands import Commands
+
+class Menu:
+    """Interactive prompt menu over a client's named commands."""
+
+    # Database query prompt
+    prompt: str = """\
+=== Menu ===
+1. Find customer
+2. Add customer
+3. Delete customer
+4. Update customer age
+5. Update customer address
+6. Update customer phone
+7. Print report
+8. Find customers by name prefix
+9. Find customers by phone
+10. Find customers by address
+11. Find customers by age range
+12. Exit
+
+Select: """
+    # Number of menu entries
+    queries: int = 12
+
+    def __init__(self, client: Commands) -> None:
+        """Initialize the menu
+        :param client: The client running the commands, with connect() and close()
+        """
+
+        self.client: Commands = client
+        self.active: bool = True
+
+    @staticmethod
+    def ask_query() -> int:
+        """Asks the user for a query
+        :return: The query number (1 to 12)
+        """
+
+        #Loop
+        while True:
+
+            # Ask for the query
+            query: int = prompt(Menu.prompt, type=int)
+
+            # Check if the query is valid
+            if query in range(1, Menu.queries + 1):
+                return query
+
+            # Print an error message
+            print("Invalid query")
+
+    @staticmethod
+    def ask_yn(message: str) -> bool:
+        """Asks the user for a yes/no answer
+        :param message: The prompt to display
+        :return: True if the answer is yes, False otherwise
+        """
+
+        # Loop
+        while True:
+
+            # Ask for the answer
+            answer: str = prompt(message, type=str)
+
+            # Check if the answer is valid
+            if answer.lower() in ("y", "yes"):
+                return True
+            elif answer.lower() in ("n", "no"):
+                return False
+
+            # Print an error message
+            print("Invalid answer")
+
+    @staticmethod
+    def ask_string(message: str) -> str:
+        """Asks the user for a string
+        :param message: The prompt to display
+        :return: The string
+        """
+
+        # Loop
+        while True:
+
+            # Ask for the string
+            string: str = prompt(message, type=str)
+
+            # Check if the string is valid
+            if string and len(string) > 0:
+                return string
+
+            # Print an error message
+            print("Invalid string")
+
+    @staticmethod
+    def ask_int(prompt: str) -> int:
+        """Asks the user for an integer
+        :param prompt: The prompt to display
+        :return: The integer
+        """
+
+        # Loop
+        while True:
+
+            # Ask for the integer
+            val = input(prompt).strip()
+
+            # Parse as integer
+            try:
+                integer = int(val)
+                return integer
+            except:
+                # Print an error message
+                print("Invalid integer")
+
+    @staticmethod
+    def println(string: str) -> None:
+        """Prints a message to console with newline character
+        :param string: The message to print
+        """
+
+        print(string + "\n")
+
+    def query(self) -> None:
+        """Queries the server"""
+
+        # Connect to the server
+        if not self.client.connect():
+            self.active = False
+            return
+
+        # Ask for the query
+        query: int = Menu.ask_query()
+
+        try:
+            #Action according to the query
+            if query == 1:
+                self.find_customer()
+            elif query == 2:
+                self.add_customer()
+            elif query == 3:
+                self.delete_customer()
+            elif query == 4:
+                self.update_age()
+            elif query == 5:
+                self.update_address()
+            elif query == 6:
+                self.update_phone()
+            elif query == 7:
+                self.print_report()
+            elif query == 8:
+                self.find_prefix()
+            elif query == 9:
+                self.find_by_phone()
+            elif query == 10:
+                self.find_by_address()
+            elif query == 11:
+                self.find_by_age()
+            elif query == 12:
+                self.exit()
+            else:
+                # Print an error message (should never happen)
+                print("Invalid query")
+        except OSError:
+            # Print an error message
+            Menu.println("Connection failed")
+            self.active = False
+
+        # Close the connections on exit
+        if not self.active:
+            self.client.close()
+
+    def find_customer(self) -> None:
+        """Queries the server for a customer"""
+
+        # Get client name
+        name = Menu.ask_string("Enter customer name: ")
+
+        # Send the query
+        Menu.println("Server: " + self.client.find_customer(name))
+
+    def add_customer(self) -> None:
+        """Adds a customer to the database"""
+
+        # Get client name
+        name = Menu.ask_string("Enter customer name: ")
+
+        # Get client age
+        age = Menu.ask_int("Enter customer age: ")
+
+        # Get client address
+        address = Menu.ask_string("Enter customer address: ")
+
+        # Get client phone
+        phone = Menu.ask_string("Enter customer phone: ")
+
+        # Send the query
+        Menu.println("Server: " + self.client.add_customer(name, age, address, phone))
+
+    def delete_customer(self) -> None:
+        """Deletes a customer from the database"""
+
+        # Get client name
+        name = Menu.ask_string("Enter customer name: ")
+
+        # Send the query
+        Menu.println("Server: " + self.client.delete_customer(name))
+
+    def update_age(self) -> None:
+        """Updates a customer's age"""
+
+        # Get client name
+        name = Menu.ask_string("Enter customer name: ")
+
+        # Get client age
+        age = Menu.ask_int("Enter customer age: ")
+
+        # Send the query
+        Menu.println("Server: " + self.client.update_age(name, age))
+
+    def update_address(self) -> None:
+        """Updates a customer's address"""
+
+        # Get client name
+        name = Menu.ask_string("Enter customer name: ")
+
+        # Get client address
+        address = Menu.ask_string("Enter customer address: ")
+
+        # Send the query
+        Menu.println("Server: " + self.client.update_address(name, address))
+
+    def update_phone(self) -> None:
+        """Updates a customer's phone"""
+
+        # Get client name
+        name = Menu.ask_string("Enter customer name: ")
+
+        # Get client phone
+        phone = Menu.ask_string("Enter customer phone: ")
+
+        # Send the query
+        Menu.println("Server: " + self.client.update_phone(name, phone))
+
+    @staticmethod
+    def print_customers(response: str) -> None:
+        """Prints a multi-customer response
+        :param response: The server response
+        """
+
+        Menu.println("Server: " + (response if response else "No customers found\n"))
+
+    def find_prefix(self) -> None:
+        """Finds the customers whose names start with a prefix"""
+
+        # Get the prefix
+        prefix = Menu.ask_string("Enter name prefix: ")
+
+        # Send the query
+        Menu.print_customers(self.client.find_prefix(prefix))
+
+    def find_by_phone(self) -> None:
+        """Finds the customers with a phone number"""
+
+        # Get the phone number
+        phone = Menu.ask_string("Enter customer phone: ")
+
+        # Send the query
+        Menu.print_customers(self.client.find_by_phone(phone))
+
+    def find_by_address(self) -> None:
+        """Finds the customers at an address"""
+
+        # Get the address
+        address = Menu.ask_string("Enter customer address: ")
+
+        # Send the query
+        Menu.print_customers(self.client.find_by_address(address))
+
+    def find_by_age(self) -> None:
+        """Finds the customers in an age range"""
+
+        # Get the bounds
+        low = Menu.ask_int("Enter lowest age: ")
+        high = Menu.ask_int("Enter highest age: ")
+
+        # Send the query
+        Menu.print_customers(self.client.find_by_age(low, high))
+
+    def print_report(self) -> None:
+        """Print full report of the database"""
+
+        print("\n=== Data Records ===\n")
+
+        # Print page by page
+        for line in self.client.report():
+            print(line)
+
+        print()
+
+    def exit(self) -> None:
+        """Closes client, optionally stopping the server"""
+
+        self.active = False
+        terminate = Menu.ask_yn("Are you sure you want to exit? ")
+
+        # Terminate if the user wants to
+        if terminate:
+            # Every shard answers with its PID
+            for pid in self.client.get_pid().split():
+                # kill the server
+                try:
+                    # On Windows
+                    if os.name == "nt":
+                        os.system("taskkill /F /PID " + pid)
+                    else:
+                        os.kill(int(pid), signal.SIGTERM)
+                except:
+                    # Print an error message
+                    Menu.println("Could not kill server, manual termination required. PID: " + pid)
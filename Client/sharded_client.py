@@ -0,0 +1,226 @@
+import heapq
+import itertools
+from typing import Callable, Dict, List, Tuple
+
+from Server import protocol
+from Server.sharding import HashRing
+from .database_client import Client
+
+class ShardedClient(Client):
+    """Client for customers partitioned over shard servers by consistent hashing of their names."""
+
+    # Commands sent to the shard owning their first field
+    keyed: set = {"find_customer", "add_customer", "delete_customer", "update_age", "update_address", "update_phone"}
+
+    # Commands answering with customers in name order from every shard
+    merged: set = {"find_range", "find_prefix", "find_by_address", "find_by_phone"}
+
+    def __init__(self, shards: List[Tuple], binary: bool = False, cache_size: int = 0, cache_ttl: float = 30.0, vnodes: int = 128) -> None:
+        """Initialize the client
+        :param shards: The (host, port) of each shard, in shard order
+        :param binary: Whether to use the binary framed protocol
+        :param cache_size: The number of find_customer responses to cache, 0 to disable the cache
+        :param cache_ttl: The seconds a cached response stays valid
+        :param vnodes: The virtual nodes of each shard, as used to split the file
+        """
+
+        Client.__init__(self, *shards[0], session=True, binary=binary, cache_size=cache_size, cache_ttl=cache_ttl)
+
+        # One session per shard
+        self.shards: List[Client] = [Client(host, port, session=True, binary=binary) for host, port in shards]
+        self.ring: HashRing = HashRing(len(shards), vnodes)
+        self.response: str = None
+
+    def connect(self) -> bool:
+        """Connects to every shard
+        :return: True if every connection was successful
+        """
+
+        self.active = all([shard.connect() for shard in self.shards])
+        return self.active
+
+    def close(self) -> None:
+        """Ends the sessions"""
+
+        for shard in self.shards:
+            shard.close()
+
+    def send_command(self, command: str, *fields) -> None:
+        """Runs a command on the shards it concerns, the response is kept for get_server_response
+        :param command: The command name
+        :param fields: The command fields
+        """
+
+        # Drop the cached customers a write touches
+        if self.cache is not None and command in Client.writes:
+            self.invalidate(command, fields)
+
+        self.response = self.execute(command, list(fields))
+
+    def get_server_response(self) -> str:
+        """Gets the response of the last command
+        :return: The response
+        """
+
+        response, self.response = self.response, None
+        return response
+
+    def pipeline(self, requests: List[Tuple], depth: int = 64) -> List[str]:
+        """Pipelines the keyed requests on their shards, other requests run one at a time
+        :param requests: The (command, *fields) requests
+        :param depth: The maximum number of requests in flight per shard
+        :return: The responses, in request order
+        """
+
+        responses = [None] * len(requests)
+        groups: Dict[int, List[int]] = {}
+
+        for i, request in enumerate(requests):
+            if self.cache is not None and request[0] in Client.writes:
+                self.invalidate(request[0], request[1:])
+
+            if request[0] in ShardedClient.keyed:
+                groups.setdefault(self.ring.shard(str(request[1])), []).append(i)
+            else:
+                responses[i] = self.execute(request[0], list(request[1:]))
+
+        # Each shard keeps the order of its own requests
+        for shard, indices in groups.items():
+            for i, response in zip(indices, self.shards[shard].pipeline([requests[i] for i in indices], depth)):
+                responses[i] = response
+
+        return responses
+
+    def execute(self, command: str, fields: List) -> str:
+        """Runs a command on the shards it concerns
+        :param command: The command name
+        :param fields: The command fields
+        :return: The response, merged across shards
+        """
+
+        # Single customer
+        if command in ShardedClient.keyed:
+            shard = self.shards[self.ring.shard(str(fields[0]))]
+            shard.send_command(command, *fields)
+            return shard.get_server_response()
+
+        # Batches are split by shard
+        if command in protocol.BATCH_FIELDS:
+            return self.execute_batch(command, fields)
+
+        # Sorted results are merged
+        if command == "report_page":
+            return self.report_page(fields)
+        if command in ShardedClient.merged:
+            return ShardedClient.merge(self.fan_out(command, fields), ShardedClient.name, ShardedClient.limit(fields[-1]))
+        if command == "find_by_age":
+            return ShardedClient.merge(self.fan_out(command, fields), ShardedClient.age, ShardedClient.limit(fields[-1]))
+        if command == "print_report":
+            return "\n" + "".join(line + "\n" for line in self.report()) + "\n"
+
+        # Anything else is asked of every shard
+        return "".join(line + "\n" for lines in self.fan_out(command, fields) for line in lines)
+
+    def fan_out(self, command: str, fields: List) -> List[List[str]]:
+        """Sends a command to every shard, then collects the responses
+        :param command: The command name
+        :param fields: The command fields
+        :return: The response lines of each shard
+        """
+
+        # Send everywhere first so that the shards work in parallel
+        for shard in self.shards:
+            shard.send_command(command, *fields)
+
+        return [shard.get_server_response().split("\n")[:-1] for shard in self.shards]
+
+    def execute_batch(self, command: str, fields: List) -> str:
+        """Splits a batch by shard and reassembles the response lines in item order
+        :param command: The batch command name
+        :param fields: The flattened items
+        :return: One response line per item
+        """
+
+        size = protocol.BATCH_FIELDS[command]
+        items = [fields[i:i + size] for i in range(0, len(fields), size)]
+        owners = [self.ring.shard(str(item[0])) for item in items]
+
+        # Send each shard its items
+        sent = []
+        for index, shard in enumerate(self.shards):
+            mine = [field for item, owner in zip(items, owners) if owner == index for field in item]
+            if mine:
+                shard.send_command(command, *mine)
+                sent.append(index)
+
+        # Take the response lines back in item order
+        lines = {index: iter(self.shards[index].get_server_response().split("\n")[:-1]) for index in sent}
+        return "".join(next(lines[owner], "Invalid request") + "\n" for owner in owners)
+
+    def report_page(self, fields: List) -> str:
+        """Merges one report page from every shard
+        :param fields: The cursor and the page size
+        :return: The next cursor, then the customers
+        """
+
+        limit = ShardedClient.limit(fields[1])
+        if limit is None:
+            return "Invalid limit\n"
+
+        # Every shard pages from the same cursor
+        responses = self.fan_out("report_page", fields)
+        pages = [lines[1:] for lines in responses]
+        page = list(itertools.islice(heapq.merge(*pages, key=ShardedClient.name), limit))
+
+        # More follows if a shard has another page or lines were left out of this one
+        more = any(lines and lines[0] for lines in responses) or sum(len(lines) for lines in pages) > len(page)
+        cursor = ShardedClient.name(page[-1]) if page and more else ""
+
+        return "".join(line + "\n" for line in [cursor] + page)
+
+    @staticmethod
+    def merge(responses: List[List[str]], key: Callable, limit: int) -> str:
+        """K-way merge of sorted customer lines
+        :param responses: The response lines of each shard
+        :param key: The sort key of a line
+        :param limit: The maximum number of lines
+        :return: The merged response
+        """
+
+        # Pass errors through, they are the same on every shard
+        for lines in responses:
+            if lines and "|" not in lines[0]:
+                return "".join(line + "\n" for line in lines)
+
+        return "".join(line + "\n" for line in itertools.islice(heapq.merge(*responses, key=key), limit))
+
+    @staticmethod
+    def limit(field) -> int:
+        """Parses a result limit
+        :param field: The limit field
+        :return: The limit, None if invalid
+        """
+
+        try:
+            return max(1, int(field))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def name(line: str) -> str:
+        """Sort key of a customer line
+        :param line: The customer database string
+        :return: The name
+        """
+
+        return line.split("|", 1)[0]
+
+    @staticmethod
+    def age(line: str) -> Tuple[int, str]:
+        """Sort key of an age index result
+        :param line: The customer database string
+        :return: The age and the name
+        """
+
+        name, age = line.split("|", 2)[:2]
+        return int(age), name
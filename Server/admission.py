@@ -0,0 +1,176 @@
+
+
+import io
+import time
+import threading
+from socket import socket
+from typing import Dict
+from collections import OrderedDict
+
+# Responses of refused requests
+BUSY: str = "Server busy"
+RATE_LIMITED: str = "Rate limit exceeded"
+TOO_LARGE: str = "Request too large"
+
+class RequestTooLarge(ValueError):
+    """A request line or a whole request over the server limits, the connection cannot be read further."""
+
+class TokenBucket:
+    """Allows a steady rate of requests with bursts up to its capacity."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        """Start with a full bucket
+        :param rate: The tokens added per second
+        :param burst: The capacity
+        """
+
+        self.rate: float = rate
+        self.burst: float = burst
+        self.tokens: float = burst
+        self.updated: float = time.monotonic()
+
+    def take(self, now: float) -> bool:
+        """Take a token, the caller must hold the limiter lock
+        :param now: The monotonic time
+        :return: False if the bucket is empty
+        """
+
+        # Refill for the time elapsed
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class RateLimiter:
+    """Token bucket per client, the least recently seen clients forgotten past a bound."""
+
+    def __init__(self, rate: float, burst: float = None, max_clients: int = 10000) -> None:
+        """Initialize the limiter
+        :param rate: The requests per second of each client
+        :param burst: The requests a client may send at once, the rate by default
+        :param max_clients: The clients to remember, a forgotten client starts again with a full bucket
+        """
+
+        self.rate: float = rate
+        self.burst: float = max(1.0, burst if burst is not None else rate)
+        self.maxClients: int = max_clients
+        self.lock: threading.Lock = threading.Lock()
+        self.buckets: OrderedDict = OrderedDict()
+
+    def allow(self, client: str) -> bool:
+        """Take a request from the bucket of a client
+        :param client: The client key, its host
+        :return: False if the client is over its rate
+        """
+
+        with self.lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self.buckets) > self.maxClients:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(client)
+
+            return bucket.take(time.monotonic())
+
+class ConnectionLimit:
+    """Counts the open connections, in total and per client host, to turn new ones away past the limits."""
+
+    def __init__(self, max_connections: int = 0, max_per_client: int = 0) -> None:
+        """Initialize the limit
+        :param max_connections: The connections open at once, 0 for no limit
+        :param max_per_client: The connections open at once from one client host, 0 for no limit
+        """
+
+        self.maxConnections: int = max_connections
+        self.maxPerClient: int = max_per_client
+        self.lock: threading.Lock = threading.Lock()
+        self.total: int = 0
+        self.clients: Dict[str, int] = {}
+
+    def open(self, client: str) -> bool:
+        """Count a new connection
+        :param client: The client host
+        :return: False if it is over a limit and must be closed, it is not counted then
+        """
+
+        with self.lock:
+            count = self.clients.get(client, 0)
+            if 0 < self.maxConnections <= self.total or 0 < self.maxPerClient <= count:
+                return False
+            self.total += 1
+            self.clients[client] = count + 1
+            return True
+
+    def close(self, client: str) -> None:
+        """Count the end of a connection
+        :param client: The client host
+        """
+
+        with self.lock:
+            self.total -= 1
+            count = self.clients.pop(client) - 1
+            if count:
+                self.clients[client] = count
+
+class DeadlineSocketIO(io.RawIOBase):
+    """Connection file whose reads share a deadline and whose writes each have a timeout.
+
+    A socket timeout alone bounds each recv, so a client sending a byte at a time could hold the
+    connection forever. Here every recv waits only for what is left until the deadline of the request.
+    """
+
+    def __init__(self, sock: socket, write_timeout: float = None) -> None:
+        """Wrap a connected socket
+        :param sock: The socket
+        :param write_timeout: The seconds a write may take, None for no limit
+        """
+
+        io.RawIOBase.__init__(self)
+        self.sock: socket = sock
+        self.writeTimeout: float = write_timeout
+        self.deadline: float = None
+
+    def expect(self, seconds: float) -> None:
+        """Start the deadline of the next reads
+        :param seconds: The seconds they may take in total, None for no limit
+        """
+
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def readinto(self, view: memoryview) -> int:
+        """Receive into a view, waiting at most until the deadline
+        :param view: The view to fill
+        :return: The bytes received, 0 at end of stream
+        """
+
+        if self.deadline is None:
+            self.sock.settimeout(None)
+        else:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Read deadline exceeded")
+            self.sock.settimeout(remaining)
+
+        return self.sock.recv_into(view)
+
+    def write(self, data: bytes) -> int:
+        """Send all the bytes, within the write timeout
+        :param data: The bytes
+        :return: The bytes sent
+        """
+
+        # The timeout of sendall covers the whole call
+        self.sock.settimeout(self.writeTimeout)
+        self.sock.sendall(data)
+        return len(data)
@@ -0,0 +1,439 @@
+
+
+import os
+import time
+import signal
+import asyncio
+from typing import Callable, Tuple, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from .database import Database
+from .database_server import DatabaseServer, DatabaseCommands
+from .changes import ChangeFeed
+from .replication import Replicator
+from .metrics import MeteredStreamReader, MeteredStreamWriter
+from . import protocol, compression, admission
+
+class AsyncDatabaseHandler(DatabaseCommands):
+    """Runs commands whose arguments were already read by the asyncio server."""
+
+    def __init__(self, server, client: str = None) -> None:
+        """Initialize the handler
+        :param server: The server
+        :param client: The client host the request rate is limited by
+        """
+
+        self.server = server
+        self.database: Database = server.database
+        self.client: str = client
+
+class AsyncDatabaseServer:
+    """Database server multiplexing connections on an asyncio event loop."""
+
+    def __init__(self, file: str, server_address: Tuple, database_options: Dict = None, workers: int = 32, primary: Tuple = None, forward_writes: bool = False, reuse_port: bool = False) -> None:
+        """Initialize the server
+        :param file: The database file
+        :param server_address: The server address
+        :param database_options: Keyword arguments for the database
+        :param workers: The number of threads running database commands
+        :param primary: The (host, port) of the primary to replicate, None to serve as a primary
+        :param forward_writes: Whether a replica forwards writes to its primary rather than refusing them
+        :param reuse_port: Whether other processes may bind the same port
+        """
+
+        self.pid: int = os.getpid()
+        self.file: str = file
+        self.server_address: Tuple = server_address
+        self.reuse_port: bool = reuse_port
+        self.idle_timeout: float = DatabaseServer.idle_timeout
+
+        # Deadlines and limits, as for the threaded server
+        self.read_timeout: float = DatabaseServer.read_timeout
+        self.write_timeout: float = DatabaseServer.write_timeout
+        self.max_line: int = DatabaseServer.max_line
+        self.max_request: int = DatabaseServer.max_request
+        self.connections: admission.ConnectionLimit = DatabaseServer.connections
+        self.queue_timeout: float = DatabaseServer.queue_timeout
+        self.limiter: admission.RateLimiter = DatabaseServer.limiter
+        self.database: Database = Database(file, **(database_options or {}))
+
+        # Commands may block on the lock or on disk, keep them off the event loop
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="DatabaseWorker")
+
+        # Follow the primary
+        self.replica: Replicator = Replicator(self.database, primary, forward_writes) if primary is not None else None
+
+    @property
+    def getpid(self) -> int:
+        """Get the process ID of the server.
+        :return: The process ID
+        """
+
+        return os.getpid()
+
+    async def readline(self, reader: asyncio.StreamReader, handler: AsyncDatabaseHandler) -> bytes:
+        """Read a request line within the size limits
+        :param reader: The connection reader
+        :param handler: The connection handler, counting the bytes of the request
+        :return: The line, empty at end of stream
+        """
+
+        # The reader refuses lines over its limit
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise admission.RequestTooLarge(admission.TOO_LARGE)
+
+        handler.requestBytes += len(line)
+        if handler.requestBytes > self.max_request:
+            raise admission.RequestTooLarge(admission.TOO_LARGE)
+
+        return line
+
+    async def read_arguments(self, request_type: str, reader: asyncio.StreamReader, handler: AsyncDatabaseHandler) -> List[str]:
+        """Read a command's arguments
+        :param request_type: The command name
+        :param reader: The connection reader
+        :param handler: The connection handler
+        :return: The argument lines
+        """
+
+        lines = []
+        for _ in range(DatabaseCommands.commands.get(request_type, 0)):
+            lines.append((await self.readline(reader, handler)).decode().strip())
+
+        # Batches announce their item count first
+        if request_type in DatabaseCommands.batch_commands:
+            lines.append((await self.readline(reader, handler)).decode().strip())
+            try:
+                count = max(0, int(lines[-1]))
+            except ValueError:
+                count = 0
+
+            # Every item line takes at least its newline, so a count past the request limit cannot be honest
+            size = count * DatabaseCommands.batch_commands[request_type]
+            if size > self.max_request:
+                raise admission.RequestTooLarge(admission.TOO_LARGE)
+
+            # Stop at the end of the stream, reading on would return empty lines without ever yielding
+            for _ in range(size):
+                line = await self.readline(reader, handler)
+                if not line:
+                    raise ConnectionError("Connection closed mid-request")
+                lines.append(line.decode().strip())
+
+        return lines
+
+    async def run(self, request_type: str, reader: asyncio.StreamReader, handler: AsyncDatabaseHandler) -> List[str]:
+        """Read a command's arguments and run it
+        :param request_type: The command name
+        :param reader: The connection reader
+        :param handler: The connection handler
+        :return: The response text, in chunks
+        """
+
+        # Read the arguments without blocking other clients, within the read deadline
+        lines = await asyncio.wait_for(self.read_arguments(request_type, reader, handler), self.read_timeout)
+
+        # Run the command, shed if it waits too long for a worker
+        handler.queued = time.monotonic()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, handler.execute_lines, request_type, lines)
+
+    async def drain(self, writer: asyncio.StreamWriter) -> None:
+        """Wait for the client to take the buffered response, within the write deadline
+        :param writer: The connection writer
+        """
+
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handles a connection
+        :param reader: The connection reader
+        :param writer: The connection writer
+        """
+
+        # Fast rejection when too many connections are open
+        metrics = self.database.metrics
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if isinstance(peer, tuple) else str(peer)
+        if self.connections is not None and not self.connections.open(client):
+            metrics.count("rejected_connections")
+            writer.close()
+            return
+
+        # Count the connection and its bytes
+        metrics.connection_opened()
+        reader, writer = MeteredStreamReader(reader, metrics), MeteredStreamWriter(writer, metrics)
+        handler = AsyncDatabaseHandler(self, client)
+        mode = None
+
+        try:
+            # Read the request, sessions and compressed commands name the codecs the client accepts after it
+            request_type = (await asyncio.wait_for(self.readline(reader, handler), self.read_timeout)).decode().strip()
+            mode, _, offered = request_type.partition(" ")
+            handler.codec = compression.negotiate(offered) if offered else None
+
+            if mode == DatabaseCommands.SESSION:
+                await self.session(reader, writer, handler)
+            elif mode == protocol.BINARY:
+                await self.binary(reader, writer, handler)
+            elif mode == compression.COMPRESS:
+                await self.compressed(reader, writer, handler)
+            elif request_type == DatabaseCommands.SUBSCRIBE:
+                await self.subscribe(reader, writer)
+            elif request_type == "print_report":
+                await self.stream_report(writer, handler)
+            else:
+                # Write the response
+                writer.write("".join(await self.run(request_type, reader, handler)).encode())
+                await self.drain(writer)
+        except admission.RequestTooLarge:
+            # The rest of the request cannot be told from the next one
+            metrics.count("oversized_requests")
+            writer.write(DatabaseCommands.refusal(mode, admission.TOO_LARGE))
+        except asyncio.TimeoutError:
+            # Idle, or too slow to send its request or to read the response
+            metrics.count("timeouts")
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Server stopping, end the connection quietly
+            pass
+        finally:
+            writer.close()
+            if self.connections is not None:
+                self.connections.close(client)
+            metrics.connection_closed()
+
+    async def stream_report(self, writer: asyncio.StreamWriter, handler: AsyncDatabaseHandler, output: compression.ResponseCompressor = None) -> None:
+        """Streams the report chunk by chunk, waiting for the client to drain each one
+        :param writer: The connection writer
+        :param handler: The connection handler
+        :param output: Compresses the response chunk by chunk or frames it (a protocol.FrameStream), None to send it as is
+        """
+
+        loop = asyncio.get_running_loop()
+        write = writer.write if output is None else output.write
+
+        # Refused before the report starts
+        refusal = handler.admit()
+        if refusal is not None:
+            write((refusal + "\n").encode())
+            if output is not None:
+                output.close()
+            await self.drain(writer)
+            return
+
+        chunks = self.database.iter_report()
+        try:
+            write(b"\n")
+            while True:
+                # Build the next chunk off the event loop
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                write(chunk.encode())
+                await self.drain(writer)
+            write(b"\n")
+            if output is not None:
+                output.close()
+            await self.drain(writer)
+        finally:
+            # Release the snapshot of a client that went away
+            chunks.close()
+
+    async def compressed(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler: AsyncDatabaseHandler) -> None:
+        """Runs the next command, streaming its response after a codec line
+        :param reader: The connection reader
+        :param writer: The connection writer
+        :param handler: The connection handler, with the negotiated codec
+        """
+
+        request_type = (await asyncio.wait_for(self.readline(reader, handler), self.read_timeout)).decode().strip()
+        if request_type == "print_report":
+            await self.stream_report(writer, handler, compression.ResponseCompressor(writer.write, handler.codec))
+            return
+
+        chunks = await self.run(request_type, reader, handler)
+        output = compression.ResponseCompressor(writer.write, handler.codec)
+        for chunk in chunks:
+            output.write(chunk.encode())
+        output.close()
+        await self.drain(writer)
+
+    async def subscribe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Streams change events as JSON lines until the client disconnects or falls behind
+        :param reader: The connection reader
+        :param writer: The connection writer
+        """
+
+        # Read the resume point
+        after = (await reader.readline()).decode().strip()
+        epoch = (await reader.readline()).decode().strip()
+
+        await self.stream_events(after, epoch, writer, lambda events: "".join(ChangeFeed.encode(event) for event in events).encode())
+
+    async def stream_events(self, after: str, epoch: str, writer: asyncio.StreamWriter, encode: Callable[[List[List]], bytes]) -> None:
+        """Sends change events, waiting for the client to drain each write so a slow client fills its queue and gets dropped
+        :param after: The version to resume after, empty for new events only
+        :param epoch: The epoch of that version
+        :param writer: The connection writer
+        :param encode: Encodes events for the connection
+        """
+
+        loop = asyncio.get_running_loop()
+        handler = AsyncDatabaseHandler(self)
+        subscriber = handler.open_subscription(after, epoch)
+
+        # Publishers run on worker threads, wake the loop from there
+        wake = asyncio.Event()
+
+        def wakeup() -> None:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                # The loop is closed
+                pass
+
+        subscriber.listener = wakeup
+
+        # Deliver the replayed events right away
+        wake.set()
+
+        try:
+            # Acknowledge with the starting version
+            writer.write(encode([[subscriber.version, ChangeFeed.SUBSCRIBED, self.database.changes.epoch]]))
+
+            done = False
+            while not done:
+                # A client that stops reading times out
+                await self.drain(writer)
+
+                # Wait for events or the next heartbeat
+                try:
+                    await asyncio.wait_for(wake.wait(), DatabaseCommands.heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+
+                events, done = handler.subscription_events(subscriber, subscriber.take(0))
+                writer.write(encode(events))
+            await writer.drain()
+        finally:
+            self.database.changes.unsubscribe(subscriber)
+
+    async def session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler: AsyncDatabaseHandler) -> None:
+        """Serves framed commands until the client ends the session or goes idle
+        :param reader: The connection reader
+        :param writer: The connection writer
+        :param handler: The connection handler, with the negotiated codec of the large responses
+        """
+
+        # Acknowledge the session and its codec
+        codec = handler.codec
+        writer.write(DatabaseCommands.frame(["OK {}\n".format(codec) if codec else "OK\n"]))
+
+        while True:
+            await self.drain(writer)
+
+            # Read the next request, closing idle sessions
+            handler.requestBytes = 0
+            line = await asyncio.wait_for(self.readline(reader, handler), self.idle_timeout)
+
+            # Stop at end of stream or on request
+            request_type = line.decode().strip()
+            if not line or request_type == DatabaseCommands.END:
+                return
+
+            # The rest of the connection carries events
+            if request_type == DatabaseCommands.SUBSCRIBE:
+                await self.subscribe(reader, writer)
+                return
+
+            # Run it and send the framed response
+            writer.write(DatabaseCommands.frame(await self.run(request_type, reader, handler), codec))
+
+    async def binary(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler: AsyncDatabaseHandler) -> None:
+        """Serves binary frames until the client ends the session or goes idle
+        :param reader: The connection reader
+        :param writer: The connection writer
+        :param handler: The connection handler, with the negotiated codec of the large responses
+        """
+
+        # Acknowledge the protocol version and the codec
+        codec = handler.codec
+        writer.write(protocol.encode_frame(protocol.HELLO, 0, ["OK", protocol.VERSION] + ([codec] if codec else [])))
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self.drain(writer)
+
+            # Read the next header, closing idle sessions
+            try:
+                header = await asyncio.wait_for(reader.readexactly(protocol.HEADER.size), self.idle_timeout)
+            except asyncio.IncompleteReadError:
+                return
+            length, opcode, request_id = protocol.HEADER.unpack(header)
+
+            # Stop on request
+            if opcode == protocol.END:
+                return
+
+            # The payload follows within the read deadline
+            if length > self.max_request:
+                raise admission.RequestTooLarge(admission.TOO_LARGE)
+            payload = await asyncio.wait_for(reader.readexactly(length), self.read_timeout)
+
+            # Decode the payload in place and run the request
+            fields = protocol.decode_fields(memoryview(payload))
+
+            # The rest of the connection carries event frames
+            if opcode == protocol.SUBSCRIBE:
+                after, epoch = (protocol.text_lines("subscribe", fields) + ["", ""])[:2]
+                await self.stream_events(after, epoch, writer, lambda events: b"".join(
+                    protocol.encode_frame(protocol.SUBSCRIBE, request_id, event) for event in events))
+                return
+
+            # The report streams as frames chunk by chunk, any other request answers with one
+            handler.queued = time.monotonic()
+            if opcode == protocol.OPCODES["print_report"]:
+                await self.stream_report(writer, handler, protocol.FrameStream(writer.write, opcode, request_id, codec))
+            else:
+                writer.write(await loop.run_in_executor(self.executor, handler.execute_frame, opcode, request_id, fields))
+
+    async def serve(self) -> None:
+        """Accept connections until cancelled"""
+
+        host, port = self.server_address
+        server = await asyncio.start_server(self.handle, host, port, reuse_address=True, reuse_port=self.reuse_port or None, limit=self.max_line)
+
+        # Stop on SIGTERM as on Ctrl-C, where the platform allows it
+        stopped = asyncio.get_running_loop().create_future()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set_result, None)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+        async with server:
+            await stopped
+
+    def serve_forever(self) -> None:
+        """Run the event loop"""
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    def server_close(self) -> None:
+        """Stop replicating and close the database"""
+
+        if self.replica is not None:
+            self.replica.close()
+        self.executor.shutdown(wait=True)
+        self.database.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server_close()
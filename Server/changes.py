@@ -0,0 +1,193 @@
+
+
+import os
+import itertools
+import threading
+from collections import deque
+from typing import Callable, List, Set
+from .wal import WriteAheadLog
+
+class Subscriber:
+    """Bounded queue of change events for one subscriber, never blocks the publisher."""
+
+    def __init__(self, max_pending: int = 10000) -> None:
+        """Initialize the subscriber
+        :param max_pending: The number of undelivered events after which the subscriber is dropped
+        """
+
+        self.events: deque = deque()
+        self.maxPending: int = max_pending
+        self.condition: threading.Condition = threading.Condition()
+
+        # Set once the subscriber fell behind and missed events, it must resync
+        self.overflowed: bool = False
+        self.closed: bool = False
+
+        # Called after each push, lets an event loop wake up
+        self.listener: Callable[[], None] = None
+
+        # The version the subscription starts after
+        self.version: int = 0
+
+    def push(self, events: List[List]) -> bool:
+        """Queue events
+        :param events: The [version, op, *args] events
+        :return: False if the subscriber was dropped
+        """
+
+        with self.condition:
+            if self.overflowed or self.closed:
+                return False
+
+            # Drop a subscriber too slow to keep up instead of stalling writers
+            if len(self.events) + len(events) > self.maxPending:
+                self.overflow()
+                return False
+
+            self.events.extend(events)
+            self.condition.notify()
+
+        if self.listener is not None:
+            self.listener()
+        return True
+
+    def overflow(self) -> None:
+        """Drop the queued events, the subscriber must resync"""
+
+        with self.condition:
+            self.overflowed = True
+            self.events.clear()
+            self.condition.notify()
+
+        if self.listener is not None:
+            self.listener()
+
+    def take(self, timeout: float = None) -> List[List]:
+        """Take every queued event, waiting for one
+        :param timeout: The seconds to wait, 0 to not wait
+        :return: The events, empty after the timeout, an overflow or a close
+        """
+
+        with self.condition:
+            if timeout != 0:
+                self.condition.wait_for(lambda: self.events or self.overflowed or self.closed, timeout)
+
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+    def close(self) -> None:
+        """Stop the subscription"""
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        if self.listener is not None:
+            self.listener()
+
+class ChangeFeed:
+    """Numbers the database mutations and fans them out to subscribers.
+
+    Events are [version, op, *args] with the log codes, each one sets state (an add carries the whole customer),
+    so a mirror that subscribes first and then pages the report converges once it applies the events in order.
+    """
+
+    # Control events, the mutations use the log codes
+    SUBSCRIBED: str = "s"
+    HEARTBEAT: str = "h"
+    OVERFLOW: str = "o"
+
+    def __init__(self, history: int = 100000, max_pending: int = 10000) -> None:
+        """Initialize the feed
+        :param history: The number of recent events kept for resuming subscribers
+        :param max_pending: The undelivered events allowed per subscriber
+        """
+
+        # Versions restart with the process, the epoch tells resuming subscribers apart
+        self.epoch: str = os.urandom(8).hex()
+        self.version: int = 0
+        self.history: deque = deque(maxlen=history)
+        self.maxPending: int = max_pending
+        self.subscribers: Set[Subscriber] = set()
+        self.lock: threading.Lock = threading.Lock()
+
+    def publish(self, records: List[List]) -> None:
+        """Number mutations and deliver them, called in commit order
+        :param records: The [op, *args] mutations
+        """
+
+        with self.lock:
+            events = []
+            for record in records:
+                self.version += 1
+                events.append([self.version] + list(record))
+            self.history.extend(events)
+
+            # Forget the subscribers that fell behind
+            for subscriber in list(self.subscribers):
+                if not subscriber.push(events):
+                    self.subscribers.discard(subscriber)
+
+    def subscribe(self, after: int = None, epoch: str = None) -> Subscriber:
+        """Start a subscription
+        :param after: Resume after this version, None for new events only
+        :param epoch: The epoch of the resumed version
+        :return: The subscriber, overflowed if the events after the version are gone
+        """
+
+        subscriber = Subscriber(self.maxPending)
+        with self.lock:
+            subscriber.version = self.version
+            if after is not None and after < self.version:
+                # Replay the missed events if they are still in the history
+                oldest = self.history[0][0] if self.history else self.version + 1
+                if epoch != self.epoch or after + 1 < oldest:
+                    subscriber.overflowed = True
+                    return subscriber
+                subscriber.version = after
+                subscriber.push(list(itertools.islice(self.history, after + 1 - oldest, None)))
+            elif after is not None and (epoch != self.epoch or after > self.version):
+                # A version from another run
+                subscriber.overflowed = True
+                return subscriber
+
+            self.subscribers.add(subscriber)
+
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """Stop a subscription
+        :param subscriber: The subscriber
+        """
+
+        with self.lock:
+            self.subscribers.discard(subscriber)
+        subscriber.close()
+
+    def reset(self) -> None:
+        """Start a new epoch after the data was replaced, every subscriber must resync"""
+
+        with self.lock:
+            self.epoch = os.urandom(8).hex()
+            self.history.clear()
+            for subscriber in self.subscribers:
+                subscriber.overflow()
+            self.subscribers = set()
+
+    def close(self) -> None:
+        """Stop every subscription"""
+
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, set()
+        for subscriber in subscribers:
+            subscriber.close()
+
+    @staticmethod
+    def encode(event: List) -> str:
+        """Encode an event as a text line
+        :param event: The [version, op, *args] event
+        :return: The JSON line
+        """
+
+        return WriteAheadLog.encoder.encode(event) + "\n"
@@ -0,0 +1,114 @@
+
+
+import os
+import threading
+from typing import Iterable
+
+def atomic_write(file: str, chunks: Iterable[str]) -> None:
+    """Write a file through a temporary file that atomically replaces it
+    :param file: The file to replace
+    :param chunks: The text to write
+    """
+
+    tmp = file + ".tmp"
+
+    # Write and fsync the temporary file
+    with open(tmp, "w") as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Swap it in, a crash leaves either the old or the new file
+    os.replace(tmp, file)
+
+    # Persist the rename itself
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(file)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        # Directories cannot be opened on Windows
+        pass
+
+class Compactor:
+    """Background snapshot writer that folds the mutation log into the database file."""
+
+    def __init__(self, database, max_log_bytes: int, max_dirty: int) -> None:
+        """Initialize the compactor
+        :param database: The database to compact
+        :param max_log_bytes: Compact once the log reaches this size
+        :param max_dirty: Compact once this many mutations were logged
+        """
+
+        self.database = database
+        self.max_log_bytes: int = max_log_bytes
+        self.max_dirty: int = max_dirty
+        self.wakeup: threading.Event = threading.Event()
+        self.idle: threading.Event = threading.Event()
+        self.idle.set()
+        self.active: bool = True
+        self.compactions: int = 0
+
+        # Start the background thread
+        self.thread: threading.Thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def should_compact(self, dirty: int, log_bytes: int) -> bool:
+        """Check the compaction triggers
+        :param dirty: The mutations logged since the last snapshot
+        :param log_bytes: The log size
+        :return: True if a compaction is due, False otherwise
+        """
+
+        return dirty >= self.max_dirty or log_bytes >= self.max_log_bytes
+
+    def request(self) -> None:
+        """Ask for a compaction without waiting for it"""
+
+        self.wakeup.set()
+
+    def run(self) -> None:
+        """Compact whenever requested"""
+
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            if not self.active:
+                return
+
+            self.idle.clear()
+            try:
+                self.compact()
+            except OSError as e:
+                # Keep the rotated log, recovery replays it
+                print("Compaction failed: {}".format(e))
+            finally:
+                self.idle.set()
+
+    def compact(self) -> None:
+        """Write a point-in-time snapshot and drop the log it covers"""
+
+        # Open a view and start a new log, writers only save the records they replace while it is written
+        with self.database.lock:
+            snapshot = self.database.snapshot()
+            rotated: str = self.database.rotate_log()
+
+        # Write the snapshot without holding the lock
+        try:
+            atomic_write(self.database.fName, self.database.iter_report(snapshot=snapshot))
+        finally:
+            snapshot.close()
+
+        # The snapshot covers the rotated log
+        os.remove(rotated)
+        self.compactions += 1
+
+    def close(self) -> None:
+        """Stop the background thread after the running compaction"""
+
+        self.active = False
+        self.wakeup.set()
+        self.thread.join()
@@ -0,0 +1,220 @@
+
+
+import zlib
+from typing import Callable, Dict, List
+
+try:
+    import lz4.frame
+except ImportError:
+    # Optional faster codec, zlib is always there
+    lz4 = None
+
+# Responses smaller than this many bytes stay uncompressed
+THRESHOLD: int = 1024
+
+# Negotiation line of a one-shot command with a compressed response
+COMPRESS: str = "compress"
+
+# Codec line of an uncompressed one-shot response
+NONE: str = "none"
+
+class ZlibCodec:
+    """Deflate streams, in the standard library."""
+
+    name: str = "zlib"
+
+    def __init__(self, level: int = 6) -> None:
+        """Initialize the codec
+        :param level: The compression level (1 fastest to 9 smallest)
+        """
+
+        self.level: int = level
+
+    def compressor(self):
+        """Start a stream
+        :return: An object with compress(data) and flush() ending the stream
+        """
+
+        return zlib.compressobj(self.level)
+
+    def decompressor(self):
+        """Start reading a stream
+        :return: An object with decompress(data)
+        """
+
+        return zlib.decompressobj()
+
+class Lz4Compressor:
+    """Writes one LZ4 frame, handing out the compressed bytes as they are produced.
+
+    Every compress call of a flushing frame ends a block, so small writes such as the lines of a batch
+    response are gathered up to a block first.
+    """
+
+    # Bytes gathered before compressing a block
+    block: int = 65536
+
+    def __init__(self) -> None:
+        """Start the frame"""
+
+        self.frame = lz4.frame.LZ4FrameCompressor(auto_flush=True)
+        self.header: bytes = self.frame.begin()
+        self.pending: List[bytes] = []
+        self.pendingBytes: int = 0
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress data
+        :param data: The data
+        :return: The compressed bytes, the frame header first, empty while a block is gathered
+        """
+
+        self.pending.append(data)
+        self.pendingBytes += len(data)
+        if self.pendingBytes < Lz4Compressor.block:
+            return b""
+
+        return self.drain()
+
+    def drain(self) -> bytes:
+        """Compress the gathered data
+        :return: The compressed bytes, the frame header first
+        """
+
+        header, self.header = self.header, b""
+        pending, self.pending, self.pendingBytes = self.pending, [], 0
+        return header + (self.frame.compress(b"".join(pending)) if pending else b"")
+
+    def flush(self) -> bytes:
+        """End the frame
+        :return: The last compressed bytes
+        """
+
+        return self.drain() + self.frame.flush()
+
+class Lz4Codec:
+    """LZ4 frames, several times faster than zlib for a lower ratio, when the lz4 package is installed."""
+
+    name: str = "lz4"
+
+    def compressor(self) -> Lz4Compressor:
+        """Start a stream
+        :return: An object with compress(data) and flush() ending the stream
+        """
+
+        return Lz4Compressor()
+
+    def decompressor(self):
+        """Start reading a stream
+        :return: An object with decompress(data)
+        """
+
+        return lz4.frame.LZ4FrameDecompressor()
+
+# Available codecs by name
+CODECS: Dict[str, object] = {"zlib": ZlibCodec()}
+if lz4 is not None:
+    CODECS["lz4"] = Lz4Codec()
+
+def negotiate(offered: str) -> str:
+    """Pick the codec of a connection
+    :param offered: The codecs the client accepts, comma-separated in order of preference
+    :return: The first one available, None for none
+    """
+
+    for name in offered.split(","):
+        if name.strip() in CODECS:
+            return name.strip()
+
+    return None
+
+def compress(codec: str, data: bytes) -> bytes:
+    """Compress data as one stream
+    :param codec: The codec name
+    :param data: The data
+    :return: The compressed stream
+    """
+
+    compressor = CODECS[codec].compressor()
+    return compressor.compress(data) + compressor.flush()
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """Decompress one stream
+    :param codec: The codec name
+    :param data: The compressed stream
+    :return: The data
+    """
+
+    return CODECS[codec].decompressor().decompress(data)
+
+def compress_chunks(codec: str, chunks: List[str]) -> bytes:
+    """Compress text chunk by chunk into one stream, never joining the uncompressed text
+    :param codec: The codec name
+    :param chunks: The text chunks
+    :return: The compressed stream
+    """
+
+    compressor = CODECS[codec].compressor()
+    parts = [compressor.compress(chunk.encode()) for chunk in chunks]
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+class ResponseCompressor:
+    """Streams a one-shot response after a codec line, compressed once it reaches the threshold.
+
+    The text is held back until the threshold is reached, then the codec line goes out and every write
+    is compressed as it comes, so a report is never compressed as one string. A response ending below the
+    threshold goes out as is after a "none" line.
+    """
+
+    def __init__(self, write: Callable[[bytes], None], codec: str = None, threshold: int = THRESHOLD) -> None:
+        """Initialize the response
+        :param write: Sends bytes to the client
+        :param codec: The negotiated codec, None to send the response as is
+        :param threshold: The bytes from which the response is compressed
+        """
+
+        self.send: Callable[[bytes], None] = write
+        self.codec: str = codec
+        self.threshold: int = threshold
+        self.compressor = None
+        self.held: List[bytes] = []
+        self.heldBytes: int = 0
+
+        # Without a codec the response starts right away
+        if codec is None:
+            self.send((NONE + "\n").encode())
+            self.held = None
+
+    def write(self, data: bytes) -> None:
+        """Write part of the response
+        :param data: The bytes
+        """
+
+        if self.compressor is not None:
+            # Compressing, send what the codec hands out
+            out = self.compressor.compress(data)
+            if out:
+                self.send(out)
+        elif self.held is None:
+            # Decided against compressing
+            self.send(data)
+        else:
+            # Hold the text until it reaches the threshold
+            self.held.append(data)
+            self.heldBytes += len(data)
+            if self.heldBytes >= self.threshold:
+                self.send((self.codec + "\n").encode())
+                self.compressor = CODECS[self.codec].compressor()
+                held, self.held = self.held, None
+                self.write(b"".join(held))
+
+    def close(self) -> None:
+        """End the response"""
+
+        if self.compressor is not None:
+            self.send(self.compressor.flush())
+            self.compressor = None
+        elif self.held is not None:
+            # Below the threshold, not worth compressing
+            self.send((NONE + "\n").encode() + b"".join(self.held))
+            self.held = None
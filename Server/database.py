@@ -1,38 +1,168 @@
 
 
-from typing import List, Dict
+import os
+import time
+import shutil
+import threading
+from typing import List, Dict, Iterable, Iterator, Tuple
+from .wal import WriteAheadLog
+from .compaction import Compactor, atomic_write
+from .index import SortedIndex, HashIndex
+from .records import ENGINES, ListRecords
+from .storage import BACKENDS, StorageBackend
+from .changes import ChangeFeed
+from .metrics import Metrics, StripedLock
+from .group_commit import GroupCommitter, Batch
+from .snapshot import Snapshot
+from . import loader
 
 class Database:
     """Database storage class structure."""
 
-    def __init__(self, file: str) -> None:
+    # Durability modes
+    REWRITE: str = "rewrite"
+    WAL: str = "wal"
+
+    # Log codes of the updatable fields
+    FIELDS: Dict[str, str] = {"age": WriteAheadLog.AGE, "address": WriteAheadLog.ADDRESS, "phone": WriteAheadLog.PHONE}
+
+    def __init__(self, file: str, durability: str = REWRITE, fsync: str = WriteAheadLog.FSYNC_ALWAYS, fsync_interval: int = 100, compact_log_bytes: int = 64 * 1024 * 1024, compact_dirty: int = 100000, indexes: Iterable[str] = (), engine: str = "list", load_workers: int = 1, backend: str = "text", commit_window: float = None, commit_batch: int = 1000, lock_stripes: int = 64) -> None:
         """Initialize the database
         :param file: The database file
+        :param durability: Rewrite the whole file on each mutation (rewrite) or append to a log (wal)
+        :param fsync: The log fsync policy (always, interval or never)
+        :param fsync_interval: The log fsync interval in milliseconds
+        :param compact_log_bytes: Snapshot in the background once the log reaches this size
+        :param compact_dirty: Snapshot in the background once this many mutations were logged
+        :param indexes: The fields to index for lookups (age, address, phone)
+        :param engine: The in-memory record layout (list, tuple or packed)
+        :param load_workers: The number of processes parsing the file at startup
+        :param backend: The storage backend (text, sqlite or mmap), sqlite and mmap persist every mutation themselves
+        :param commit_window: Coalesce the mutations of concurrent writers arriving within this many milliseconds into one flush, None to flush each one
+        :param commit_batch: The mutations that flush a group commit without waiting for its window
+        :param lock_stripes: The lock stripes updates of different customers run in parallel on, 0 for one lock
         """
 
+        # Check the durability mode
+        if durability not in (Database.REWRITE, Database.WAL):
+            raise ValueError("Invalid durability mode: {}".format(durability))
+
+        # Check the storage engine
+        if engine not in ENGINES:
+            raise ValueError("Invalid storage engine: {}".format(engine))
+
+        # Check the storage backend
+        if backend != "text" and backend not in BACKENDS:
+            raise ValueError("Invalid storage backend: {}".format(backend))
+        if backend != "text" and durability != Database.REWRITE:
+            raise ValueError("The {} backend does not use the write-ahead log".format(backend))
+
+        # Check the indexed fields
+        for field in indexes:
+            if field not in Database.FIELDS:
+                raise ValueError("Invalid index field: {}".format(field))
+
         # Initialize the database
         self.fName: str = file
+        self.logName: str = file + ".log"
+        self.durability: str = durability
+        self.fsync: str = fsync
+        self.fsyncInterval: int = fsync_interval
         self.database: Dict = {}
+        self.records = ENGINES[engine]
+        self.index: SortedIndex = SortedIndex()
+
+        # Secondary indexes, age is ordered by (age, name)
+        self.ageIndex: SortedIndex = SortedIndex() if "age" in indexes else None
+        self.addressIndex: HashIndex = HashIndex() if "address" in indexes else None
+        self.phoneIndex: HashIndex = HashIndex() if "phone" in indexes else None
+        self.secondary: bool = bool(indexes)
+        self.log: WriteAheadLog = None
+        self.compactor: Compactor = None
+        self.dirty: int = 0
+        self.metrics: Metrics = Metrics()
+        self.lock: StripedLock = StripedLock(self.metrics, lock_stripes)
+
+        # Guards the secondary indexes and the snapshot saves between writers holding different stripes
+        self.indexLock: threading.Lock = threading.Lock()
+        self.striped: bool = False
+        self.backend: StorageBackend = None
+        self.committer: GroupCommitter = None
+
+        # Open point-in-time views, writers save the records they replace into each
+        self.snapshots: List[Snapshot] = []
+
+        # Versioned stream of the mutations for subscribers
+        self.changes: ChangeFeed = ChangeFeed()
+
+        start = time.perf_counter()
+        if backend != "text":
+            # Work on the table of the backend
+            self.backend = BACKENDS[backend](file, fsync)
+            self.database = self.backend.open_table()
+            if not self.backend.resident:
+                # The on-disk table stores the records itself
+                self.records = ListRecords
+            self.bulk_load(self.backend.load())
+
+            # Index the records that stayed on disk
+            if self.secondary and not self.backend.resident:
+                with self.lock:
+                    for name in self.index:
+                        self.index_record(name, self.database[name])
+
+            self.loadSeconds: float = time.perf_counter() - start
+            self.start_group_commit(commit_window, commit_batch)
+            return
 
         try:
-            # Open the file
-            with open(file) as f:
-                # Read the file
-                lines = f.readlines()
-                for line in lines:
-                    customer = Database.process_line(line)
-                    # Add if valid customer
-                    if customer != None:
-                        self.add_customer(customer, False)
+            # Stream the valid customers from the file
+            state: Dict = {}
+            self.bulk_load(loader.load(file, load_workers, state))
                 
-                # Update the file
+            if durability == Database.REWRITE and not state["clean"]:
+                # Update the file, unless it is already what update_file() would write
                 self.update_file()
         except:
-            # If invalid, create a new file
+            # If invalid, create a new file, dropping the customers read before the error along with their indexes
             print("Invalid database file, creating new file")
+            self.clear()
             with open(file, "w") as f:
                 pass
 
+        self.loadSeconds: float = time.perf_counter() - start
+
+        if durability == Database.WAL:
+            # Replay a log left by an interrupted compaction, then the current log
+            rotated = self.logName + ".1"
+            self.replay_log(rotated)
+            self.replay_log(self.logName)
+
+            if os.path.exists(rotated):
+                # Finish the interrupted compaction
+                self.update_file()
+                for log in (rotated, self.logName):
+                    if os.path.exists(log):
+                        os.remove(log)
+
+            # Open the log for appending
+            self.log = WriteAheadLog(self.logName, self.fsync, self.fsyncInterval)
+            self.compactor = Compactor(self, compact_log_bytes, compact_dirty)
+
+        self.start_group_commit(commit_window, commit_batch)
+
+    def start_group_commit(self, window: float, batch: int) -> None:
+        """Start coalescing the flushes of concurrent writers, once the database is loaded
+        :param window: The commit window in milliseconds, None to flush each mutation
+        :param batch: The mutations that flush a commit without waiting for its window
+        """
+
+        if window is not None:
+            self.committer = GroupCommitter(self.write_records, window, batch)
+
+        # Updates may run on stripes when persisting them never takes the whole lock: a log append or a group commit
+        self.striped = self.committer is not None or self.log is not None
+
     @staticmethod
     def process_line(line: str) -> List:
         """Process a line from the database file
@@ -74,6 +204,178 @@ class Database:
         # Format the customer
         return "{}|{}|{}|{}".format(name, data[0], data[1], data[2])
 
+    def bulk_load(self, customers: Iterable[List]) -> None:
+        """Add customers without persisting them, building the name index once at the end
+        :param customers: The customer data, the first occurrence of a name wins
+        """
+
+        with self.lock:
+            for customer in customers:
+                name = customer[0]
+                if name not in self.database:
+                    self.database[name] = self.records.pack(customer[1:])
+                    if self.secondary:
+                        self.index_record(name, customer[1:])
+
+            # One sort, linear for a file that is already in order
+            self.index = SortedIndex(self.database)
+
+    def clear(self) -> None:
+        """Remove every customer and every index entry, without persisting"""
+
+        with self.lock:
+            self.database = {}
+            self.index = SortedIndex()
+            self.ageIndex = SortedIndex() if self.ageIndex is not None else None
+            self.addressIndex = HashIndex() if self.addressIndex is not None else None
+            self.phoneIndex = HashIndex() if self.phoneIndex is not None else None
+
+    def replay_log(self, file: str) -> None:
+        """Apply the mutations recorded in a log on top of the loaded snapshot
+        :param file: The log file
+        """
+
+        for record in WriteAheadLog.replay(file):
+            op, args = record[0], record[1:]
+
+            if op == WriteAheadLog.ADD:
+                self.add_customer(args, False)
+            elif op == WriteAheadLog.DELETE:
+                self.delete_customer(args[0], False)
+            elif op == WriteAheadLog.AGE:
+                self.update_age(args[0], args[1], False)
+            elif op == WriteAheadLog.ADDRESS:
+                self.update_address(args[0], args[1], False)
+            elif op == WriteAheadLog.PHONE:
+                self.update_phone(args[0], args[1], False)
+
+    def persist(self, op: str, *args) -> Batch:
+        """Persist a mutation according to the durability mode, the caller must hold the lock
+        :param op: The log mutation code
+        :param args: The mutation arguments
+        :return: The group commit to wait for outside the lock, None once persisted
+        """
+
+        return self.persist_many([[op] + list(args)])
+
+    def persist_many(self, records: List[List]) -> Batch:
+        """Persist a batch of mutations with one flush, the caller must hold the lock
+        :param records: The [op, *args] log records
+        :return: The group commit to wait for outside the lock, None once persisted
+        """
+
+        if not records:
+            return None
+
+        # Join the commit of the concurrent writers
+        if self.committer is not None:
+            return self.committer.submit(records)
+
+        self.write_records(records)
+        return None
+
+    def write_records(self, records: List[List]) -> None:
+        """Write mutations with one flush, under the lock or from the group commit thread
+        :param records: The [op, *args] log records
+        """
+
+        start = time.perf_counter()
+        if self.backend is not None:
+            # Let the backend store the whole batch
+            self.backend.apply(records)
+        elif self.log is not None:
+            # Append the whole batch at once, the count may miss a concurrent stripe but only triggers compaction
+            self.log.append_many(records)
+            self.dirty += len(records)
+
+            # Hand the snapshot off to the compactor
+            if self.compactor.should_compact(self.dirty, self.log.size()):
+                self.compactor.request()
+        else:
+            # Rewrite the whole file once, it holds every mutation submitted so far
+            self.update_file()
+        self.metrics.observe("persist", time.perf_counter() - start)
+
+        # Notify the subscribers once persisted
+        self.changes.publish(records)
+
+    def wait_durable(self, commit: Batch) -> None:
+        """Wait for a group commit, the caller must not hold the lock
+        :param commit: The commit returned by persist, None once persisted
+        """
+
+        if commit is not None:
+            start = time.perf_counter()
+            self.committer.wait(commit)
+            self.metrics.observe("commit_wait", time.perf_counter() - start)
+
+    def index_record(self, name: str, record: List) -> None:
+        """Add a record to the secondary indexes, the caller must hold the lock
+        :param name: The customer name
+        :param record: The customer record
+        """
+
+        if self.ageIndex is not None:
+            self.ageIndex.add((record[0], name))
+        if self.addressIndex is not None:
+            self.addressIndex.add(record[1], name)
+        if self.phoneIndex is not None:
+            self.phoneIndex.add(record[2], name)
+
+    def unindex_record(self, name: str, record: List) -> None:
+        """Remove a record from the secondary indexes, the caller must hold the lock
+        :param name: The customer name
+        :param record: The customer record
+        """
+
+        if self.ageIndex is not None:
+            self.ageIndex.discard((record[0], name))
+        if self.addressIndex is not None:
+            self.addressIndex.discard(record[1], name)
+        if self.phoneIndex is not None:
+            self.phoneIndex.discard(record[2], name)
+
+    def reindex_record(self, name: str, old: List, new: List) -> None:
+        """Move a record between secondary index entries, the caller must hold the lock or the stripe of the name
+        :param name: The customer name
+        :param old: The previous record
+        :param new: The new record
+        """
+
+        # Writers of other stripes may move records too
+        with self.indexLock:
+            self.unindex_record(name, old)
+            self.index_record(name, new)
+
+    def write_lock(self, name: str):
+        """Get the lock of an update to one customer
+        :param name: The customer name
+        :return: The stripe of the name when updates run on stripes, else the whole lock
+        """
+
+        return self.lock.stripe(name) if self.striped else self.lock
+
+    def snapshot(self) -> Snapshot:
+        """Open a point-in-time view for reports and scans, close it once read
+        :return: The snapshot
+        """
+
+        with self.lock:
+            snapshot = Snapshot(self)
+            self.snapshots.append(snapshot)
+            return snapshot
+
+    def preserve(self, name: str) -> None:
+        """Save a record about to change into the open snapshots, the caller must hold the lock or the stripe of the name
+        :param name: The customer name
+        """
+
+        if self.snapshots:
+            record = self.database.get(name)
+            with self.indexLock:
+                for snapshot in self.snapshots:
+                    snapshot.preserve(name, record)
+
     def has_customer(self, name: str) -> bool:
         """Check if the database has a customer
         :param name: The customer name
@@ -89,9 +391,12 @@ class Database:
         :return: The customer database string
         """
 
-        if self.has_customer(name):
+        # Single lookup, records are replaced and never mutated so no lock is needed
+        record = self.database.get(name)
+
+        if record is not None:
             # Return the customer
-            return Database.format_customer(name, self.database[name])
+            return Database.format_customer(name, self.records.unpack(record))
         else:
             # Return an error message
             return None
@@ -103,17 +408,25 @@ class Database:
         :return: True if the customer was added, False otherwise
         """
 
-        # Check if the customer exists
-        if not self.has_customer(data[0]):
+        commit = None
+        with self.lock:
+            # Check if the customer exists
+            if self.has_customer(data[0]):
+                return False
 
             # Add the customer
-            self.database[data[0]] = data[1:]
+            self.preserve(data[0])
+            self.database[data[0]] = self.records.pack(data[1:])
+            self.index.add(data[0])
+            if self.secondary:
+                self.index_record(data[0], data[1:])
             if update:
-                # Update the file
-                self.update_file()
-            return True
+                # Persist the change
+                commit = self.persist(WriteAheadLog.ADD, *data)
 
-        return False
+        # Answer once the change is durable
+        self.wait_durable(commit)
+        return True
 
     def delete_customer(self, name: str, update: bool = True) -> bool:
         """Delete a customer from the database
@@ -122,17 +435,25 @@ class Database:
         :return: True if the customer was deleted, False otherwise
         """
 
-        # Check if the customer exists
-        if self.has_customer(name):
+        commit = None
+        with self.lock:
+            # Check if the customer exists
+            if not self.has_customer(name):
+                return False
 
             # Delete the customer
+            self.preserve(name)
+            if self.secondary:
+                self.unindex_record(name, self.records.unpack(self.database[name]))
             del self.database[name]
+            self.index.discard(name)
             if update:
-                # Update the file
-                self.update_file()
-            return True
+                # Persist the change
+                commit = self.persist(WriteAheadLog.DELETE, name)
 
-        return False
+        # Answer once the change is durable
+        self.wait_durable(commit)
+        return True
 
     def update_age(self, name: str, age: int, update: bool = True) -> bool:
         """Update a customer's age
@@ -142,17 +463,27 @@ class Database:
         :return: True if the customer was updated, False otherwise
         """
 
-        # Check if the customer exists
-        if self.has_customer(name):
-
-            # Update the customer
-            self.database[name][0] = age
+        commit = None
+        with self.write_lock(name):
+            # Check if the customer exists
+            if not self.has_customer(name):
+                return False
+
+            # Replace the record, snapshots may still hold the old one
+            self.preserve(name)
+            old = self.records.unpack(self.database[name])
+            record = list(old)
+            record[0] = age
+            if self.secondary:
+                self.reindex_record(name, old, record)
+            self.database[name] = self.records.pack(record)
             if update:
-                # Update the file
-                self.update_file()
-            return True
+                # Persist the change
+                commit = self.persist(WriteAheadLog.AGE, name, age)
 
-        return False
+        # Answer once the change is durable
+        self.wait_durable(commit)
+        return True
 
     def update_address(self, name: str, address: str, update: bool = True) -> bool:
         """Update a customer's address
@@ -162,17 +493,27 @@ class Database:
         :return: True if the customer was updated, False otherwise
         """
 
-        # Check if the customer exists
-        if self.has_customer(name):
-
-            # Update the customer
-            self.database[name][1] = address
+        commit = None
+        with self.write_lock(name):
+            # Check if the customer exists
+            if not self.has_customer(name):
+                return False
+
+            # Replace the record, snapshots may still hold the old one
+            self.preserve(name)
+            old = self.records.unpack(self.database[name])
+            record = list(old)
+            record[1] = address
+            if self.secondary:
+                self.reindex_record(name, old, record)
+            self.database[name] = self.records.pack(record)
             if update:
-                # Update the file
-                self.update_file()
-            return True
+                # Persist the change
+                commit = self.persist(WriteAheadLog.ADDRESS, name, address)
 
-        return False
+        # Answer once the change is durable
+        self.wait_durable(commit)
+        return True
 
     def update_phone(self, name: str, phone: str, update: bool = True) -> bool:
         """Update a customer's phone number
@@ -182,35 +523,287 @@ class Database:
         :return: True if the customer was updated, False otherwise
         """
 
-        # Check if the customer exists
-        if self.has_customer(name):
-
-            # Update the customer
-            self.database[name][2] = phone
+        commit = None
+        with self.write_lock(name):
+            # Check if the customer exists
+            if not self.has_customer(name):
+                return False
+
+            # Replace the record, snapshots may still hold the old one
+            self.preserve(name)
+            old = self.records.unpack(self.database[name])
+            record = list(old)
+            record[2] = phone
+            if self.secondary:
+                self.reindex_record(name, old, record)
+            self.database[name] = self.records.pack(record)
             if update:
-                # Update the file
-                self.update_file()
-            return True
+                # Persist the change
+                commit = self.persist(WriteAheadLog.PHONE, name, phone)
+
+        # Answer once the change is durable
+        self.wait_durable(commit)
+        return True
+
+    def get_customers(self, names: List[str]) -> List[str]:
+        """Get several customers from the database
+        :param names: The customer names
+        :return: The customer database strings, None for missing customers
+        """
+
+        return [self.get_customer(name) for name in names]
+
+    def add_customers(self, customers: List[List]) -> List[bool]:
+        """Add several customers under one lock and one flush
+        :param customers: The customer data
+        :return: Whether each customer was added
+        """
+
+        with self.lock:
+            results = [self.add_customer(data, False) for data in customers]
+
+            # Persist the customers that were added
+            commit = self.persist_many([[WriteAheadLog.ADD] + list(data) for data, added in zip(customers, results) if added])
+
+        # Answer once the changes are durable
+        self.wait_durable(commit)
+        return results
+
+    def delete_customers(self, names: List[str]) -> List[bool]:
+        """Delete several customers under one lock and one flush
+        :param names: The customer names
+        :return: Whether each customer was deleted
+        """
+
+        with self.lock:
+            results = [self.delete_customer(name, False) for name in names]
+
+            # Persist the deletions
+            commit = self.persist_many([[WriteAheadLog.DELETE, name] for name, deleted in zip(names, results) if deleted])
+
+        # Answer once the changes are durable
+        self.wait_durable(commit)
+        return results
+
+    def update_customers(self, updates: List[Tuple[str, str, object]]) -> List[bool]:
+        """Update several customer fields under one lock and one flush
+        :param updates: The (name, field, value) updates, field is age, address or phone
+        :return: Whether each customer was updated
+        """
+
+        setters = {"age": self.update_age, "address": self.update_address, "phone": self.update_phone}
+
+        with self.lock:
+            results = [setters[field](name, value, False) for name, field, value in updates]
+
+            # Persist the updates
+            commit = self.persist_many([[Database.FIELDS[field], name, value] for (name, field, value), updated in zip(updates, results) if updated])
+
+        # Answer once the changes are durable
+        self.wait_durable(commit)
+        return results
+
+    def read_records(self, names: List[str]) -> List[Tuple[str, object]]:
+        """Read the stored records of customers, the caller must hold the lock for a consistent view
+        :param names: The customer names
+        :return: The (name, stored record) pairs, skipping missing customers
+        """
+
+        records = []
+        for name in names:
+            record = self.database.get(name)
+            if record is not None:
+                records.append((name, record))
+
+        return records
+
+    def format_records(self, records: List[Tuple[str, object]]) -> List[str]:
+        """Format stored records, outside the lock since records are replaced and never mutated
+        :param records: The (name, stored record) pairs
+        :return: The customer database strings
+        """
+
+        return [Database.format_customer(name, self.records.unpack(record)) for name, record in records]
+
+    def iter_report(self, start_after: str = None, limit: int = None, chunk: int = 1000, snapshot: Snapshot = None) -> Iterator[str]:
+        """Generate the report in chunks of lines from a point-in-time view, writers go on meanwhile
+        :param start_after: Only report customers whose name sorts after this one
+        :param limit: The maximum number of customers
+        :param chunk: The number of customers per chunk
+        :param snapshot: The view to report, None for one taken now and closed at the end
+        :return: An iterator over the report chunks
+        """
+
+        owned = snapshot is None
+        if owned:
+            snapshot = self.snapshot()
+
+        try:
+            remaining = limit
+            while remaining is None or remaining > 0:
+                # Seek past the previous chunk in O(log N)
+                records, start_after = snapshot.page(start_after, chunk if remaining is None else min(chunk, remaining))
+                if remaining is not None:
+                    records = records[:remaining]
+                    remaining -= len(records)
+
+                if records:
+                    yield "".join(line + "\n" for line in self.format_records(records))
+                if start_after is None:
+                    return
+        finally:
+            if owned:
+                snapshot.close()
+
+    def report_page(self, start_after: str = None, limit: int = 1000) -> Tuple[List[str], str]:
+        """Get one page of the report
+        :param start_after: Only report customers whose name sorts after this one
+        :param limit: The maximum number of customers
+        :return: The customer database strings and the cursor of the next page (None after the last page)
+        """
+
+        # Fetch one extra name to know whether a next page exists, the page is read at one point in time
+        with self.lock:
+            names = self.index.after(start_after, limit + 1)
+            page = self.read_records(names[:limit])
+
+        # Continue after the last name of a full page
+        cursor = names[limit - 1] if len(names) > limit else None
+        return self.format_records(page), cursor
+
+    def find_range(self, low: str = None, high: str = None, limit: int = None) -> List[str]:
+        """Get the customers whose names fall in a half-open range
+        :param low: The inclusive lower bound, None for unbounded
+        :param high: The exclusive upper bound, None for unbounded
+        :param limit: The maximum number of customers
+        :return: The customer database strings in name order
+        """
 
-        return False
+        with self.lock:
+            records = self.read_records(self.index.range(low, high, limit))
+
+        return self.format_records(records)
+
+    def find_prefix(self, prefix: str, limit: int = None) -> List[str]:
+        """Get the customers whose names start with a prefix
+        :param prefix: The name prefix
+        :param limit: The maximum number of customers
+        :return: The customer database strings in name order
+        """
+
+        with self.lock:
+            records = self.read_records(self.index.prefix(prefix, limit))
+
+        return self.format_records(records)
+
+    def find_by_age(self, low: int, high: int, limit: int = None) -> List[str]:
+        """Get the customers whose age falls in a range through the age index
+        :param low: The inclusive lowest age
+        :param high: The inclusive highest age
+        :param limit: The maximum number of customers
+        :return: The customer database strings ordered by age then name, None if age is not indexed
+        """
+
+        if self.ageIndex is None:
+            return None
+
+        # Names sort after "" so (age, "") bounds every customer of that age
+        with self.lock:
+            keys = self.ageIndex.range((low, ""), (high + 1, ""), limit)
+            records = self.read_records([name for _, name in keys])
+
+        return self.format_records(records)
+
+    def find_by_address(self, address: str, limit: int = None) -> List[str]:
+        """Get the customers at an address through the address index
+        :param address: The address
+        :param limit: The maximum number of customers
+        :return: The customer database strings in name order, None if address is not indexed
+        """
+
+        if self.addressIndex is None:
+            return None
+
+        with self.lock:
+            records = self.read_records(self.addressIndex.get(address, limit))
+
+        return self.format_records(records)
+
+    def find_by_phone(self, phone: str, limit: int = None) -> List[str]:
+        """Get the customers with a phone number through the phone index
+        :param phone: The phone number
+        :param limit: The maximum number of customers
+        :return: The customer database strings in name order, None if phone is not indexed
+        """
+
+        if self.phoneIndex is None:
+            return None
+
+        with self.lock:
+            records = self.read_records(self.phoneIndex.get(phone, limit))
+
+        return self.format_records(records)
 
     def report(self) -> str:
         """Generate a report of the database
         :return: The report
         """
 
-        # Generate the report
-        report = ""
-        keys = sorted(self.database.keys())
-
-        for key in keys:
-            report += Database.format_customer(key, self.database[key]) + "\n"
-
-        return report
+        # Join the chunks instead of growing one string
+        return "".join(self.iter_report())
 
     def update_file(self) -> None:
         """Update the database file"""
 
-        # Update the file
-        with open(self.fName, "w") as f:
-            f.write(self.report())
\ No newline at end of file
+        # Replace the file atomically
+        atomic_write(self.fName, self.iter_report())
+
+    def rotate_log(self) -> str:
+        """Start a new log, the caller must hold the lock
+        :return: The rotated log file
+        """
+
+        rotated = self.logName + ".1"
+
+        # Flush the open group commit into the old log, no other can start while the lock is held
+        committer = self.committer
+        if committer is not None:
+            committer.commit()
+
+        # Move the current log aside and reopen
+        self.log.close()
+        if os.path.exists(rotated):
+            # A failed compaction left its log behind, not in any snapshot yet: the next one covers both
+            with open(self.logName, "rb") as src, open(rotated, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.logName)
+        else:
+            os.replace(self.logName, rotated)
+        self.log = WriteAheadLog(self.logName, self.fsync, self.fsyncInterval)
+        self.dirty = 0
+
+        return rotated
+
+    def close(self) -> None:
+        """End the subscriptions, flush and close the mutation log or the storage backend"""
+
+        # Flush the last group commit
+        if self.committer is not None:
+            self.committer.close()
+            self.committer = None
+
+        self.changes.close()
+
+        if self.compactor is not None:
+            self.compactor.close()
+            self.compactor = None
+
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
\ No newline at end of file
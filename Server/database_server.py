@@ -1,14 +1,51 @@
 
 
+import io
 import os
-from typing import Tuple
+import time
+import threading
+import socket as sockets
+from typing import Callable, Tuple, Dict, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from .database import Database
+from .changes import ChangeFeed, Subscriber
+from .replication import Replicator
+from .metrics import MeteredStream
+from . import protocol, compression, admission
 from socket import socket
 from socketserver import BaseRequestHandler, TCPServer, BaseServer, StreamRequestHandler
 
 class DatabaseServer(TCPServer):
     """Database server object."""
 
+    # Allow quick restarts and bursts of connections
+    allow_reuse_address: bool = True
+    request_queue_size: int = 128
+
+    # Seconds a session may wait for its next command
+    idle_timeout: float = 60.0
+
+    # Seconds a request may take to arrive once started, and a write to be sent, None for no limit
+    read_timeout: float = 10.0
+    write_timeout: float = 30.0
+
+    # Longest request line (asyncio's default limit) and whole request in bytes
+    max_line: int = 65536
+    max_request: int = 64 * 1024 * 1024
+
+    # Connections open at once, in total and per client host, before new ones are closed right away
+    connections: admission.ConnectionLimit = None
+
+    # Seconds a request may wait for a worker before it is answered busy, None to wait
+    queue_timeout: float = None
+
+    # Per-client request rates, None for no limit
+    limiter: admission.RateLimiter = None
+
+    # Follows a primary when the server is a read-only replica
+    replica: Replicator = None
+
     @property
     def getpid(self) -> int:
         """Get the process ID of the server.
@@ -17,57 +54,462 @@ class DatabaseServer(TCPServer):
 
         return os.getpid()
 
-    def __init__(self, file: str, server_address: Tuple, handler: BaseRequestHandler, bind_and_activate: bool = True) -> None:
+    def __init__(self, file: str, server_address: Tuple, handler: BaseRequestHandler, bind_and_activate: bool = True, database_options: Dict = None, primary: Tuple = None, forward_writes: bool = False, reuse_port: bool = False) -> None:
         """Initialize the server
         :param file: The database file
         :param server_address: The server address
         :param handler: The request handler
         :param bind_and_activate: Whether to bind and activate the server
+        :param database_options: Keyword arguments for the database (backend, durability, fsync, ...)
+        :param primary: The (host, port) of the primary to replicate, None to serve as a primary
+        :param forward_writes: Whether a replica forwards writes to its primary rather than refusing them
+        :param reuse_port: Whether other processes may bind the same port, the kernel spreading connections
         """
 
         self.pid: int = os.getpid()
         self.file: str = file
-        self.database: Database = Database(file)
+        self.allow_reuse_port: bool = reuse_port
+        self.database: Database = Database(file, **(database_options or {}))
         TCPServer.__init__(self, server_address, handler, bind_and_activate)
 
-class DatabaseHandler(StreamRequestHandler):
-    """Database request handler."""
+        # Follow the primary
+        if primary is not None:
+            self.replica = Replicator(self.database, primary, forward_writes)
 
-    def __init__(self, request: socket, client_address: Tuple, server: BaseServer) -> None:
-        """Initialize the handler
+    def process_request(self, request: socket, client_address: Tuple) -> None:
+        """Serve a connection, closing it unless it was handed off to its own thread
         :param request: The request socket
         :param client_address: The client address
-        :param server: The server
         """
-    
-        self.server: BaseServer = server
-        self.database: Database = server.database
-        StreamRequestHandler.__init__(self, request, client_address, server)
+
+        if not self.finish_request(request, client_address):
+            self.shutdown_request(request)
+
+    def finish_request(self, request: socket, client_address: Tuple) -> bool:
+        """Serve a connection, handing the rest of a long-lived one off to its own thread
+        :param request: The request socket
+        :param client_address: The client address
+        :return: Whether the connection was handed off and stays open
+        """
+
+        handler = self.RequestHandlerClass(request, client_address, self)
+        if handler.detached is None:
+            return False
+
+        # Subscriptions last as long as their clients, they would hold the accepting thread or a worker
+        threading.Thread(target=self.serve_detached, args=(handler, request, client_address), name="DatabaseSubscriber", daemon=True).start()
+        return True
+
+    def serve_detached(self, handler: BaseRequestHandler, request: socket, client_address: Tuple) -> None:
+        """Serve a connection handed off by its handler, then close it
+        :param handler: The request handler
+        :param request: The request socket
+        :param client_address: The client address
+        """
+
+        try:
+            handler.serve_detached()
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.end_request(request, client_address)
+
+    def end_request(self, request: socket, client_address: Tuple) -> None:
+        """Close a served connection
+        :param request: The request socket
+        :param client_address: The client address
+        """
+
+        self.shutdown_request(request)
+
+    def waited(self, request: socket) -> float:
+        """Get the seconds a connection waited to be served
+        :param request: The request socket
+        :return: The seconds, none when connections are served one at a time
+        """
+
+        return 0.0
+
+    def server_close(self) -> None:
+        """Close the server socket, stop replicating and close the database"""
+
+        TCPServer.server_close(self)
+        if self.replica is not None:
+            self.replica.close()
+        self.database.close()
+
+class ThreadPoolMixIn:
+    """Mix-in class to handle each connection in a bounded pool of worker threads."""
+
+    # Maximum number of connections served at once
+    workers: int = 32
+    executor: ThreadPoolExecutor = None
+
+    # When the connections waiting for a worker arrived
+    queued: Dict[socket, float] = None
+    queueLock: threading.Lock = None
+
+    def process_request(self, request: socket, client_address: Tuple) -> None:
+        """Hand the connection to a worker thread, or close it when too many are open
+        :param request: The request socket
+        :param client_address: The client address
+        """
+
+        # Start the pool on first use
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="DatabaseWorker")
+            self.queued = {}
+            self.queueLock = threading.Lock()
+
+        # Fast rejection, reading the request would hold up the accepting thread
+        if self.connections is not None and not self.connections.open(client_address[0]):
+            self.database.metrics.count("rejected_connections")
+            self.shutdown_request(request)
+            return
+
+        with self.queueLock:
+            self.queued[request] = time.monotonic()
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request: socket, client_address: Tuple) -> None:
+        """Serve a connection in a worker thread
+        :param request: The request socket
+        :param client_address: The client address
+        """
+
+        detached = False
+        try:
+            detached = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self.queueLock:
+                self.queued.pop(request, None)
+
+            # A connection handed off to its own thread ends there
+            if not detached:
+                self.end_request(request, client_address)
+
+    def end_request(self, request: socket, client_address: Tuple) -> None:
+        """Close a served connection and count it out
+        :param request: The request socket
+        :param client_address: The client address
+        """
+
+        super().end_request(request, client_address)
+        if self.connections is not None:
+            self.connections.close(client_address[0])
+
+    def waited(self, request: socket) -> float:
+        """Get the seconds a connection waited for its worker
+        :param request: The request socket
+        :return: The seconds
+        """
+
+        with self.queueLock:
+            queued = self.queued.pop(request, None)
+
+        return 0.0 if queued is None else time.monotonic() - queued
+
+    def server_close(self) -> None:
+        """Wait for the running connections, then close the server"""
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        super().server_close()
+
+class ThreadPoolDatabaseServer(ThreadPoolMixIn, DatabaseServer):
+    """Database server handling connections in a bounded thread pool."""
+
+    def __init__(self, file: str, server_address: Tuple, handler: BaseRequestHandler, bind_and_activate: bool = True, database_options: Dict = None, workers: int = 32, primary: Tuple = None, forward_writes: bool = False, reuse_port: bool = False) -> None:
+        """Initialize the server
+        :param file: The database file
+        :param server_address: The server address
+        :param handler: The request handler
+        :param bind_and_activate: Whether to bind and activate the server
+        :param database_options: Keyword arguments for the database
+        :param workers: The number of worker threads
+        :param primary: The (host, port) of the primary to replicate, None to serve as a primary
+        :param forward_writes: Whether a replica forwards writes to its primary rather than refusing them
+        :param reuse_port: Whether other processes may bind the same port
+        """
+
+        self.workers = workers
+        DatabaseServer.__init__(self, file, server_address, handler, bind_and_activate, database_options, primary, forward_writes, reuse_port)
+
+class DatabaseCommands:
+    """Database commands shared by the request handlers."""
+
+    # Number of argument lines read by each command
+    commands: Dict[str, int] = {
+        "find_customer": 1,
+        "add_customer": 1,
+        "delete_customer": 1,
+        "update_age": 2,
+        "update_address": 2,
+        "update_phone": 2,
+        "print_report": 0,
+        "report_page": 2,
+        "find_range": 3,
+        "find_prefix": 2,
+        "find_by_age": 3,
+        "find_by_address": 2,
+        "find_by_phone": 2,
+        "get_pid": 0,
+        "replication": 0,
+        "stats": 0,
+    }
+
+    # Largest report page served at once
+    max_page: int = 10000
+
+    # Batch commands read a count line, then this many lines per item
+    batch_commands: Dict[str, int] = {
+        "find_many": 1,
+        "add_many": 1,
+        "delete_many": 1,
+        "update_many": 3,
+    }
+
+    # Commands refused by a replica
+    writes: set = {"add_customer", "delete_customer", "update_age", "update_address", "update_phone", "add_many", "delete_many", "update_many"}
+
+    # Session control requests
+    SESSION: str = "session"
+    END: str = "end"
+
+    # Turns the connection into a stream of change events
+    SUBSCRIBE: str = "subscribe"
+
+    # Seconds between heartbeats on an idle subscription
+    heartbeat: float = 5.0
+
+    # Set by the handler
+    server = None
+    database: Database = None
+
+    # Argument lines and response of a buffered command
+    pending: deque = None
+    buffer: List[str] = None
+
+    # Set once a read found the end of the arguments or of the stream
+    ended: bool = False
+
+    # Codec of the large responses, negotiated when the connection opens
+    codec: str = None
+
+    # Client host the request rate is limited by, and the bytes read of the current request
+    client: str = None
+    requestBytes: int = 0
+
+    # When the next command started waiting for a worker, None if it did not
+    queued: float = None
 
     def readline(self) -> str:
-        """Read a line from the client
+        """Read a buffered argument line
         :return: The line
         """
 
-        # Read the line
-        line: str = self.rfile.readline().decode()
+        if self.pending:
+            return self.pending.popleft()
 
-        # Strip the line
-        return line.strip()
+        self.ended = True
+        return ""
 
     def writeline(self, response: str) -> None:
-        """Write a line to the client
+        """Buffer a response line
         :param response: The text to write to the server response
         """
 
-        # Write the line
-        self.wfile.write((response + "\n").encode())
+        self.buffer.append(response + "\n")
 
-    def handle(self) -> None:
-        """Handles requests"""
+    def write(self, text: str) -> None:
+        """Buffer response text
+        :param text: The text to write to the server response
+        """
+
+        self.buffer.append(text)
+
+    def execute_lines(self, request_type: str, lines: List[str]) -> List[str]:
+        """Runs a command over argument lines that were already read
+        :param request_type: The command name
+        :param lines: The argument lines
+        :return: The response lines
+        """
+
+        self.pending, self.buffer = deque(lines), []
+        try:
+            self.dispatch(request_type)
+            return self.buffer
+        finally:
+            self.pending, self.buffer = None, None
+
+    def execute(self, request_type: str, lines: List[str]) -> str:
+        """Runs a command over argument lines that were already read
+        :param request_type: The command name
+        :param lines: The argument lines
+        :return: The response text
+        """
+
+        return "".join(self.execute_lines(request_type, lines))
+
+    def execute_frame(self, opcode: int, request_id: int, fields: List) -> bytes:
+        """Runs a binary request
+        :param opcode: The command opcode
+        :param request_id: The request ID
+        :param fields: The typed fields
+        :return: The response frame
+        """
+
+        command = protocol.COMMANDS.get(opcode)
+        if command is None:
+            return protocol.encode_frame(protocol.ERROR, request_id, ["Invalid request"])
+
+        # Fields must not hold the separators of the text lines and of the file, batches included
+        if not protocol.valid_fields(fields):
+            return protocol.encode_frame(protocol.ERROR, request_id, ["Invalid field"])
+
+        # Same semantics as the text command
+        response = self.execute_lines(command, protocol.text_lines(command, fields))
+
+        # Batches and pages answer with one field per line
+        if command in protocol.MULTI_FIELD:
+            return protocol.encode_frame(opcode, request_id, [line[:-1] for line in response], self.codec)
+
+        return protocol.encode_frame(opcode, request_id, ["".join(response)], self.codec)
+
+    def open_subscription(self, after: str, epoch: str) -> Subscriber:
+        """Subscribe to the change events
+        :param after: The version to resume after, empty for new events only
+        :param epoch: The epoch of that version
+        :return: The subscriber
+        """
+
+        try:
+            version = int(after) if after else None
+        except ValueError:
+            version = None
+
+        return self.database.changes.subscribe(version, epoch or None)
+
+    def subscription_events(self, subscriber: Subscriber, events: List[List]) -> Tuple[List[List], bool]:
+        """Complete the events taken from a subscriber with the control events
+        :param subscriber: The subscriber
+        :param events: The events taken
+        :return: The events to send and whether the subscription is over
+        """
+
+        changes = self.database.changes
+
+        # A subscriber that fell behind must resync
+        if subscriber.overflowed:
+            return events + [[changes.version, ChangeFeed.OVERFLOW]], True
+        if subscriber.closed:
+            return events, True
+
+        # Keep idle connections alive and the version known
+        return events or [[changes.version, ChangeFeed.HEARTBEAT]], False
+
+    def stream_events(self, subscriber: Subscriber, send: Callable[[List[List]], None]) -> None:
+        """Send change events until the subscription ends, a slow client fills its queue and gets dropped
+        :param subscriber: The subscriber
+        :param send: Writes events to the client
+        """
+
+        try:
+            # Acknowledge with the starting version
+            send([[subscriber.version, ChangeFeed.SUBSCRIBED, self.database.changes.epoch]])
+
+            done = False
+            while not done:
+                events, done = self.subscription_events(subscriber, subscriber.take(DatabaseCommands.heartbeat))
+                send(events)
+        finally:
+            self.database.changes.unsubscribe(subscriber)
 
-        # Read the request
-        request_type = self.readline()
+    @staticmethod
+    def refusal(mode: str, message: str) -> bytes:
+        """Encode the answer to a refused request in the protocol of the connection
+        :param mode: The first request line before any codecs
+        :param message: The reason
+        :return: The response
+        """
+
+        if mode == DatabaseCommands.SESSION:
+            return DatabaseCommands.frame([message + "\n"])
+        if mode == protocol.BINARY:
+            return protocol.encode_frame(protocol.ERROR, 0, [message])
+        if mode == compression.COMPRESS:
+            return (compression.NONE + "\n" + message + "\n").encode()
+        return (message + "\n").encode()
+
+    def admit(self) -> str:
+        """Check the next command against the deadline of its wait for a worker and the rate of its client
+        :return: The reason to refuse it, None to run it
+        """
+
+        server = self.server
+        queued, self.queued = self.queued, None
+
+        # Shed work that waited too long, its client has likely given up
+        if queued is not None and server.queue_timeout is not None and time.monotonic() - queued > server.queue_timeout:
+            self.database.metrics.count("shed_requests")
+            return admission.BUSY
+
+        if server.limiter is not None and not server.limiter.allow(self.client):
+            self.database.metrics.count("rate_limited")
+            return admission.RATE_LIMITED
+
+        return None
+
+    @staticmethod
+    def frame(chunks: List[str], codec: str = None) -> bytes:
+        """Frame a session response as its byte length on a line followed by the payload, then the codec if compressed
+        :param chunks: The response text, in chunks
+        :param codec: The negotiated codec compressing responses from the threshold, None for none
+        :return: The framed response
+        """
+
+        # Large responses are compressed chunk by chunk
+        if codec is not None and sum(len(chunk) for chunk in chunks) >= compression.THRESHOLD:
+            payload = compression.compress_chunks(codec, chunks)
+            return "{} {}\n".format(len(payload), codec).encode() + payload
+
+        payload = "".join(chunks).encode()
+        return str(len(payload)).encode() + b"\n" + payload
+
+    def dispatch(self, request_type: str) -> None:
+        """Runs a command, timing it
+        :param request_type: The command name
+        """
+
+        start = time.perf_counter()
+        try:
+            # Refused commands still consume their arguments
+            refusal = self.admit()
+            if refusal is not None:
+                self.read_arguments(request_type)
+                self.writeline(refusal)
+                return
+
+            self.run_command(request_type)
+        finally:
+            # Unknown commands share one series
+            known = request_type in DatabaseCommands.commands or request_type in DatabaseCommands.batch_commands
+            self.database.metrics.observe_command(request_type if known else "invalid", time.perf_counter() - start)
+
+    def run_command(self, request_type: str) -> None:
+        """Runs a command
+        :param request_type: The command name
+        """
+
+        # Replicas only serve reads, writes go to the primary or are refused
+        if self.server.replica is not None and request_type in DatabaseCommands.writes:
+            if self.server.replica.forward:
+                self.forward_write(request_type)
+            else:
+                self.read_only(request_type)
+            return
 
         # Action according to the request type
         if request_type == "find_customer":
@@ -84,8 +526,32 @@ class DatabaseHandler(StreamRequestHandler):
             self.update_phone()
         elif request_type == "print_report":
             self.print_report()
+        elif request_type == "report_page":
+            self.report_page()
+        elif request_type == "find_range":
+            self.find_range()
+        elif request_type == "find_prefix":
+            self.find_prefix()
+        elif request_type == "find_by_age":
+            self.find_by_age()
+        elif request_type == "find_by_address":
+            self.find_by_address()
+        elif request_type == "find_by_phone":
+            self.find_by_phone()
         elif request_type == "get_pid":
             self.get_pid()
+        elif request_type == "replication":
+            self.replication()
+        elif request_type == "stats":
+            self.stats()
+        elif request_type == "find_many":
+            self.find_many()
+        elif request_type == "add_many":
+            self.add_many()
+        elif request_type == "delete_many":
+            self.delete_many()
+        elif request_type == "update_many":
+            self.update_many()
         else:
             # Print an error message (should never happen)
             self.writeline("Invalid request")
@@ -197,11 +663,643 @@ class DatabaseHandler(StreamRequestHandler):
     def print_report(self) -> None:
         """Prints the report"""
 
-        # Print the report
-        self.writeline("\n"+ self.database.print_report())
+        # Stream the report chunk by chunk
+        self.write("\n")
+        for chunk in self.database.iter_report():
+            self.write(chunk)
+        self.write("\n")
+
+    def report_page(self) -> None:
+        """Prints one page of the report, the first line is the cursor of the next page (empty after the last page)"""
+
+        # Read the cursor, empty for the first page
+        start_after: str = self.readline() or None
+
+        # Read the page size
+        limit = self.read_limit()
+        if limit is None:
+            self.writeline("Invalid limit")
+            return
+
+        # Fetch the page
+        lines, cursor = self.database.report_page(start_after, limit)
+
+        # Write the cursor, then the customers
+        self.writeline(cursor or "")
+        for line in lines:
+            self.writeline(line)
+
+    def read_limit(self) -> int:
+        """Reads a result limit, capped at the page size
+        :return: The limit, None if invalid
+        """
+
+        try:
+            limit: int = int(self.readline())
+        except ValueError:
+            return None
+
+        return max(1, min(limit, DatabaseCommands.max_page))
+
+    def find_range(self) -> None:
+        """Finds the customers whose names fall in [low, high), one line per customer"""
+
+        # Read the bounds, empty for unbounded
+        low: str = self.readline() or None
+        high: str = self.readline() or None
+
+        # Read the limit
+        limit = self.read_limit()
+        if limit is None:
+            self.writeline("Invalid limit")
+            return
+
+        # Find the customers
+        for customer in self.database.find_range(low, high, limit):
+            self.writeline(customer)
+
+    def find_prefix(self) -> None:
+        """Finds the customers whose names start with a prefix, one line per customer"""
+
+        # Read the prefix
+        prefix: str = self.readline()
+
+        # Read the limit
+        limit = self.read_limit()
+        if limit is None:
+            self.writeline("Invalid limit")
+            return
+
+        # Find the customers
+        for customer in self.database.find_prefix(prefix, limit):
+            self.writeline(customer)
+
+    def write_indexed(self, customers: List[str]) -> None:
+        """Writes the result of a secondary index lookup, one line per customer
+        :param customers: The customer database strings, None if the field is not indexed
+        """
+
+        if customers is None:
+            self.writeline("Index not enabled")
+            return
+
+        for customer in customers:
+            self.writeline(customer)
+
+    def find_by_age(self) -> None:
+        """Finds the customers aged between two bounds, inclusive"""
+
+        try:
+            # Read the bounds
+            low: int = int(self.readline())
+            high: int = int(self.readline())
+        except ValueError:
+            self.writeline("Invalid age")
+            return
+
+        # Read the limit
+        limit = self.read_limit()
+        if limit is None:
+            self.writeline("Invalid limit")
+            return
+
+        # Find the customers
+        self.write_indexed(self.database.find_by_age(low, high, limit))
+
+    def find_by_address(self) -> None:
+        """Finds the customers at an address"""
+
+        # Read the address
+        address: str = self.readline()
+
+        # Read the limit
+        limit = self.read_limit()
+        if limit is None:
+            self.writeline("Invalid limit")
+            return
+
+        # Find the customers
+        self.write_indexed(self.database.find_by_address(address, limit))
+
+    def find_by_phone(self) -> None:
+        """Finds the customers with a phone number"""
+
+        # Read the phone number
+        phone: str = self.readline()
+
+        # Read the limit
+        limit = self.read_limit()
+        if limit is None:
+            self.writeline("Invalid limit")
+            return
+
+        # Find the customers
+        self.write_indexed(self.database.find_by_phone(phone, limit))
+
+    def read_batch(self, request_type: str) -> List[List[str]]:
+        """Reads the items of a batch command
+        :param request_type: The batch command name
+        :return: The argument lines of each item, None if the count is invalid
+        """
+
+        try:
+            # Read the item count
+            count: int = int(self.readline())
+        except ValueError:
+            return None
+
+        if count < 0:
+            return None
+
+        # Every item line takes at least its newline, so a count past the request limit cannot be honest
+        size = DatabaseCommands.batch_commands[request_type]
+        if count * size > self.server.max_request:
+            raise admission.RequestTooLarge(admission.TOO_LARGE)
+
+        # Read the lines of each item, stopping at the end of the stream
+        self.ended = False
+        items = []
+        for _ in range(count):
+            items.append([self.readline() for _ in range(size)])
+            if self.ended:
+                raise ConnectionError("Connection closed mid-request")
+
+        return items
+
+    def find_many(self) -> None:
+        """Finds several customers, one response line per customer"""
+
+        # Read the names
+        items = self.read_batch("find_many")
+        if items is None:
+            self.writeline("Invalid count")
+            return
+
+        # Find the customers
+        for customer in self.database.get_customers([item[0] for item in items]):
+            self.writeline("Customer not found" if customer is None else customer)
+
+    def add_many(self) -> None:
+        """Adds several customers with one flush, one response line per customer"""
+
+        # Read the lines
+        items = self.read_batch("add_many")
+        if items is None:
+            self.writeline("Invalid count")
+            return
+
+        # Parse the lines into customers
+        customers = [Database.process_line(item[0]) for item in items]
+        results = iter(self.database.add_customers([customer for customer in customers if customer is not None]))
+
+        # Write the responses
+        for customer in customers:
+            if customer is None:
+                self.writeline("Invalid customer")
+            elif next(results):
+                self.writeline("Customer added")
+            else:
+                self.writeline("Customer already exists")
+
+    def delete_many(self) -> None:
+        """Deletes several customers with one flush, one response line per customer"""
+
+        # Read the names
+        items = self.read_batch("delete_many")
+        if items is None:
+            self.writeline("Invalid count")
+            return
+
+        # Delete the customers
+        for deleted in self.database.delete_customers([item[0] for item in items]):
+            self.writeline("Customer deleted" if deleted else "Customer not found")
+
+    def update_many(self) -> None:
+        """Updates several customer fields with one flush, one response line per update"""
+
+        # Read the name, field and value of each update
+        items = self.read_batch("update_many")
+        if items is None:
+            self.writeline("Invalid count")
+            return
+
+        # Validate the updates
+        errors: List[str] = []
+        updates = []
+        for name, field, value in items:
+            if field not in Database.FIELDS:
+                errors.append("Invalid field")
+                continue
+            if field == "age":
+                try:
+                    value = int(value)
+                except ValueError:
+                    errors.append("Invalid age")
+                    continue
+            errors.append(None)
+            updates.append((name, field, value))
+
+        # Apply them
+        results = iter(self.database.update_customers(updates))
+
+        # Write the responses
+        for error in errors:
+            if error is not None:
+                self.writeline(error)
+            elif next(results):
+                self.writeline("Customer updated")
+            else:
+                self.writeline("Customer not found")
 
     def get_pid(self) -> None:
         """Gets the process ID of the server"""
 
         # Write the response
-        self.writeline(str(self.server.pid))
\ No newline at end of file
+        self.writeline(str(self.server.pid))
+
+    def replication(self) -> None:
+        """Gets the replication status as key=value pairs, including the lag of a replica"""
+
+        if self.server.replica is not None:
+            status = self.server.replica.status()
+        else:
+            status = {"role": "primary", "version": self.database.changes.version, "subscribers": len(self.database.changes.subscribers)}
+
+        # Write the response
+        self.writeline(" ".join("{}={}".format(key, value) for key, value in status.items()))
+
+    def stats(self) -> None:
+        """Gets the counters and latency summaries of the server, one group of key=value pairs per line"""
+
+        # Write the response
+        for line in self.database.metrics.stats():
+            self.writeline(line)
+
+    def read_arguments(self, request_type: str) -> List[str]:
+        """Reads the argument lines of a command without running it
+        :param request_type: The command name
+        :return: The argument lines
+        """
+
+        lines = [self.readline() for _ in range(DatabaseCommands.commands.get(request_type, 0))]
+
+        # Batches announce their item count first
+        if request_type in DatabaseCommands.batch_commands:
+            lines.append(self.readline())
+            try:
+                count = max(0, int(lines[-1]))
+            except ValueError:
+                count = 0
+
+            # Bounded as by read_batch
+            size = count * DatabaseCommands.batch_commands[request_type]
+            if size > self.server.max_request:
+                raise admission.RequestTooLarge(admission.TOO_LARGE)
+            self.ended = False
+            for _ in range(size):
+                lines.append(self.readline())
+                if self.ended:
+                    raise ConnectionError("Connection closed mid-request")
+
+        return lines
+
+    def read_only(self, request_type: str) -> None:
+        """Consumes the arguments of a write and refuses it
+        :param request_type: The write command name
+        """
+
+        self.read_arguments(request_type)
+
+        # Write the response
+        self.writeline("Read-only replica")
+
+    def forward_write(self, request_type: str) -> None:
+        """Runs a write on the primary, answering once this replica applied it
+        :param request_type: The write command name
+        """
+
+        lines = self.read_arguments(request_type)
+
+        try:
+            response = self.server.replica.forward_write(request_type, lines)
+        except OSError:
+            self.writeline("Primary unavailable")
+            return
+
+        # Write the primary's response, a line at a time for batch frames
+        for line in response.split("\n")[:-1]:
+            self.writeline(line)
+
+class DatabaseHandler(DatabaseCommands, StreamRequestHandler):
+    """Database request handler."""
+
+    # Streamed response: a compressed one-shot response, or the frames of a binary report
+    output: compression.ResponseCompressor = None
+
+    # Connection file reading within the deadlines, and the first request line before any codecs
+    stream: admission.DeadlineSocketIO = None
+    mode: str = None
+
+    # Seconds the connection waited for its worker
+    waitedSeconds: float = 0.0
+
+    # Serves the rest of a long-lived connection on its own thread once the handler returns
+    detached: Callable[[], None] = None
+
+    def __init__(self, request: socket, client_address: Tuple, server: BaseServer) -> None:
+        """Initialize the handler
+        :param request: The request socket
+        :param client_address: The client address
+        :param server: The server
+        """
+    
+        self.server: BaseServer = server
+        self.database: Database = server.database
+        StreamRequestHandler.__init__(self, request, client_address, server)
+
+    def setup(self) -> None:
+        """Open the connection files, reading and writing within deadlines and counting the bytes through them"""
+
+        StreamRequestHandler.setup(self)
+        self.database.metrics.connection_opened()
+        self.waitedSeconds = self.server.waited(self.request)
+        self.client = self.client_address[0] if isinstance(self.client_address, tuple) else str(self.client_address)
+
+        # Replace the socket files by ones bounding each wait
+        self.rfile.close()
+        self.stream = admission.DeadlineSocketIO(self.connection, self.server.write_timeout)
+        self.rfile = MeteredStream(io.BufferedReader(self.stream), self.database.metrics)
+        self.wfile = MeteredStream(self.stream, self.database.metrics)
+
+    def finish(self) -> None:
+        """Close the connection files, unless the connection was handed off"""
+
+        # Its thread closes them once done
+        if self.detached is not None:
+            return
+
+        try:
+            StreamRequestHandler.finish(self)
+        finally:
+            self.database.metrics.connection_closed()
+
+    def readline(self) -> str:
+        """Read a line from the client
+        :return: The line
+        """
+
+        # Read from a buffered command
+        if self.pending is not None:
+            return DatabaseCommands.readline(self)
+
+        # Read the line
+        line: str = self.receive().decode()
+
+        # Strip the line
+        return line.strip()
+
+    def receive(self) -> bytes:
+        """Read a request line within the size limits
+        :return: The line, empty at end of stream
+        """
+
+        # Read one byte past the longest line to tell it was cut
+        line = self.rfile.readline(self.server.max_line + 1)
+        self.requestBytes += len(line)
+        if not line:
+            self.ended = True
+        if len(line) > self.server.max_line or self.requestBytes > self.server.max_request:
+            raise admission.RequestTooLarge(admission.TOO_LARGE)
+
+        return line
+
+    def writeline(self, response: str) -> None:
+        """Write a line to the client
+        :param response: The text to write to the server response
+        """
+
+        # Write the line
+        self.write(response + "\n")
+
+    def write(self, text: str) -> None:
+        """Write text to the client
+        :param text: The text to write to the server response
+        """
+
+        # Collect the response of a session command
+        if self.buffer is not None:
+            DatabaseCommands.write(self, text)
+            return
+
+        # Write the text, through the codec of a compressed response
+        if self.output is not None:
+            self.output.write(text.encode())
+        else:
+            self.wfile.write(text.encode())
+
+    def handle(self) -> None:
+        """Handles requests"""
+
+        server = self.server
+        try:
+            # Read the request, sessions and compressed commands name the codecs the client accepts after it
+            self.stream.expect(server.read_timeout)
+            request_type = self.readline()
+            self.mode, _, offered = request_type.partition(" ")
+            self.codec = compression.negotiate(offered) if offered else None
+
+            # Turn away a connection that waited too long for its worker, its client has likely given up
+            if server.queue_timeout is not None and self.waitedSeconds > server.queue_timeout:
+                self.database.metrics.count("shed_requests")
+                self.refuse(admission.BUSY)
+                return
+
+            # Run it
+            if self.mode == DatabaseCommands.SESSION:
+                self.session()
+            elif self.mode == protocol.BINARY:
+                self.binary()
+            elif self.mode == compression.COMPRESS:
+                self.compressed()
+            elif request_type == DatabaseCommands.SUBSCRIBE:
+                self.subscribe()
+            else:
+                self.dispatch(request_type)
+        except admission.RequestTooLarge:
+            # The rest of the request cannot be told from the next one
+            self.database.metrics.count("oversized_requests")
+            self.refuse(admission.TOO_LARGE)
+        except sockets.timeout:
+            # Too slow to send its request or to read the response
+            self.database.metrics.count("timeouts")
+        except ConnectionError:
+            # Gone, possibly in the middle of a request
+            pass
+
+    def detach(self, serve: Callable[[], None]) -> None:
+        """Serve the rest of the connection on its own thread once the handler returns, freeing its worker
+        :param serve: Serves the connection to its end
+        """
+
+        self.detached = serve
+
+    def serve_detached(self) -> None:
+        """Serve the rest of a connection handed off, then close its files"""
+
+        serve, self.detached = self.detached, None
+        try:
+            serve()
+        finally:
+            self.finish()
+
+    def refuse(self, message: str) -> None:
+        """Answer a refused request, the connection closes after it
+        :param message: The reason
+        """
+
+        try:
+            self.wfile.write(DatabaseCommands.refusal(self.mode, message))
+        except OSError:
+            pass
+
+    def compressed(self) -> None:
+        """Runs the next command, streaming its response after a codec line"""
+
+        self.output = compression.ResponseCompressor(self.wfile.write, self.codec)
+        try:
+            self.dispatch(self.readline())
+            self.output.close()
+        finally:
+            self.output = None
+
+    def session(self) -> None:
+        """Serves framed commands on the connection until the client ends the session or goes idle"""
+
+        # Acknowledge the session and its codec
+        self.wfile.write(DatabaseCommands.frame(["OK {}\n".format(self.codec) if self.codec else "OK\n"]))
+
+        try:
+            while True:
+                # Read the next request, closing idle sessions
+                self.stream.expect(self.server.idle_timeout)
+                self.requestBytes = 0
+                line = self.receive()
+
+                # Stop at end of stream or on request
+                request_type = line.decode().strip()
+                if not line or request_type == DatabaseCommands.END:
+                    return
+
+                # Its arguments follow within the read deadline
+                self.stream.expect(self.server.read_timeout)
+
+                # The rest of the connection carries events
+                if request_type == DatabaseCommands.SUBSCRIBE:
+                    self.subscribe()
+                    return
+
+                # Run it and send the framed response
+                self.buffer = []
+                self.dispatch(request_type)
+                response, self.buffer = self.buffer, None
+                self.wfile.write(DatabaseCommands.frame(response, self.codec))
+        except sockets.timeout:
+            # Idle or too slow
+            self.database.metrics.count("timeouts")
+        except OSError:
+            # Gone
+            return
+
+    def binary(self) -> None:
+        """Serves binary frames on the connection until the client ends the session or goes idle"""
+
+        # Acknowledge the protocol version and the codec
+        self.wfile.write(protocol.encode_frame(protocol.HELLO, 0, ["OK", protocol.VERSION] + ([self.codec] if self.codec else [])))
+        reader = protocol.FrameReader(self.rfile.readinto, admit=self.start_frame)
+
+        try:
+            while True:
+                # Read the next frame, closing idle sessions
+                self.stream.expect(self.server.idle_timeout)
+                frame = reader.read()
+
+                # Stop at end of stream or on request
+                if frame is None or frame[0] == protocol.END:
+                    return
+
+                # The rest of the connection carries event frames
+                if frame[0] == protocol.SUBSCRIBE:
+                    self.subscribe_binary(frame[1], frame[2])
+                    return
+
+                # The report streams as frames, any other request answers with one
+                if frame[0] == protocol.OPCODES["print_report"]:
+                    self.stream_frames(*frame)
+                else:
+                    self.wfile.write(self.execute_frame(*frame))
+        except admission.RequestTooLarge:
+            raise
+        except sockets.timeout:
+            # Idle or too slow
+            self.database.metrics.count("timeouts")
+        except (OSError, ValueError):
+            # Gone or malformed
+            return
+
+    def stream_frames(self, opcode: int, request_id: int, fields: List) -> None:
+        """Runs a binary request, streaming its response as frames chunk by chunk
+        :param opcode: The command opcode
+        :param request_id: The request ID
+        :param fields: The typed fields
+        """
+
+        self.output = protocol.FrameStream(self.wfile.write, opcode, request_id, self.codec)
+        self.pending = deque(protocol.text_lines(protocol.COMMANDS[opcode], fields))
+        try:
+            self.dispatch(protocol.COMMANDS[opcode])
+            self.output.close()
+        finally:
+            self.output, self.pending = None, None
+
+    def start_frame(self, length: int) -> None:
+        """Admit a frame whose header was read, its payload follows within the read deadline
+        :param length: The payload length
+        """
+
+        if length > self.server.max_request:
+            raise admission.RequestTooLarge(admission.TOO_LARGE)
+        self.stream.expect(self.server.read_timeout)
+
+    def subscribe(self) -> None:
+        """Streams change events as JSON lines until the client disconnects or falls behind"""
+
+        # Read the resume point
+        subscriber = self.open_subscription(self.readline(), self.readline())
+        self.detach_events(subscriber, lambda events: self.wfile.write("".join(ChangeFeed.encode(event) for event in events).encode()))
+
+    def subscribe_binary(self, request_id: int, fields: List) -> None:
+        """Streams change events as frames until the client disconnects or falls behind
+        :param request_id: The request ID, echoed in every event frame
+        :param fields: The version to resume after and its epoch
+        """
+
+        # Read the resume point
+        after, epoch = (protocol.text_lines("subscribe", fields) + ["", ""])[:2]
+        subscriber = self.open_subscription(after, epoch)
+        self.detach_events(subscriber, lambda events: self.wfile.write(
+            b"".join(protocol.encode_frame(protocol.SUBSCRIBE, request_id, event) for event in events)))
+
+    def detach_events(self, subscriber: Subscriber, send: Callable[[List[List]], None]) -> None:
+        """Streams change events on the connection's own thread, a subscription would hold its worker as long as it lasts
+        :param subscriber: The subscriber
+        :param send: Writes events to the client
+        """
+
+        def serve() -> None:
+            try:
+                self.stream_events(subscriber, send)
+            except (sockets.timeout, OSError):
+                # Too slow or gone
+                return
+
+        self.detach(serve)
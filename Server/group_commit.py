@@ -0,0 +1,126 @@
+
+
+import time
+import threading
+from typing import Callable, List
+
+class Batch:
+    """Mutations flushed together, with the event their writers wait on."""
+
+    def __init__(self) -> None:
+        """Initialize an empty batch"""
+
+        self.records: List[List] = []
+        self.opened: float = time.monotonic()
+        self.done: threading.Event = threading.Event()
+        self.error: Exception = None
+
+class GroupCommitter:
+    """Coalesces the mutations of concurrent writers into one flush per batch.
+
+    Writers submit their records while holding the database lock, so batches keep the mutation order,
+    then wait for their batch outside the lock. A background thread flushes a batch once the commit
+    window since its first record has passed or once it holds the batch size, one batch at a time.
+    """
+
+    def __init__(self, flush: Callable[[List[List]], None], window: float = 2.0, batch_size: int = 1000) -> None:
+        """Start the committer
+        :param flush: Persists records with a single flush, called by one thread at a time
+        :param window: The milliseconds a batch collects mutations for, 0 to take what queued during the previous flush
+        :param batch_size: The records that flush a batch without waiting for the window
+        """
+
+        self.flush: Callable[[List[List]], None] = flush
+        self.window: float = window / 1000
+        self.batchSize: int = batch_size
+
+        # The batch being collected, guarded by the lock
+        self.lock: threading.Lock = threading.Lock()
+        self.wakeup: threading.Condition = threading.Condition(self.lock)
+        self.current: Batch = None
+        self.closed: bool = False
+
+        # One flush at a time, in batch order
+        self.commitLock: threading.Lock = threading.Lock()
+
+        self.thread: threading.Thread = threading.Thread(target=self.run, name="GroupCommit", daemon=True)
+        self.thread.start()
+
+    def submit(self, records: List[List]) -> Batch:
+        """Add records to the batch being collected, the caller must hold the database lock
+        :param records: The [op, *args] records
+        :return: The batch to wait for
+        """
+
+        with self.lock:
+            if self.closed:
+                raise ValueError("Group commit closed")
+
+            # Open a batch, the flusher starts its window
+            if self.current is None:
+                self.current = Batch()
+                self.wakeup.notify()
+
+            batch = self.current
+            batch.records.extend(records)
+            if len(batch.records) >= self.batchSize:
+                self.wakeup.notify()
+
+            return batch
+
+    def wait(self, batch: Batch) -> None:
+        """Wait until a batch is durable
+        :param batch: The batch
+        """
+
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def commit(self) -> None:
+        """Flush the batch being collected now"""
+
+        with self.commitLock:
+            with self.lock:
+                batch, self.current = self.current, None
+
+            if batch is None:
+                return
+
+            try:
+                self.flush(batch.records)
+            except Exception as e:
+                # Its writers see the failure, later batches still try
+                batch.error = e
+            finally:
+                batch.done.set()
+
+    def run(self) -> None:
+        """Flush batches as their window closes, until closed"""
+
+        while True:
+            with self.lock:
+                # Wait for a first record
+                while self.current is None and not self.closed:
+                    self.wakeup.wait()
+                if self.current is None:
+                    return
+
+                # Let the window fill, unless the batch is full
+                deadline = self.current.opened + self.window
+                while not self.closed and self.current is not None and len(self.current.records) < self.batchSize:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.wakeup.wait(remaining)
+
+            self.commit()
+
+    def close(self) -> None:
+        """Flush what is left and stop the flusher"""
+
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify()
+        self.thread.join()
+        self.commit()
@@ -0,0 +1,207 @@
+
+
+import bisect
+from typing import Dict, Iterable, Iterator, List
+
+class SortedIndex:
+    """Ordered set of keys kept in sorted blocks, so inserts and deletes only shift one block."""
+
+    # Target block size, blocks split at twice this size
+    load: int = 1000
+
+    def __init__(self, keys: Iterable = ()) -> None:
+        """Initialize the index
+        :param keys: The initial keys
+        """
+
+        ordered = sorted(set(keys))
+
+        # Blocks of sorted keys and the largest key of each block
+        self.blocks: List[List] = [ordered[i:i + self.load] for i in range(0, len(ordered), self.load)]
+        self.maxes: List = [block[-1] for block in self.blocks]
+        self.size: int = len(ordered)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, key) -> bool:
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return False
+
+        block = self.blocks[i]
+        j = bisect.bisect_left(block, key)
+        return j < len(block) and block[j] == key
+
+    def __iter__(self) -> Iterator:
+        for block in self.blocks:
+            yield from block
+
+    def add(self, key) -> None:
+        """Add a key
+        :param key: The key
+        """
+
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            self.size = 1
+            return
+
+        # Find the block, keys past the end go to the last one
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            i -= 1
+
+        block = self.blocks[i]
+        j = bisect.bisect_left(block, key)
+        if j < len(block) and block[j] == key:
+            return
+
+        block.insert(j, key)
+        self.maxes[i] = block[-1]
+        self.size += 1
+
+        # Split oversized blocks
+        if len(block) > 2 * self.load:
+            self.blocks.insert(i + 1, block[self.load:])
+            del block[self.load:]
+            self.maxes.insert(i, block[-1])
+
+    def discard(self, key) -> None:
+        """Remove a key if present
+        :param key: The key
+        """
+
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return
+
+        block = self.blocks[i]
+        j = bisect.bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            return
+
+        del block[j]
+        self.size -= 1
+
+        # Drop empty blocks
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+
+    def iter_from(self, key=None, inclusive: bool = True) -> Iterator:
+        """Iterate over the keys from a starting key
+        :param key: The starting key, None for the first key
+        :param inclusive: Whether to include the starting key itself
+        :return: An iterator over the keys in order
+        """
+
+        if key is None:
+            yield from self
+            return
+
+        # Seek to the first key in O(log N)
+        find = bisect.bisect_left if inclusive else bisect.bisect_right
+        i = find(self.maxes, key)
+        if i == len(self.maxes):
+            return
+
+        block = self.blocks[i]
+        yield from block[find(block, key):]
+
+        # Walk the following blocks in place, a limit stops the caller after k keys
+        for j in range(i + 1, len(self.blocks)):
+            yield from self.blocks[j]
+
+    def range(self, low=None, high=None, limit: int = None) -> List:
+        """Get the keys in a half-open range
+        :param low: The inclusive lower bound, None for unbounded
+        :param high: The exclusive upper bound, None for unbounded
+        :param limit: The maximum number of keys
+        :return: The keys in order
+        """
+
+        keys = []
+        for key in self.iter_from(low):
+            if (high is not None and key >= high) or (limit is not None and len(keys) >= limit):
+                break
+            keys.append(key)
+
+        return keys
+
+    def after(self, key=None, limit: int = None) -> List:
+        """Get the keys strictly after a key
+        :param key: The exclusive starting key, None for the first key
+        :param limit: The maximum number of keys
+        :return: The keys in order
+        """
+
+        keys = []
+        for k in self.iter_from(key, inclusive=False):
+            if limit is not None and len(keys) >= limit:
+                break
+            keys.append(k)
+
+        return keys
+
+    def prefix(self, prefix: str, limit: int = None) -> List[str]:
+        """Get the string keys starting with a prefix
+        :param prefix: The prefix
+        :param limit: The maximum number of keys
+        :return: The keys in order
+        """
+
+        keys = []
+        for key in self.iter_from(prefix):
+            if not key.startswith(prefix) or (limit is not None and len(keys) >= limit):
+                break
+            keys.append(key)
+
+        return keys
+
+class HashIndex:
+    """Maps a field value to the set of keys holding it."""
+
+    def __init__(self) -> None:
+        """Initialize the index"""
+
+        self.entries: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, value, key) -> None:
+        """Index a key under a value
+        :param value: The field value
+        :param key: The key
+        """
+
+        keys = self.entries.get(value)
+        if keys is None:
+            self.entries[value] = {key}
+        else:
+            keys.add(key)
+
+    def discard(self, value, key) -> None:
+        """Remove a key from a value
+        :param value: The field value
+        :param key: The key
+        """
+
+        keys = self.entries.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.entries[value]
+
+    def get(self, value, limit: int = None) -> List:
+        """Get the keys holding a value
+        :param value: The field value
+        :param limit: The maximum number of keys
+        :return: The keys in order
+        """
+
+        return sorted(self.entries.get(value, ()))[:limit]
@@ -0,0 +1,131 @@
+
+
+import os
+import mmap
+from typing import Dict, Iterator, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Files smaller than this are parsed in-process
+PARALLEL_THRESHOLD: int = 4 * 1024 * 1024
+
+def peak_rss() -> int:
+    """Get the peak resident set size of the process and its finished workers
+    :return: The peak RSS in bytes, 0 if unknown
+    """
+
+    if resource is None:
+        return 0
+
+    # Reported in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * 1024
+
+def split_chunks(file: str, parts: int) -> List[Tuple[int, int]]:
+    """Split a file into byte ranges that end on line boundaries
+    :param file: The file
+    :param parts: The number of ranges
+    :return: The (start, end) ranges
+    """
+
+    size = os.path.getsize(file)
+    if size == 0:
+        return []
+
+    chunks = []
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        for i in range(1, parts + 1):
+            if start >= size:
+                break
+
+            # Move the cut to the end of its line
+            end = size if i == parts else mm.find(b"\n", max(start, size * i // parts))
+            end = size if end == -1 else min(size, end + 1)
+            chunks.append((start, end))
+            start = end
+
+    return chunks
+
+def parse_lines(lines: Iterator[str], state: Dict) -> Iterator[List]:
+    """Parse database lines and check whether they are already in canonical form
+    :param lines: The lines, with their newlines
+    :param state: Receives "clean" and the "first" and "last" names once the lines are consumed
+    :return: An iterator over the customers
+    """
+
+    from .database import Database
+
+    clean = True
+    first = previous = None
+
+    for line in lines:
+        customer = Database.process_line(line)
+        if customer is None:
+            clean = False
+            continue
+
+        # A clean file is sorted, unique and formatted exactly as update_file() writes it
+        name = customer[0]
+        if clean and (not line.endswith("\n") or (previous is not None and name <= previous)
+                      or line[:-1] != Database.format_customer(name, customer[1:])):
+            clean = False
+        if first is None:
+            first = name
+        previous = name
+        yield customer
+
+    state.update(clean=clean, first=first, last=previous)
+
+def parse_chunk(file: str, start: int, end: int) -> Tuple[List[List], Dict]:
+    """Parse a byte range of a database file, run in a worker process
+    :param file: The database file
+    :param start: The first byte
+    :param end: The byte after the last
+    :return: The customers and the parse state of the range
+    """
+
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode()
+
+    state: Dict = {}
+    customers = list(parse_lines(iter(text.splitlines(keepends=True)), state))
+    return customers, state
+
+def load(file: str, workers: int = 1, state: Dict = None) -> Iterator[List]:
+    """Load the customers of a database file
+    :param file: The database file
+    :param workers: The number of parsing processes, 1 to stream the file in-process
+    :param state: Receives "clean", whether the file is already in canonical form, once the customers are consumed
+    :return: An iterator over the customers in file order
+    """
+
+    state = {} if state is None else state
+
+    # Stream small files line by line
+    if workers <= 1 or os.path.getsize(file) < PARALLEL_THRESHOLD:
+        with open(file) as f:
+            yield from parse_lines(f, state)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_chunk, file, start, end) for start, end in split_chunks(file, workers)]
+
+        # Merge in file order, checking the order across chunk boundaries
+        clean = True
+        previous = None
+        for future in futures:
+            customers, chunk = future.result()
+            if not chunk["clean"] or (previous is not None and chunk["first"] is not None and chunk["first"] <= previous):
+                clean = False
+            if chunk["last"] is not None:
+                previous = chunk["last"]
+            yield from customers
+
+        state["clean"] = clean
@@ -0,0 +1,457 @@
+
+
+import time
+import bisect
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class LatencyHistogram:
+    """Counts of durations in fixed buckets, as Prometheus histograms keep them."""
+
+    # Bucket upper bounds in seconds, the last bucket is unbounded
+    bounds: Tuple = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self) -> None:
+        """Initialize an empty histogram"""
+
+        self.counts: List[int] = [0] * (len(LatencyHistogram.bounds) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Record a duration, the caller must hold the metrics lock
+        :param seconds: The duration
+        """
+
+        self.counts[bisect.bisect_left(LatencyHistogram.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile from the buckets
+        :param q: The quantile (0 to 1)
+        :return: The upper bound of the bucket reaching it, at most the largest duration
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = max(1, q * self.count)
+        seen = 0
+        for bound, count in zip(LatencyHistogram.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+class Metrics:
+    """Counters and latency histograms of a server process, cheap enough to stay on."""
+
+    def __init__(self) -> None:
+        """Initialize the metrics"""
+
+        self.lock: threading.Lock = threading.Lock()
+        self.started: float = time.time()
+
+        # Latency of each command, and of the steps inside them
+        self.commands: Dict[str, LatencyHistogram] = {}
+        self.steps: Dict[str, LatencyHistogram] = {}
+
+        # Monotonic counters and the open connections, the stripe counters are kept by the lock and summed in when read
+        self.counters: Dict[str, int] = {"connections": 0, "bytes_in": 0, "bytes_out": 0, "lock_acquires": 0, "lock_contended": 0, "stripe_acquires": 0, "stripe_contended": 0,
+                                         "rejected_connections": 0, "shed_requests": 0, "rate_limited": 0, "oversized_requests": 0, "timeouts": 0}
+        self.activeConnections: int = 0
+
+        # Counters kept outside the lock by their owners, summed into the ones above when read
+        self.sources: List[Callable[[], Dict[str, int]]] = []
+
+    def observe_command(self, command: str, seconds: float) -> None:
+        """Record the duration of a command
+        :param command: The command name
+        :param seconds: The duration
+        """
+
+        with self.lock:
+            histogram = self.commands.get(command)
+            if histogram is None:
+                histogram = self.commands[command] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def observe(self, step: str, seconds: float) -> None:
+        """Record the duration of a step: persist, commit_wait, lock_wait, stripe_wait or write
+        :param step: The step name
+        :param seconds: The duration
+        """
+
+        with self.lock:
+            histogram = self.steps.get(step)
+            if histogram is None:
+                histogram = self.steps[step] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        """Add to a counter
+        :param counter: The counter name
+        :param amount: The amount
+        """
+
+        with self.lock:
+            self.counters[counter] += amount
+
+    def add_source(self, source: Callable[[], Dict[str, int]]) -> None:
+        """Add counters kept outside the metrics lock
+        :param source: Returns the current values of the counters
+        """
+
+        with self.lock:
+            self.sources.append(source)
+
+    def totals(self) -> Dict[str, int]:
+        """Get the counters, those of the sources included, the caller must hold the metrics lock
+        :return: The counters by name
+        """
+
+        totals = dict(self.counters)
+        for source in self.sources:
+            for counter, value in source().items():
+                totals[counter] = totals.get(counter, 0) + value
+
+        return totals
+
+    def connection_opened(self) -> None:
+        """Count a new connection"""
+
+        with self.lock:
+            self.counters["connections"] += 1
+            self.activeConnections += 1
+
+    def connection_closed(self) -> None:
+        """Count the end of a connection"""
+
+        with self.lock:
+            self.activeConnections -= 1
+
+    def stats(self) -> List[str]:
+        """Summarize the metrics for the stats command
+        :return: One line of key=value pairs per group
+        """
+
+        with self.lock:
+            lines = ["uptime={:.1f} active_connections={} {}".format(time.time() - self.started, self.activeConnections,
+                                                                    " ".join("{}={}".format(key, value) for key, value in self.totals().items()))]
+
+            # Commands, then the steps inside them
+            for kind, histograms in (("command", self.commands), ("step", self.steps)):
+                for name in sorted(histograms):
+                    histogram = histograms[name]
+                    lines.append("{}={} count={} mean_ms={:.3f} p50_ms={:.3f} p99_ms={:.3f} max_ms={:.3f}".format(
+                        kind, name, histogram.count, 1000 * histogram.sum / histogram.count, 1000 * histogram.quantile(0.5),
+                        1000 * histogram.quantile(0.99), 1000 * histogram.max))
+
+        return lines
+
+    def prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format
+        :return: The exposition
+        """
+
+        lines = []
+        with self.lock:
+            lines.append("# TYPE database_uptime_seconds gauge")
+            lines.append("database_uptime_seconds {:.3f}".format(time.time() - self.started))
+            lines.append("# TYPE database_active_connections gauge")
+            lines.append("database_active_connections {}".format(self.activeConnections))
+            for counter, value in self.totals().items():
+                lines.append("# TYPE database_{}_total counter".format(counter))
+                lines.append("database_{}_total {}".format(counter, value))
+
+            # One histogram family per kind, labelled by name
+            for family, label, histograms in (("database_command_seconds", "command", self.commands), ("database_step_seconds", "step", self.steps)):
+                lines.append("# TYPE {} histogram".format(family))
+                for name in sorted(histograms):
+                    histogram = histograms[name]
+                    cumulative = 0
+                    for bound, count in zip(LatencyHistogram.bounds + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(family, label, name, "+Inf" if bound == float("inf") else repr(bound), cumulative))
+                    lines.append('{}_sum{{{}="{}"}} {:.6f}'.format(family, label, name, histogram.sum))
+                    lines.append('{}_count{{{}="{}"}} {}'.format(family, label, name, histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+class StripedLock:
+    """Database lock with one stripe per name hash, metered.
+
+    Held whole (with lock:), it is reentrant and excludes everyone: cross-key operations such as batches,
+    scans, snapshots and compaction take it that way, by taking every stripe. A single-key writer takes only
+    the stripe of its name, so writers of unrelated customers share no lock and run in parallel. Waiting whole
+    holders go first, and a thread holding a stripe must not take the lock whole.
+    """
+
+    def __init__(self, metrics: Metrics, stripes: int = 64) -> None:
+        """Initialize the lock
+        :param metrics: The metrics to record into
+        :param stripes: The number of stripes, 0 for single-key writers to take the whole lock
+        """
+
+        self.metrics: Metrics = metrics
+        self.stripes: List[threading.Lock] = [threading.Lock() for _ in range(stripes)]
+
+        # Acquisitions of each stripe, counted under the stripe itself rather than the metrics lock
+        self.acquires: List[int] = [0] * stripes
+        self.contended: List[int] = [0] * stripes
+        metrics.add_source(self.counters)
+
+        # The whole holder and its depth, and the whole waiters single-key writers stand back for
+        self.whole: threading.Lock = threading.Lock()
+        self.owner: int = None
+        self.depth: int = 0
+        self.waiting: int = 0
+        self.state: threading.Condition = threading.Condition(threading.Lock())
+
+    def counters(self) -> Dict[str, int]:
+        """Sum the stripe counters
+        :return: The stripe_acquires and stripe_contended counters
+        """
+
+        return {"stripe_acquires": sum(self.acquires), "stripe_contended": sum(self.contended)}
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        """Acquire the whole lock
+        :param blocking: Whether to wait for it
+        :param timeout: The seconds to wait, -1 for no limit
+        :return: Whether the lock was acquired
+        """
+
+        # Reentrant
+        if self.owner == threading.get_ident():
+            self.depth += 1
+            self.metrics.count("lock_acquires")
+            return True
+
+        # Announce the wait so that new single-key writers stand back
+        start = time.perf_counter()
+        deadline = None if timeout < 0 else start + timeout
+        with self.state:
+            self.waiting += 1
+
+        taken: List[threading.Lock] = []
+        try:
+            # One whole holder at a time, then every stripe, waiting for its writers to leave
+            contended = False
+            for lock in [self.whole] + self.stripes:
+                if not lock.acquire(False):
+                    contended = True
+                    if not blocking or not lock.acquire(timeout=-1 if deadline is None else max(0.0, deadline - time.perf_counter())):
+                        for held in reversed(taken):
+                            held.release()
+                        return False
+                taken.append(lock)
+        finally:
+            with self.state:
+                self.waiting -= 1
+                if not self.waiting:
+                    self.state.notify_all()
+
+        self.owner = threading.get_ident()
+        self.depth = 1
+        self.metrics.count("lock_acquires")
+        if contended:
+            self.metrics.count("lock_contended")
+            self.metrics.observe("lock_wait", time.perf_counter() - start)
+        return True
+
+    def release(self) -> None:
+        """Release the whole lock"""
+
+        self.depth -= 1
+        if not self.depth:
+            self.owner = None
+            for stripe in reversed(self.stripes):
+                stripe.release()
+            self.whole.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+    @contextmanager
+    def stripe(self, key: str) -> Iterator[None]:
+        """Hold the stripe of a key for a single-key operation
+        :param key: The key, a customer name
+        """
+
+        # Already excluding everyone, or not striped
+        if self.owner == threading.get_ident() or not self.stripes:
+            with self:
+                yield
+            return
+
+        # Stand back while whole holders wait, checked without a lock as a stale read only costs fairness
+        if self.waiting:
+            start = time.perf_counter()
+            with self.state:
+                self.state.wait_for(lambda: not self.waiting)
+            self.metrics.observe("lock_wait", time.perf_counter() - start)
+
+        # Then the stripe, timing the waits on other writers of the stripe or on a whole holder
+        index = hash(key) % len(self.stripes)
+        stripe = self.stripes[index]
+        if stripe.acquire(False):
+            self.acquires[index] += 1
+        else:
+            start = time.perf_counter()
+            stripe.acquire()
+            self.acquires[index] += 1
+            self.contended[index] += 1
+            self.metrics.observe("stripe_wait", time.perf_counter() - start)
+
+        try:
+            yield
+        finally:
+            stripe.release()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answers GET /metrics with the Prometheus exposition of the server."""
+
+    def do_GET(self) -> None:
+        """Serve the metrics"""
+
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        """Keep scrapes out of the server output"""
+
+        pass
+
+def serve_metrics(metrics: Metrics, address: Tuple) -> ThreadingHTTPServer:
+    """Serve the metrics over HTTP in a background thread
+    :param metrics: The metrics
+    :param address: The (host, port) to listen on
+    :return: The HTTP server, shut it down to stop
+    """
+
+    server = ThreadingHTTPServer(address, MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="Metrics", daemon=True).start()
+    return server
+
+class MeteredStream:
+    """Connection file counting the bytes through it and timing the writes."""
+
+    def __init__(self, stream, metrics: Metrics) -> None:
+        """Wrap a connection file
+        :param stream: The file
+        :param metrics: The metrics to record into
+        """
+
+        self.stream = stream
+        self.metrics: Metrics = metrics
+
+    def readline(self, *args) -> bytes:
+        """Read a line, counting its bytes"""
+
+        line = self.stream.readline(*args)
+        self.metrics.count("bytes_in", len(line))
+        return line
+
+    def read(self, *args) -> bytes:
+        """Read bytes, counting them"""
+
+        data = self.stream.read(*args)
+        self.metrics.count("bytes_in", len(data))
+        return data
+
+    def readinto(self, view: memoryview) -> int:
+        """Read into a view, counting the bytes"""
+
+        count = self.stream.readinto(view)
+        self.metrics.count("bytes_in", count or 0)
+        return count
+
+    def write(self, data: bytes) -> int:
+        """Write bytes, counting and timing them"""
+
+        start = time.perf_counter()
+        written = self.stream.write(data)
+        self.metrics.observe("write", time.perf_counter() - start)
+        self.metrics.count("bytes_out", len(data))
+        return written
+
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
+
+class MeteredStreamReader:
+    """Asyncio stream reader counting the bytes read."""
+
+    def __init__(self, reader, metrics: Metrics) -> None:
+        """Wrap a stream reader
+        :param reader: The asyncio.StreamReader
+        :param metrics: The metrics to record into
+        """
+
+        self.reader = reader
+        self.metrics: Metrics = metrics
+
+    async def readline(self) -> bytes:
+        """Read a line, counting its bytes"""
+
+        line = await self.reader.readline()
+        self.metrics.count("bytes_in", len(line))
+        return line
+
+    async def readexactly(self, count: int) -> bytes:
+        """Read an exact number of bytes, counting them"""
+
+        data = await self.reader.readexactly(count)
+        self.metrics.count("bytes_in", count)
+        return data
+
+    def __getattr__(self, name: str):
+        return getattr(self.reader, name)
+
+class MeteredStreamWriter:
+    """Asyncio stream writer counting the bytes written and timing the drains."""
+
+    def __init__(self, writer, metrics: Metrics) -> None:
+        """Wrap a stream writer
+        :param writer: The asyncio.StreamWriter
+        :param metrics: The metrics to record into
+        """
+
+        self.writer = writer
+        self.metrics: Metrics = metrics
+
+    def write(self, data: bytes) -> None:
+        """Buffer bytes, counting them"""
+
+        self.writer.write(data)
+        self.metrics.count("bytes_out", len(data))
+
+    async def drain(self) -> None:
+        """Wait for the buffer to flush, timing it"""
+
+        start = time.perf_counter()
+        await self.writer.drain()
+        self.metrics.observe("write", time.perf_counter() - start)
+
+    def __getattr__(self, name: str):
+        return getattr(self.writer, name)
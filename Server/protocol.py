@@ -0,0 +1,318 @@
+
+
+import struct
+from typing import Callable, Dict, List, Tuple
+from . import compression
+
+# Negotiation line sent by binary clients in place of a text command
+BINARY: str = "binary"
+VERSION: int = 1
+
+# Frame header: payload length, opcode, request ID
+HEADER: struct.Struct = struct.Struct("!IBI")
+
+# Field tags and layouts
+FIELD_INT: int = 1
+FIELD_STR: int = 2
+TAG: struct.Struct = struct.Struct("!B")
+INT: struct.Struct = struct.Struct("!q")
+LENGTH: struct.Struct = struct.Struct("!I")
+
+# Opcodes
+HELLO: int = 0
+END: int = 9
+# Turns the connection into a stream of change event frames
+SUBSCRIBE: int = 20
+# Response whose payload is the opcode byte then the fields compressed with the negotiated codec
+COMPRESSED: int = 23
+# Part of a streamed response: raw text, or the next piece of one compressed stream with the negotiated codec.
+# The stream ends with a frame of the request opcode and no fields
+STREAM: int = 24
+ERROR: int = 255
+OPCODES: Dict[str, int] = {
+    "find_customer": 1,
+    "add_customer": 2,
+    "delete_customer": 3,
+    "update_age": 4,
+    "update_address": 5,
+    "update_phone": 6,
+    "print_report": 7,
+    "get_pid": 8,
+    "find_many": 10,
+    "add_many": 11,
+    "delete_many": 12,
+    "update_many": 13,
+    "report_page": 14,
+    "find_range": 15,
+    "find_prefix": 16,
+    "find_by_age": 17,
+    "find_by_address": 18,
+    "find_by_phone": 19,
+    "replication": 21,
+    "stats": 22,
+}
+COMMANDS: Dict[int, str] = {opcode: command for command, opcode in OPCODES.items()}
+
+# Fields per item of the batch commands
+BATCH_FIELDS: Dict[str, int] = {"find_many": 1, "add_many": 4, "delete_many": 1, "update_many": 3}
+
+# Commands answering with one field per response line
+MULTI_FIELD: set = set(BATCH_FIELDS) | {"report_page", "find_range", "find_prefix", "find_by_age", "find_by_address", "find_by_phone"}
+
+def encode_fields(fields: List) -> bytes:
+    """Encode typed fields
+    :param fields: The int and str fields
+    :return: The encoded fields
+    """
+
+    parts = []
+    for field in fields:
+        if isinstance(field, int):
+            parts.append(TAG.pack(FIELD_INT) + INT.pack(field))
+        else:
+            data = str(field).encode()
+            parts.append(TAG.pack(FIELD_STR) + LENGTH.pack(len(data)) + data)
+
+    return b"".join(parts)
+
+def check_length(view: memoryview, offset: int, size: int) -> None:
+    """Check that a payload holds the bytes of a field
+    :param view: The payload
+    :param offset: The start of the field
+    :param size: The bytes of the field
+    """
+
+    if offset + size > len(view):
+        raise ValueError("Truncated field")
+
+def decode_fields(view: memoryview) -> List:
+    """Decode typed fields without copying the payload
+    :param view: The payload
+    :return: The int and str fields
+    """
+
+    fields = []
+    offset = 0
+    while offset < len(view):
+        tag = view[offset]
+        offset += TAG.size
+
+        if tag == FIELD_INT:
+            check_length(view, offset, INT.size)
+            fields.append(INT.unpack_from(view, offset)[0])
+            offset += INT.size
+        elif tag == FIELD_STR:
+            check_length(view, offset, LENGTH.size)
+            length = LENGTH.unpack_from(view, offset)[0]
+            offset += LENGTH.size
+            check_length(view, offset, length)
+            fields.append(str(view[offset:offset + length], "utf-8"))
+            offset += length
+        else:
+            raise ValueError("Invalid field tag: {}".format(tag))
+
+    return fields
+
+def encode_frame(opcode: int, request_id: int, fields: List, codec: str = None) -> bytes:
+    """Encode a frame
+    :param opcode: The opcode
+    :param request_id: The request ID, echoed in the response
+    :param fields: The typed fields
+    :param codec: The negotiated codec compressing payloads from the threshold, None for none
+    :return: The frame
+    """
+
+    payload = encode_fields(fields)
+
+    # Large responses travel compressed
+    if codec is not None and len(payload) >= compression.THRESHOLD:
+        payload = bytes((opcode,)) + compression.compress(codec, payload)
+        opcode = COMPRESSED
+
+    return HEADER.pack(len(payload), opcode, request_id) + payload
+
+def decode_payload(opcode: int, view: memoryview, codec: str = None) -> Tuple[int, List]:
+    """Decode the payload of a frame
+    :param opcode: The frame opcode
+    :param view: The payload
+    :param codec: The negotiated codec
+    :return: The opcode of the response and its fields
+    """
+
+    if opcode == COMPRESSED:
+        if codec is None:
+            raise ValueError("Compressed frame without a negotiated codec")
+        return view[0], decode_fields(memoryview(compression.decompress(codec, view[1:])))
+
+    # Copied out of the reusable buffer
+    if opcode == STREAM:
+        return opcode, [bytes(view)]
+
+    return opcode, decode_fields(view)
+
+def valid_fields(fields: List) -> bool:
+    """Check that typed fields can travel as text lines and be stored as customer fields
+    :param fields: The typed fields
+    :return: False if a str field holds a newline or a pipe, which would split it across lines or fields
+    """
+
+    return not any(isinstance(field, str) and ("\n" in field or "|" in field) for field in fields)
+
+def text_lines(command: str, fields: List) -> List[str]:
+    """Convert the typed fields of a command into its text argument lines
+    :param command: The command name
+    :param fields: The typed fields
+    :return: The argument lines
+    """
+
+    # A customer travels as one pipe-delimited line
+    if command == "add_customer":
+        return ["|".join(str(field) for field in fields)]
+
+    # Batches start with their item count
+    if command in BATCH_FIELDS:
+        size = BATCH_FIELDS[command]
+        items = [fields[i:i + size] for i in range(0, len(fields), size)]
+        if command == "add_many":
+            return [str(len(items))] + ["|".join(str(field) for field in item) for item in items]
+        return [str(len(items))] + [str(field) for item in items for field in item]
+
+    return [str(field) for field in fields]
+
+def response_text(opcode: int, fields: List) -> str:
+    """Convert the fields of a response frame into the response of the text protocol
+    :param opcode: The response opcode
+    :param fields: The response fields
+    :return: The response text
+    """
+
+    # Batches and pages answer with one field per line
+    if COMMANDS.get(opcode) in MULTI_FIELD:
+        return "".join(str(field) + "\n" for field in fields)
+    return str(fields[0]) if fields else ""
+
+class FrameStream:
+    """Streams a response as STREAM frames of its request, then the frame ending it.
+
+    With a codec the whole response is one compressed stream cut across the frames, each write compressed
+    as it comes, so a report is never joined or compressed as one string.
+    """
+
+    def __init__(self, write: Callable[[bytes], None], opcode: int, request_id: int, codec: str = None) -> None:
+        """Initialize the response
+        :param write: Sends bytes to the client
+        :param opcode: The opcode of the request, ending the stream
+        :param request_id: The request ID, echoed in every frame
+        :param codec: The negotiated codec, None to send the text as is
+        """
+
+        self.send: Callable[[bytes], None] = write
+        self.opcode: int = opcode
+        self.requestId: int = request_id
+        self.compressor = compression.CODECS[codec].compressor() if codec is not None else None
+
+    def write(self, data: bytes) -> None:
+        """Write part of the response
+        :param data: The bytes
+        """
+
+        # The codec may hold small writes back
+        self.write_frame(self.compressor.compress(data) if self.compressor is not None else data)
+
+    def close(self) -> None:
+        """End the response"""
+
+        if self.compressor is not None:
+            self.write_frame(self.compressor.flush())
+            self.compressor = None
+        self.send(encode_frame(self.opcode, self.requestId, []))
+
+    def write_frame(self, data: bytes) -> None:
+        """Send the next STREAM frame, unless there is nothing to send
+        :param data: The payload, already compressed with a codec
+        """
+
+        if data:
+            self.send(HEADER.pack(len(data), STREAM, self.requestId) + data)
+
+class StreamedResponse:
+    """Gathers the STREAM frames of a response."""
+
+    def __init__(self, codec: str = None) -> None:
+        """Initialize the response
+        :param codec: The negotiated codec of the connection, None for none
+        """
+
+        self.decompressor = compression.CODECS[codec].decompressor() if codec is not None else None
+        self.parts: List[bytes] = []
+
+    def add(self, data: bytes) -> None:
+        """Add the payload of the next frame
+        :param data: The payload
+        """
+
+        self.parts.append(self.decompressor.decompress(data) if self.decompressor is not None else data)
+
+    def text(self) -> str:
+        """Get the response text, once the frame ending it was read
+        :return: The text
+        """
+
+        return b"".join(self.parts).decode()
+
+class FrameReader:
+    """Reads frames into a reusable buffer."""
+
+    def __init__(self, readinto: Callable[[memoryview], int], codec: str = None, admit: Callable[[int], None] = None) -> None:
+        """Initialize the reader
+        :param readinto: Fills a memoryview from the stream, returns the byte count (0 at end of stream)
+        :param codec: The negotiated codec of compressed frames, set once the server acknowledged it
+        :param admit: Called with the payload length once a header is read, raises to refuse the frame
+        """
+
+        self.readinto: Callable[[memoryview], int] = readinto
+        self.codec: str = codec
+        self.admit: Callable[[int], None] = admit
+        self.header: bytearray = bytearray(HEADER.size)
+        self.buffer: bytearray = bytearray(4096)
+
+    def fill(self, view: memoryview) -> bool:
+        """Fill a view completely
+        :param view: The view to fill
+        :return: True if filled, False at end of stream before the first byte
+        """
+
+        got = 0
+        while got < len(view):
+            count = self.readinto(view[got:])
+            if not count:
+                if got == 0:
+                    return False
+                raise ConnectionError("Connection closed mid-frame")
+            got += count
+
+        return True
+
+    def read(self) -> Tuple[int, int, List]:
+        """Read the next frame
+        :return: The opcode, the request ID and the fields, or None at end of stream
+        """
+
+        # Read the header
+        if not self.fill(memoryview(self.header)):
+            return None
+        length, opcode, request_id = HEADER.unpack(self.header)
+        if self.admit is not None:
+            self.admit(length)
+
+        # Grow the buffer for large payloads
+        if length > len(self.buffer):
+            self.buffer = bytearray(max(length, 2 * len(self.buffer)))
+
+        # Read and decode the payload in place
+        view = memoryview(self.buffer)[:length]
+        if length and not self.fill(view):
+            raise ConnectionError("Connection closed mid-frame")
+
+        opcode, fields = decode_payload(opcode, view, self.codec)
+        return opcode, request_id, fields
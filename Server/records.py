@@ -0,0 +1,78 @@
+
+
+from typing import Dict, List, Sequence
+
+class ListRecords:
+    """Stores each record as a [age, address, phone] list (the original layout)."""
+
+    @staticmethod
+    def pack(record: Sequence) -> List:
+        """Convert a record into its stored form
+        :param record: The [age, address, phone] record
+        :return: The stored record
+        """
+
+        return list(record)
+
+    @staticmethod
+    def unpack(stored) -> Sequence:
+        """Convert a stored record back into a record
+        :param stored: The stored record
+        :return: The [age, address, phone] record, not to be mutated
+        """
+
+        return stored
+
+class TupleRecords:
+    """Stores each record as an (age, address, phone) tuple, no over-allocation and a smaller header than a list."""
+
+    @staticmethod
+    def pack(record: Sequence) -> tuple:
+        """Convert a record into its stored form
+        :param record: The [age, address, phone] record
+        :return: The stored record
+        """
+
+        return tuple(record)
+
+    @staticmethod
+    def unpack(stored) -> Sequence:
+        """Convert a stored record back into a record
+        :param stored: The stored record
+        :return: The (age, address, phone) record
+        """
+
+        return stored
+
+class PackedRecords:
+    """Stores each record as one string "age\\0address length\\0address phone", a single object per customer."""
+
+    @staticmethod
+    def pack(record: Sequence) -> str:
+        """Convert a record into its stored form
+        :param record: The [age, address, phone] record
+        :return: The stored record
+        """
+
+        address = str(record[1])
+        return "{}\0{}\0{}{}".format(record[0], len(address), address, record[2])
+
+    @staticmethod
+    def unpack(stored: str) -> Sequence:
+        """Convert a stored record back into a record
+        :param stored: The stored record
+        :return: The [age, address, phone] record
+        """
+
+        # The address length makes any character safe inside the fields
+        first = stored.index("\0")
+        second = stored.index("\0", first + 1)
+        end = second + 1 + int(stored[first + 1:second])
+        return [int(stored[:first]), stored[second + 1:end], stored[end:]]
+
+# Storage engines by name
+ENGINES: Dict[str, type] = {
+    "list": ListRecords,
+    "tuple": TupleRecords,
+    "packed": PackedRecords,
+}
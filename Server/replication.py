@@ -0,0 +1,253 @@
+
+
+import json
+import time
+import socket
+import threading
+from typing import Dict, List, Tuple
+from .database import Database
+from .changes import ChangeFeed
+from .wal import WriteAheadLog
+
+class Replicator:
+    """Keeps a database a read-only copy of a primary server: snapshot, then tail the change events.
+
+    With forwarding, writes are sent on to the primary and acknowledged once the replica applied them:
+    every write is ordered by the primary, each replica applies a prefix of that same history, and a
+    connection reads its own writes and never goes back in time. Connections on different replicas
+    may see a write at different moments, within the replication lag.
+    """
+
+    # Seconds between reconnection attempts
+    retry: float = 1.0
+    # Customers per snapshot page
+    page_size: int = 10000
+    # Seconds without any event, heartbeats included, before the primary is considered gone
+    timeout: float = 15.0
+
+    def __init__(self, database: Database, primary: Tuple, forward: bool = False) -> None:
+        """Start following the primary
+        :param database: The replica database
+        :param primary: The (host, port) address of the primary
+        :param forward: Whether writes are forwarded to the primary rather than refused
+        """
+
+        self.database: Database = database
+        self.primary: Tuple = primary
+        self.forward: bool = forward
+
+        # One primary session per thread forwarding writes
+        self.sessions: threading.local = threading.local()
+        self.applied: threading.Condition = threading.Condition()
+
+        # Replication progress in primary versions
+        self.state: str = "connecting"
+        self.epoch: str = None
+        self.version: int = 0
+        self.primaryVersion: int = 0
+        self.caughtUp: float = time.monotonic()
+        self.resyncs: int = 0
+        self.closed: bool = False
+        self.sock: socket.socket = None
+
+        self.thread: threading.Thread = threading.Thread(target=self.run, name="Replicator", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        """Follow the primary, reconnecting until closed"""
+
+        while not self.closed:
+            try:
+                self.follow()
+            except (OSError, ValueError):
+                # Primary gone or stream cut
+                pass
+
+            if not self.closed:
+                self.state = "disconnected"
+                time.sleep(Replicator.retry)
+
+    def follow(self) -> None:
+        """Subscribe to the primary and apply its events, taking a snapshot first unless resuming"""
+
+        with socket.create_connection(self.primary, timeout=Replicator.timeout) as sock:
+            self.sock = sock
+            stream = sock.makefile("rb")
+
+            # Resume after the applied version, or start over
+            resume = self.epoch is not None
+            sock.sendall("subscribe\n{}\n{}\n".format(self.version if resume else "", self.epoch or "").encode())
+            ack = json.loads(stream.readline())
+
+            if not resume:
+                # The events after the acknowledged version complete the snapshot
+                self.state = "snapshot"
+                self.snapshot()
+                with self.applied:
+                    self.epoch, self.version = ack[2], ack[0]
+                    self.primaryVersion = self.version
+                    self.applied.notify_all()
+
+            self.state = "streaming"
+            for line in stream:
+                event = json.loads(line)
+                version, op = event[0], event[1]
+
+                # Missed events, start over
+                if op == ChangeFeed.OVERFLOW:
+                    self.epoch = None
+                    return
+
+                self.primaryVersion = max(self.primaryVersion, version)
+                if op not in (ChangeFeed.HEARTBEAT, ChangeFeed.SUBSCRIBED) and version > self.version:
+                    self.apply(op, event[2:])
+                    with self.applied:
+                        self.version = version
+                        self.applied.notify_all()
+
+                if self.version >= self.primaryVersion:
+                    self.caughtUp = time.monotonic()
+
+    def snapshot(self) -> None:
+        """Replace the database with the primary's report, a page at a time over a session"""
+
+        database = self.database
+        self.resyncs += 1
+
+        # Subscribers of the replica must resync as well
+        database.changes.reset()
+
+        with socket.create_connection(self.primary, timeout=Replicator.timeout) as sock:
+            stream = sock.makefile("rb")
+            sock.sendall(b"session\n")
+            Replicator.read_frame(stream)
+
+            # Drop what the replica held
+            with database.lock:
+                for name in list(database.index):
+                    database.delete_customer(name, False)
+
+            cursor = ""
+            while True:
+                sock.sendall("report_page\n{}\n{}\n".format(cursor, Replicator.page_size).encode())
+                lines = Replicator.read_frame(stream).split("\n")[:-1]
+
+                # The first line is the next cursor
+                with database.lock:
+                    for line in lines[1:]:
+                        customer = Database.process_line(line)
+                        if customer is not None:
+                            database.add_customer(customer, False)
+
+                cursor = lines[0] if lines else ""
+                if not cursor:
+                    break
+
+            sock.sendall(b"end\n")
+
+    @staticmethod
+    def read_frame(stream) -> str:
+        """Read a framed session response
+        :param stream: The connection file
+        :return: The payload
+        """
+
+        header = stream.readline()
+        if not header:
+            raise ConnectionError("Connection closed by primary")
+        return stream.read(int(header)).decode()
+
+    def apply(self, op: str, args: List) -> None:
+        """Apply a change event of the primary, events set state so replaying one is harmless
+        :param op: The mutation code
+        :param args: The mutation arguments
+        """
+
+        database = self.database
+
+        with database.lock:
+            if op == WriteAheadLog.ADD:
+                # An add carries the whole customer
+                database.delete_customer(args[0], False)
+                database.add_customer(list(args), False)
+            elif op == WriteAheadLog.DELETE:
+                database.delete_customer(args[0], False)
+            elif op == WriteAheadLog.AGE:
+                database.update_age(args[0], args[1], False)
+            elif op == WriteAheadLog.ADDRESS:
+                database.update_address(args[0], args[1], False)
+            elif op == WriteAheadLog.PHONE:
+                database.update_phone(args[0], args[1], False)
+
+            # Chain the event to the replica's own subscribers
+            database.changes.publish([[op] + list(args)])
+
+    def forward_write(self, request_type: str, lines: List[str]) -> str:
+        """Run a write on the primary, then wait until the replica applied it
+        :param request_type: The write command name
+        :param lines: The argument lines
+        :return: The response of the primary
+        """
+
+        # Reuse the session of this thread
+        session = getattr(self.sessions, "session", None)
+        if session is None:
+            sock = socket.create_connection(self.primary, timeout=Replicator.timeout)
+            session = self.sessions.session = (sock, sock.makefile("rb"))
+            sock.sendall(b"session\n")
+            Replicator.read_frame(session[1])
+
+        sock, stream = session
+        try:
+            # The write, then the primary version that includes it
+            sock.sendall("".join(line + "\n" for line in [request_type] + lines + ["replication"]).encode())
+            response = Replicator.read_frame(stream)
+            status = dict(pair.split("=", 1) for pair in Replicator.read_frame(stream).split())
+        except (OSError, ValueError):
+            self.sessions.session = None
+            sock.close()
+            raise ConnectionError("Lost the primary session")
+
+        self.wait(int(status["version"]))
+        return response
+
+    def wait(self, version: int, timeout: float = None) -> bool:
+        """Wait until the replica applied a primary version
+        :param version: The primary version
+        :param timeout: The seconds to wait, the replication timeout by default
+        :return: Whether the version was applied
+        """
+
+        with self.applied:
+            return self.applied.wait_for(lambda: self.version >= version or self.closed, Replicator.timeout if timeout is None else timeout)
+
+    def status(self) -> Dict:
+        """Get the replication progress
+        :return: The state, the applied and known primary versions and the lag in events and seconds
+        """
+
+        lag = max(0, self.primaryVersion - self.version)
+        return {
+            "role": "replica",
+            "primary": "{}:{}".format(*self.primary),
+            "state": self.state,
+            "version": self.version,
+            "primary_version": self.primaryVersion,
+            "lag": lag,
+            "lag_seconds": round(time.monotonic() - self.caughtUp, 3) if lag else 0.0,
+            "resyncs": self.resyncs,
+            "writes": "forwarded" if self.forward else "refused",
+        }
+
+    def close(self) -> None:
+        """Stop following the primary"""
+
+        self.closed = True
+        with self.applied:
+            self.applied.notify_all()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.thread.join(Replicator.retry + 1)
@@ -0,0 +1,148 @@
+
+
+import os
+import bisect
+import hashlib
+from typing import Iterator, List
+from .database import Database
+
+class HashRing:
+    """Consistent hash ring mapping customer names to shards through virtual nodes."""
+
+    def __init__(self, shards: int, vnodes: int = 128) -> None:
+        """Initialize the ring
+        :param shards: The number of shards
+        :param vnodes: The points of each shard on the ring, more spreads names more evenly
+        """
+
+        points = sorted((HashRing.hash("{}#{}".format(shard, i)), shard) for shard in range(shards) for i in range(vnodes))
+
+        # Ring positions and the shard owning each
+        self.points: List[int] = [point for point, _ in points]
+        self.owners: List[int] = [shard for _, shard in points]
+        self.size: int = shards
+
+    @staticmethod
+    def hash(key: str) -> int:
+        """Hash a key to a ring position, the same in every process
+        :param key: The key
+        :return: The 64-bit position
+        """
+
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def shard(self, name: str) -> int:
+        """Get the shard owning a name
+        :param name: The customer name
+        :return: The shard index
+        """
+
+        # The first point clockwise from the name
+        i = bisect.bisect(self.points, HashRing.hash(name))
+        return self.owners[i % len(self.points)]
+
+def shard_file(file: str, index: int) -> str:
+    """Get the database file of a shard
+    :param file: The database file
+    :param index: The shard index
+    :return: The shard file
+    """
+
+    return "{}.shard{}".format(file, index)
+
+def layout_file(file: str) -> str:
+    """Get the file recording the layout the shard files were split for
+    :param file: The database file
+    :return: The layout file
+    """
+
+    return file + ".shards"
+
+def existing_shards(file: str) -> List[str]:
+    """Find the shard files left by an earlier split
+    :param file: The database file
+    :return: The shard files, from shard 0 up to the first missing one
+    """
+
+    files = []
+    while os.path.exists(shard_file(file, len(files))):
+        files.append(shard_file(file, len(files)))
+
+    return files
+
+def file_lines(file: str) -> Iterator[str]:
+    """Read the lines of a database file
+    :param file: The database file, possibly missing
+    :return: An iterator over its lines
+    """
+
+    if os.path.exists(file):
+        with open(file) as f:
+            yield from f
+
+def shard_lines(files: List[str]) -> Iterator[str]:
+    """Read the customers of shard files, with the writes still in their logs
+    :param files: The shard files
+    :return: An iterator over the customer lines
+    """
+
+    for file in files:
+        # Replay the log of a shard served with the log durability
+        durability = Database.WAL if os.path.exists(file + ".log") or os.path.exists(file + ".log.1") else Database.REWRITE
+        database = Database(file, durability)
+        try:
+            for chunk in database.iter_report():
+                yield from chunk.splitlines()
+        finally:
+            database.close()
+
+def split_file(file: str, shards: int, vnodes: int = 128) -> List[str]:
+    """Partition a database file into shard files, unless they already are for this layout.
+
+    Shard files split for another shard count or vnode count are repartitioned from their own
+    customers, logs included, since they hold the writes made after the first split.
+    :param file: The database file
+    :param shards: The number of shards
+    :param vnodes: The virtual nodes of each shard
+    :return: The shard files
+    """
+
+    files = [shard_file(file, i) for i in range(shards)]
+    layout = "{} {}\n".format(shards, vnodes)
+
+    # Reuse shard files split for the same ring
+    old = existing_shards(file)
+    if os.path.exists(layout_file(file)):
+        with open(layout_file(file)) as f:
+            if f.read() == layout and len(old) == shards:
+                return files
+    elif len(old) == shards and vnodes == 128:
+        # Split before the layout was recorded, always with the default vnodes
+        with open(layout_file(file), "w") as f:
+            f.write(layout)
+        return files
+
+    ring = HashRing(shards, vnodes)
+    outputs = [open(f + ".tmp", "w") for f in files]
+    try:
+        # Route each valid customer to its shard, from the old shards when there are any
+        for line in shard_lines(old) if old else file_lines(file):
+            customer = Database.process_line(line)
+            if customer is not None:
+                outputs[ring.shard(customer[0])].write(Database.format_customer(customer[0], customer[1:]) + "\n")
+    finally:
+        for output in outputs:
+            output.close()
+
+    # Swap in the new shards, then drop the old shards and logs they replace
+    for f in files:
+        os.replace(f + ".tmp", f)
+    for f in old:
+        for leftover in ([f] if f not in files else []) + [f + ".log", f + ".log.1"]:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    with open(layout_file(file), "w") as f:
+        f.write(layout)
+
+    return files
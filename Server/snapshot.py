@@ -0,0 +1,88 @@
+
+
+from typing import Dict, List, Tuple
+from .index import SortedIndex
+
+class Snapshot:
+    """Point-in-time view of the customers, kept by copying records on write.
+
+    Opening one costs nothing under the lock. While it is open, the first change to each customer saves
+    the record it replaces, or None for a customer that did not exist yet, so the view reads the saved
+    records over the live ones while writers go on. Closing it drops what was saved.
+    """
+
+    def __init__(self, database) -> None:
+        """Open a view of a database, the caller must hold its lock
+        :param database: The database
+        """
+
+        self.database = database
+
+        # Records replaced since the snapshot, None for customers added since
+        self.saved: Dict[str, object] = {}
+
+        # Saved names that existed at the snapshot, deleted ones are no longer in the database index
+        self.kept: SortedIndex = SortedIndex()
+
+    def preserve(self, name: str, record) -> None:
+        """Save a record about to change, the caller must hold the database index lock
+        :param name: The customer name
+        :param record: The stored record, None if the customer does not exist
+        """
+
+        # Only the first change matters to the view
+        if name not in self.saved:
+            self.saved[name] = record
+            if record is not None:
+                self.kept.add(name)
+
+    def page(self, start_after: str = None, limit: int = 1000) -> Tuple[List[Tuple[str, object]], str]:
+        """Read customers of the view in name order
+        :param start_after: Only read customers whose name sorts after this one
+        :param limit: The number of names to take from the database index and from the saved names
+        :return: The (name, stored record) pairs and the cursor of the next page (None after the last page)
+        """
+
+        database = self.database
+        with database.lock:
+            names = database.index.after(start_after, limit)
+            high = names[-1] if len(names) >= limit else None
+
+            # Merge the saved names up to the same point, the deleted ones are not in the index
+            if self.kept:
+                kept = []
+                for name in self.kept.iter_from(start_after, inclusive=False):
+                    if (high is not None and name > high) or len(kept) >= limit:
+                        break
+                    kept.append(name)
+
+                # Stop at the last name both lists are complete up to
+                if len(kept) >= limit:
+                    high = kept[-1]
+                    names = [name for name in names if name <= high]
+                names = sorted(set(names).union(kept))
+
+            # Saved records win over live ones, None hides customers added since
+            saved = self.saved
+            records = []
+            for name in names:
+                record = saved[name] if name in saved else database.database[name]
+                if record is not None:
+                    records.append((name, record))
+
+        return records, high
+
+    def close(self) -> None:
+        """Stop saving records for the view"""
+
+        with self.database.lock:
+            if self in self.database.snapshots:
+                self.database.snapshots.remove(self)
+            self.saved = {}
+            self.kept = SortedIndex()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,348 @@
+
+
+import os
+import mmap
+import zlib
+import struct
+import sqlite3
+import itertools
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Sequence
+from .records import PackedRecords
+from .wal import WriteAheadLog
+
+class StorageBackend:
+    """Persistence interface of the database, the flat text file is handled by the database itself."""
+
+    # Whether every record is loaded into memory
+    resident: bool = True
+
+    def open_table(self) -> MutableMapping:
+        """Get the table the database works on
+        :return: A mapping of customer name to [age, address, phone] record
+        """
+
+        return {}
+
+    def load(self) -> Iterator[List]:
+        """Read the stored customers to fill a resident table
+        :return: An iterator over [name, age, address, phone] customers
+        """
+
+        return iter(())
+
+    def apply(self, records: List[List]) -> None:
+        """Durably persist a batch of mutations
+        :param records: The [op, *args] mutations, with the write-ahead log codes
+        """
+
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release the backend"""
+
+class SQLiteBackend(StorageBackend):
+    """Stores customers in an SQLite table in WAL journal mode, the table is also kept in memory for reads."""
+
+    # Statements by mutation code, sqlite3 caches them once prepared
+    STATEMENTS: Dict[str, str] = {
+        WriteAheadLog.ADD: "INSERT OR REPLACE INTO customers (name, age, address, phone) VALUES (?, ?, ?, ?)",
+        WriteAheadLog.DELETE: "DELETE FROM customers WHERE name = ?",
+        WriteAheadLog.AGE: "UPDATE customers SET age = ? WHERE name = ?",
+        WriteAheadLog.ADDRESS: "UPDATE customers SET address = ? WHERE name = ?",
+        WriteAheadLog.PHONE: "UPDATE customers SET phone = ? WHERE name = ?",
+    }
+
+    def __init__(self, file: str, fsync: str = WriteAheadLog.FSYNC_ALWAYS) -> None:
+        """Open or create the database
+        :param file: The SQLite file
+        :param fsync: always syncs every commit, otherwise only at checkpoints
+        """
+
+        self.connection: sqlite3.Connection = sqlite3.connect(file, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous={}".format("FULL" if fsync == WriteAheadLog.FSYNC_ALWAYS else "NORMAL"))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS customers (name TEXT PRIMARY KEY, age INTEGER, address TEXT, phone TEXT) WITHOUT ROWID")
+
+    def load(self) -> Iterator[List]:
+        """Read the stored customers in name order
+        :return: An iterator over [name, age, address, phone] customers
+        """
+
+        for row in self.connection.execute("SELECT name, age, address, phone FROM customers ORDER BY name"):
+            yield list(row)
+
+    def apply(self, records: List[List]) -> None:
+        """Persist a batch of mutations in one transaction
+        :param records: The [op, *args] mutations
+        """
+
+        self.connection.execute("BEGIN")
+        try:
+            # Runs of the same mutation share one prepared statement
+            for op, group in itertools.groupby(records, key=lambda record: record[0]):
+                if op in (WriteAheadLog.ADD, WriteAheadLog.DELETE):
+                    rows = [record[1:] for record in group]
+                else:
+                    rows = [(record[2], record[1]) for record in group]
+                self.connection.executemany(SQLiteBackend.STATEMENTS[op], rows)
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        """Close the connection"""
+
+        self.connection.close()
+
+class MmapTable(MutableMapping):
+    """Open-addressing hash table in a memory-mapped file, records are read from disk on lookup."""
+
+    MAGIC: bytes = b"CSHT"
+    VERSION: int = 1
+
+    # Header: magic, version, slot count, live entries, used slots (live and deleted), end of the data region
+    HEADER: struct.Struct = struct.Struct("!4sIQQQQ")
+    # Slot: data offset (0 empty, 1 deleted), entry length, name hash
+    SLOT: struct.Struct = struct.Struct("!QII")
+    NAME: struct.Struct = struct.Struct("!I")
+    EMPTY: int = 0
+    DELETED: int = 1
+
+    # Rehash once this fraction of the slots is used
+    max_load: float = 0.7
+
+    def __init__(self, file: str, capacity: int = 1024) -> None:
+        """Open or create the table
+        :param file: The table file
+        :param capacity: The initial slot count for a new table, a power of two
+        """
+
+        self.fName: str = file
+        self.lock: threading.RLock = threading.RLock()
+
+        if not os.path.exists(file) or os.path.getsize(file) == 0:
+            MmapTable.create(file, capacity)
+
+        self.open()
+
+    @staticmethod
+    def create(file: str, capacity: int) -> None:
+        """Write an empty table
+        :param file: The table file
+        :param capacity: The slot count
+        """
+
+        start = MmapTable.HEADER.size + capacity * MmapTable.SLOT.size
+        with open(file, "wb") as f:
+            f.write(MmapTable.HEADER.pack(MmapTable.MAGIC, MmapTable.VERSION, capacity, 0, 0, start))
+            f.truncate(start + 4096)
+
+    def open(self) -> None:
+        """Map the file and read the header"""
+
+        self.f = open(self.fName, "r+b")
+        self.mm: mmap.mmap = mmap.mmap(self.f.fileno(), 0)
+
+        magic, version, self.capacity, self.count, self.used, self.end = MmapTable.HEADER.unpack_from(self.mm, 0)
+        if magic != MmapTable.MAGIC or version != MmapTable.VERSION:
+            raise ValueError("Not a customer hash table: {}".format(self.fName))
+
+    def write_header(self) -> None:
+        """Write the counters back to the header"""
+
+        MmapTable.HEADER.pack_into(self.mm, 0, MmapTable.MAGIC, MmapTable.VERSION, self.capacity, self.count, self.used, self.end)
+
+    def slot(self, i: int) -> tuple:
+        """Read a slot
+        :param i: The slot index
+        :return: The (offset, length, hash) slot
+        """
+
+        return MmapTable.SLOT.unpack_from(self.mm, MmapTable.HEADER.size + i * MmapTable.SLOT.size)
+
+    def entry_name(self, offset: int) -> bytes:
+        """Read the name of an entry
+        :param offset: The entry offset
+        :return: The encoded name
+        """
+
+        length = MmapTable.NAME.unpack_from(self.mm, offset)[0]
+        start = offset + MmapTable.NAME.size
+        return self.mm[start:start + length]
+
+    def find(self, key: bytes, h: int) -> tuple:
+        """Probe for a key
+        :param key: The encoded name
+        :param h: The name hash
+        :return: (slot index, offset, length) if found, else (free slot index, None, None)
+        """
+
+        mask = self.capacity - 1
+        i = h & mask
+        free = None
+
+        while True:
+            offset, length, slotHash = self.slot(i)
+
+            if offset == MmapTable.EMPTY:
+                return (i if free is None else free), None, None
+            if offset == MmapTable.DELETED:
+                if free is None:
+                    free = i
+            elif slotHash == h and self.entry_name(offset) == key:
+                return i, offset, length
+
+            i = (i + 1) & mask
+
+    def __getitem__(self, name: str) -> List:
+        key = name.encode()
+        with self.lock:
+            _, offset, length = self.find(key, zlib.crc32(key))
+            if offset is None:
+                raise KeyError(name)
+
+            # Decode the record after the name
+            start = offset + MmapTable.NAME.size + len(key)
+            return PackedRecords.unpack(self.mm[start:offset + length].decode())
+
+    def __setitem__(self, name: str, record: Sequence) -> None:
+        key = name.encode()
+        entry = MmapTable.NAME.pack(len(key)) + key + PackedRecords.pack(record).encode()
+        h = zlib.crc32(key)
+
+        with self.lock:
+            # Keep the probe chains short
+            if self.used + 1 > self.capacity * MmapTable.max_load:
+                self.rehash(self.capacity * 2 if self.count + 1 > self.capacity * MmapTable.max_load / 2 else self.capacity)
+
+            i, offset, _ = self.find(key, h)
+            if offset is None:
+                # Reusing a deleted slot does not use a new one
+                self.count += 1
+                if self.slot(i)[0] != MmapTable.DELETED:
+                    self.used += 1
+
+            # Append the entry, replaced entries become garbage until the next rehash
+            self.reserve(self.end + len(entry))
+            self.mm[self.end:self.end + len(entry)] = entry
+            MmapTable.SLOT.pack_into(self.mm, MmapTable.HEADER.size + i * MmapTable.SLOT.size, self.end, len(entry), h)
+            self.end += len(entry)
+            self.write_header()
+
+    def __delitem__(self, name: str) -> None:
+        key = name.encode()
+        with self.lock:
+            i, offset, _ = self.find(key, zlib.crc32(key))
+            if offset is None:
+                raise KeyError(name)
+
+            MmapTable.SLOT.pack_into(self.mm, MmapTable.HEADER.size + i * MmapTable.SLOT.size, MmapTable.DELETED, 0, 0)
+            self.count -= 1
+            self.write_header()
+
+    def __iter__(self) -> Iterator[str]:
+        with self.lock:
+            names = []
+            for i in range(self.capacity):
+                offset = self.slot(i)[0]
+                if offset > MmapTable.DELETED:
+                    names.append(self.entry_name(offset).decode())
+
+        return iter(names)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def reserve(self, size: int) -> None:
+        """Grow the file so that it holds at least a size
+        :param size: The needed size in bytes
+        """
+
+        if size <= len(self.mm):
+            return
+
+        # Grow geometrically and remap
+        self.mm.close()
+        self.f.truncate(max(size, 2 * os.path.getsize(self.fName)))
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+
+    def rehash(self, capacity: int) -> None:
+        """Rebuild the table with a new slot count, dropping deleted slots and replaced entries
+        :param capacity: The new slot count, a power of two
+        """
+
+        tmp = self.fName + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        # Copy the live entries into a new table
+        table = MmapTable(tmp, capacity)
+        for i in range(self.capacity):
+            offset, length, _ = self.slot(i)
+            if offset > MmapTable.DELETED:
+                nameLength = MmapTable.NAME.unpack_from(self.mm, offset)[0]
+                start = offset + MmapTable.NAME.size
+                table[self.mm[start:start + nameLength].decode()] = PackedRecords.unpack(self.mm[start + nameLength:offset + length].decode())
+        table.flush()
+        table.close()
+
+        # Swap it in
+        self.close()
+        os.replace(tmp, self.fName)
+        self.open()
+
+    def flush(self) -> None:
+        """Write the dirty pages to disk"""
+
+        with self.lock:
+            self.mm.flush()
+
+    def close(self) -> None:
+        """Unmap and close the file"""
+
+        self.mm.close()
+        self.f.close()
+
+class MmapHashBackend(StorageBackend):
+    """Keeps the customers in a memory-mapped on-disk hash table instead of loading them into memory."""
+
+    resident: bool = False
+
+    def __init__(self, file: str, fsync: str = WriteAheadLog.FSYNC_ALWAYS) -> None:
+        """Open or create the table
+        :param file: The table file
+        :param fsync: always flushes the mapping after every batch, otherwise the kernel writes it back
+        """
+
+        self.table: MmapTable = MmapTable(file)
+        self.fsync: str = fsync
+
+    def open_table(self) -> MutableMapping:
+        """Get the on-disk table
+        :return: The table
+        """
+
+        return self.table
+
+    def apply(self, records: List[List]) -> None:
+        """The table was already written through, flush it
+        :param records: The [op, *args] mutations
+        """
+
+        if self.fsync == WriteAheadLog.FSYNC_ALWAYS:
+            self.table.flush()
+
+    def close(self) -> None:
+        """Flush and close the table"""
+
+        self.table.flush()
+        self.table.close()
+
+# Storage backends by name, text is the database file handled by Database itself
+BACKENDS: Dict[str, type] = {
+    "sqlite": SQLiteBackend,
+    "mmap": MmapHashBackend,
+}
@@ -0,0 +1,156 @@
+
+
+import os
+import json
+import time
+import threading
+from typing import List, Iterator
+
+class WriteAheadLog:
+    """Append-only mutation log for the database."""
+
+    # Fsync policies
+    FSYNC_ALWAYS: str = "always"
+    FSYNC_INTERVAL: str = "interval"
+    FSYNC_NEVER: str = "never"
+    FSYNC_POLICIES: tuple = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+    # Mutation record codes
+    ADD: str = "a"
+    DELETE: str = "d"
+    AGE: str = "g"
+    ADDRESS: str = "r"
+    PHONE: str = "p"
+
+    # Shared record encoder
+    encoder: json.JSONEncoder = json.JSONEncoder(separators=(",", ":"))
+
+    def __init__(self, file: str, fsync: str = FSYNC_ALWAYS, interval: int = 100) -> None:
+        """Initialize the log
+        :param file: The log file
+        :param fsync: The fsync policy (always, interval or never)
+        :param interval: The fsync interval in milliseconds for the interval policy
+        """
+
+        # Check the fsync policy
+        if fsync not in WriteAheadLog.FSYNC_POLICIES:
+            raise ValueError("Invalid fsync policy: {}".format(fsync))
+
+        self.fName: str = file
+        self.fsync: str = fsync
+        self.interval: float = interval / 1000
+        self.lock: threading.Lock = threading.Lock()
+        self.dirty: bool = False
+        self.closed: bool = False
+
+        # Open the log for appending
+        self.f = open(file, "ab")
+
+        # Start the background syncer for the interval policy
+        self.syncer: threading.Thread = None
+        if fsync == WriteAheadLog.FSYNC_INTERVAL:
+            self.syncer = threading.Thread(target=self.sync_loop, daemon=True)
+            self.syncer.start()
+
+    @staticmethod
+    def encode(op: str, args: List) -> bytes:
+        """Encode a mutation into a log record
+        :param op: The mutation code
+        :param args: The mutation arguments
+        :return: The log record
+        """
+
+        # One compact JSON array per line, newlines inside values are escaped
+        return (WriteAheadLog.encoder.encode([op, *args]) + "\n").encode()
+
+    @staticmethod
+    def replay(file: str) -> Iterator[List]:
+        """Read the mutation records of a log file, cutting off a torn tail
+        :param file: The log file
+        :return: An iterator over [op, *args] records
+        """
+
+        # Nothing to replay without a log
+        if not os.path.exists(file):
+            return
+
+        # End of the last whole record
+        valid = 0
+        with open(file, "rb") as f:
+            for line in f:
+                try:
+                    # Every record ends with a newline, a record without one was cut short
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Torn record")
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn record can only be the tail of a crashed write
+                    break
+
+                valid += len(line)
+                yield record
+
+        # Drop the torn tail, or the next append would be glued onto it and lost with it
+        if valid < os.path.getsize(file):
+            os.truncate(file, valid)
+
+    def append(self, op: str, *args) -> None:
+        """Append a mutation to the log
+        :param op: The mutation code
+        :param args: The mutation arguments
+        """
+
+        self.append_many([[op] + list(args)])
+
+    def append_many(self, records: List[List]) -> None:
+        """Append several mutations with a single write and fsync
+        :param records: The [op, *args] records
+        """
+
+        data = b"".join(WriteAheadLog.encode(record[0], record[1:]) for record in records)
+
+        with self.lock:
+            # Write the records
+            self.f.write(data)
+
+            # Apply the fsync policy once for the whole batch
+            if self.fsync == WriteAheadLog.FSYNC_ALWAYS:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+            elif self.fsync == WriteAheadLog.FSYNC_INTERVAL:
+                self.dirty = True
+            else:
+                self.f.flush()
+
+    def sync(self) -> None:
+        """Flush and fsync the log"""
+
+        with self.lock:
+            if not self.closed:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+                self.dirty = False
+
+    def sync_loop(self) -> None:
+        """Fsync the log every interval while it has unsynced records"""
+
+        while not self.closed:
+            time.sleep(self.interval)
+            if self.dirty:
+                self.sync()
+
+    def size(self) -> int:
+        """Get the size of the log
+        :return: The log size in bytes
+        """
+
+        with self.lock:
+            return self.f.tell()
+
+    def close(self) -> None:
+        """Sync and close the log"""
+
+        self.sync()
+        with self.lock:
+            self.closed = True
+            self.f.close()
@@ -0,0 +1,261 @@
+"""
+Load generator for the client-server path. Starts a server on a temporary
+file pre-populated with customers (or targets a running one), runs a mix of
+operations at a target concurrency and rate, then reports the throughput and
+HDR latency histograms, optionally saved as JSON to compare across commits.
+
+    python benchmark.py --customers 100000 --concurrency 64 --duration 30
+    python benchmark.py --mix find=90,update=10 --rate 5000 --output run.json
+    python benchmark.py --compare before.json --output after.json -- --mode async
+"""
+
+if __name__ == "__main__":
+
+    import sys
+    import json
+    import time
+    import random
+    import asyncio
+    import argparse
+    import platform
+    import subprocess
+    from typing import Dict, List
+    from Client.api import AsyncDatabaseClient
+    from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server
+    from benchmarks.histogram import Histogram
+
+    # Operations of the mix
+    OPERATIONS: List[str] = ["find", "add", "update", "delete", "report"]
+
+    def parse_mix(text: str) -> Dict[str, float]:
+        """Parse an operation mix
+        :param text: Comma-separated operation=weight pairs
+        :return: The weight of each operation
+        """
+
+        mix = {}
+        for pair in text.split(","):
+            operation, _, weight = pair.partition("=")
+            if operation not in OPERATIONS:
+                raise argparse.ArgumentTypeError("Unknown operation: {}".format(operation))
+            mix[operation] = float(weight or 1)
+
+        return mix
+
+    # Parse the command line, arguments after -- go to server.py
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=100000, help="Customers written to the temporary data file")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("find=70,add=10,update=15,delete=4,report=1"), help="Operation weights, from " + ", ".join(OPERATIONS))
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight")
+    parser.add_argument("--rate", type=float, default=0, help="Target requests per second, 0 for as fast as possible")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of measurement")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds of load before measuring")
+    parser.add_argument("--connections", type=int, default=8, help="Client connections the requests are spread over")
+    parser.add_argument("--compression", help="Codecs to accept large responses in, comma-separated (zlib, lz4)")
+    parser.add_argument("--report-page", type=int, default=100, help="Customers per report operation, a page from a random cursor")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="Load a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=9950, help="The port of the started server")
+    parser.add_argument("--seed", type=int, default=0, help="The random seed")
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--compare", help="Print the change from the results of an earlier run")
+    parser.add_argument("server_args", nargs="*", help="Extra server.py arguments, after --")
+    args = parser.parse_args()
+
+    # The started server serves the connections at once unless told otherwise, a single-mode server one at a time
+    modes = argparse.ArgumentParser(add_help=False)
+    modes.add_argument("--mode", default="threaded")
+    mode = modes.parse_known_args(args.server_args)[0].mode
+    if not args.connect:
+        if not any(arg.startswith("--mode") for arg in args.server_args):
+            args.server_args = ["--mode", mode] + args.server_args
+        if mode == "single" and args.connections > 1:
+            print("A single-mode server serves one connection at a time, using 1 connection")
+            args.connections = 1
+
+    class Load:
+        """Runs the operation mix and records the latencies."""
+
+        def __init__(self, client: AsyncDatabaseClient) -> None:
+            """Initialize the load
+            :param client: The client
+            """
+
+            self.client: AsyncDatabaseClient = client
+            self.rnd: random.Random = random.Random(args.seed)
+            self.operations: List[str] = list(args.mix)
+            self.weights: List[float] = [args.mix[operation] for operation in self.operations]
+
+            # Customers added by the run, deleted first so that the data set keeps its size
+            self.added: List[str] = []
+            self.nextName: int = 0
+
+            # Results of the measured window
+            self.measuring: bool = False
+            self.histograms: Dict[str, Histogram] = {operation: Histogram() for operation in self.operations}
+            self.errors: Dict[str, int] = {operation: 0 for operation in self.operations}
+
+        async def run_operation(self, operation: str) -> None:
+            """Run one operation
+            :param operation: The operation name
+            """
+
+            rnd = self.rnd
+            name = customer_name(rnd.randrange(args.customers))
+
+            if operation == "find":
+                await self.client.find_customer(name)
+            elif operation == "update":
+                await self.client.update_age(name, rnd.randint(18, 90))
+            elif operation == "add":
+                self.nextName += 1
+                added = "Load{:010d}-{}".format(self.nextName, args.seed)
+                await self.client.add_customer(added, rnd.randint(18, 90), "1 Load St", "555 000-0000")
+                self.added.append(added)
+            elif operation == "delete":
+                await self.client.delete_customer(self.added.pop() if self.added else name)
+            else:
+                await self.client.call("report_page", name, args.report_page)
+
+        async def worker(self, start: float, end: float, interval: float, slots: List[int]) -> None:
+            """Run operations until the end of the run
+            :param start: The loop time of the first request
+            :param end: The loop time the run ends
+            :param interval: The seconds between requests at the target rate, 0 for none
+            :param slots: The shared count of scheduled requests
+            """
+
+            loop = asyncio.get_running_loop()
+            while True:
+                # Open loop: take the next slot of the schedule and wait for it
+                if interval:
+                    scheduled = start + slots[0] * interval
+                    slots[0] += 1
+                    if scheduled >= end:
+                        return
+                    await asyncio.sleep(max(0.0, scheduled - loop.time()))
+                else:
+                    scheduled = loop.time()
+                    if scheduled >= end:
+                        return
+
+                operation = self.rnd.choices(self.operations, self.weights)[0]
+                measured = self.measuring
+                try:
+                    await self.run_operation(operation)
+                except OSError:
+                    if measured:
+                        self.errors[operation] += 1
+                    continue
+
+                # Latency from the scheduled time, so that a stalled server is not hidden
+                if measured:
+                    self.histograms[operation].record((loop.time() - scheduled) * 1e6)
+
+        async def run(self) -> float:
+            """Run the warmup and the measured window
+            :return: The measured seconds
+            """
+
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            end = start + args.warmup + args.duration
+            interval = 1 / args.rate if args.rate else 0
+            slots = [0]
+            workers = [loop.create_task(self.worker(start, end, interval, slots)) for _ in range(args.concurrency)]
+
+            await asyncio.sleep(args.warmup)
+            self.measuring = True
+            measured = loop.time()
+            await asyncio.gather(*workers)
+            return loop.time() - measured
+
+    async def main(address) -> Dict:
+        """Run the load against a server
+        :param address: The (host, port) of the server
+        :return: The results
+        """
+
+        async with AsyncDatabaseClient(*address, pool_size=args.connections, max_in_flight=args.concurrency,
+                                       compression=args.compression) as client:
+            load = Load(client)
+            elapsed = await load.run()
+
+        total = Histogram()
+        for histogram in load.histograms.values():
+            total.add(histogram)
+
+        return {
+            "seconds": round(elapsed, 3),
+            "requests": total.total,
+            "throughput": round(total.total / elapsed, 1),
+            "errors": sum(load.errors.values()),
+            "latency_us": total.summary(),
+            "operations": {operation: dict(load.histograms[operation].summary(), errors=load.errors[operation]) for operation in load.operations},
+        }
+
+    def git_commit() -> str:
+        """Get the commit of the working tree
+        :return: The commit hash, None outside a repository
+        """
+
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    # Start a server on generated customers, or use the given one
+    server = None
+    file = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(":")
+        address = (host or "localhost", int(port))
+    else:
+        file = temp_file()
+        write_customers(file, args.customers)
+        server = start_server(file, args.port, *args.server_args)
+        address = ("localhost", args.port)
+
+    try:
+        results = asyncio.run(main(address))
+    finally:
+        if server is not None:
+            stop_server(server)
+            remove_files(file, file + ".log", file + ".log.1")
+
+    results = dict({
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"customers": args.customers, "mix": args.mix, "concurrency": args.concurrency, "rate": args.rate,
+                   "duration": args.duration, "warmup": args.warmup, "connections": args.connections,
+                   "compression": args.compression,
+                   "server": args.connect or " ".join(args.server_args)},
+    }, **results)
+
+    # Print the results
+    print("{:>8} {:>9} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}".format("op", "count", "errors", "mean ms", "p50 ms", "p99 ms", "p99.9 ms", "max ms"))
+    for operation, summary in list(results["operations"].items()) + [("all", dict(results["latency_us"], errors=results["errors"]))]:
+        percentiles = summary["percentiles"]
+        print("{:>8} {:>9} {:>7} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            operation, summary["count"], summary["errors"], summary["mean"] / 1000, percentiles["50"] / 1000,
+            percentiles["99"] / 1000, percentiles["99.9"] / 1000, summary["max"] / 1000))
+    print("Throughput: {:.0f} requests/s over {:.1f} s".format(results["throughput"], results["seconds"]))
+
+    # Compare with an earlier run
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        print("Compared to {} ({}):".format(args.compare, (before.get("commit") or "unknown")[:10]))
+        print("  throughput {:+.1f}%".format(100 * (results["throughput"] / before["throughput"] - 1) if before["throughput"] else 0))
+        for p in ("50", "99", "99.9"):
+            old, new = before["latency_us"]["percentiles"][p], results["latency_us"]["percentiles"][p]
+            print("  p{} {:.2f} -> {:.2f} ms".format(p, old / 1000, new / 1000))
+
+    # Save the results
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Saved to {}".format(args.output))
+
+    sys.exit(1 if results["requests"] == 0 else 0)
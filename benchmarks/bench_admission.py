@@ -0,0 +1,196 @@
+"""
+Load test of admission control. Well-behaved clients send paced one-shot
+lookups from 127.0.0.1 while abusive clients from 127.0.0.2 hold slow
+connections trickling a request that never ends, and flood a session with
+requests as fast as they can. The latency and errors of the well-behaved
+clients are measured alone and under attack, against a server without
+limits and one with deadlines, a per-client connection cap, a queue
+deadline and a per-client rate.
+
+    python -m benchmarks.bench_admission --mode threaded --duration 10
+    python -m benchmarks.bench_admission --mode async --slow 200 --flooders 2
+"""
+
+import time
+import random
+import socket
+import argparse
+import multiprocessing
+from typing import Dict, List, Tuple
+from Client.database_client import Client
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server, percentile
+
+# Source address of the abusive clients, any 127.0.0.0/8 address reaches the loopback server
+ABUSER: str = "127.0.0.2"
+
+def well_behaved(args: Tuple) -> Tuple[List[float], int]:
+    """Send one-shot lookups on a fixed schedule
+    :param args: The port, the customer count, the seconds to run, the seconds between requests, the client timeout and the seed
+    :return: The latencies from the scheduled times and the failed requests
+    """
+
+    port, customers, duration, interval, timeout, seed = args
+    rnd = random.Random(seed)
+    latencies = []
+    errors = 0
+
+    start = time.perf_counter()
+    for slot in range(int(duration / interval)):
+        # Wait for the slot, a late request counts its delay
+        scheduled = start + slot * interval
+        time.sleep(max(0.0, scheduled - time.perf_counter()))
+
+        try:
+            response = Client("localhost", port, timeout=timeout).call("find_customer", customer_name(rnd.randrange(customers)))
+            if not response.startswith("Customer"):
+                errors += 1
+                continue
+        except OSError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - scheduled)
+
+    return latencies, errors
+
+def slow_connections(args: Tuple) -> int:
+    """Hold connections sending a byte of a request that never ends every half second, reconnecting those closed
+    :param args: The port, the connections and the seconds to run
+    :return: The connections opened
+    """
+
+    port, count, duration = args
+    connections: List[socket.socket] = []
+    opened = 0
+
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        # Reopen up to the count
+        while len(connections) < count:
+            try:
+                sock = socket.create_connection(("127.0.0.1", port), timeout=1, source_address=(ABUSER, 0))
+                sock.sendall(b"find_customer\nCustomer")
+                connections.append(sock)
+                opened += 1
+            except OSError:
+                break
+
+        # Trickle, dropping the connections the server closed
+        alive = []
+        for sock in connections:
+            try:
+                sock.sendall(b"0")
+                alive.append(sock)
+            except OSError:
+                sock.close()
+        connections = alive
+        time.sleep(0.5)
+
+    for sock in connections:
+        sock.close()
+    return opened
+
+def flood(args: Tuple) -> Tuple[int, int]:
+    """Send lookups back to back on sessions, reconnecting those closed
+    :param args: The port and the seconds to run
+    :return: The responses and the refused ones among them
+    """
+
+    port, duration = args
+    responses = refused = 0
+
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=2, source_address=(ABUSER, 0)) as sock:
+                f = sock.makefile("rb")
+                sock.sendall(b"session\n")
+                f.read(int(f.readline()))
+                while time.perf_counter() < end:
+                    sock.sendall(b"find_customer\nCustomer00000001\n")
+                    response = f.read(int(f.readline()))
+                    responses += 1
+                    if not response.startswith(b"Customer"):
+                        refused += 1
+        except (OSError, ValueError):
+            time.sleep(0.01)
+
+    return responses, refused
+
+def counters(port: int) -> Dict[str, int]:
+    """Read the admission counters of the server
+    :param port: The server port
+    :return: The counters by name
+    """
+
+    try:
+        pairs = Client("localhost", port, timeout=5).call("stats").split("\n")[0].split()
+        return {key: int(float(value)) for key, value in (pair.split("=") for pair in pairs)}
+    except (OSError, ValueError):
+        return {}
+
+def run_phase(port: int, attack: bool) -> Dict:
+    """Run the well-behaved clients, with or without the abusive ones
+    :param port: The server port
+    :param attack: Whether the abusive clients run alongside
+    :return: The results
+    """
+
+    before = counters(port)
+    with multiprocessing.Pool(args.clients + (1 + args.flooders if attack else 0)) as pool:
+        # Start the attack first so that it is under way
+        attackers = []
+        if attack:
+            attackers.append(pool.apply_async(slow_connections, ((port, args.slow, args.duration + 1),)))
+            attackers.extend(pool.apply_async(flood, ((port, args.duration + 1),)) for _ in range(args.flooders))
+            time.sleep(1)
+
+        results = pool.map(well_behaved, [(port, args.customers, args.duration, args.interval, args.timeout, i) for i in range(args.clients)])
+        outcomes = [attacker.get() for attacker in attackers]
+
+    after = counters(port)
+    latencies = [latency for latencies, _ in results for latency in latencies]
+    return {
+        "latencies": latencies,
+        "errors": sum(errors for _, errors in results),
+        "flood": (sum(responses for responses, _ in outcomes[1:]), sum(refused for _, refused in outcomes[1:])) if attack else (0, 0),
+        "counters": {key: after.get(key, 0) - before.get(key, 0) for key in ("rejected_connections", "timeouts", "rate_limited", "shed_requests")},
+    }
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", default="threaded", help="The server mode")
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=4, help="Well-behaved client processes")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between the requests of a well-behaved client")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Seconds a well-behaved client waits before failing")
+    parser.add_argument("--slow", type=int, default=64, help="Slow connections held by the attacker")
+    parser.add_argument("--flooders", type=int, default=1, help="Attacker processes flooding requests")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--limits", default="--read-timeout 1 --max-client-connections 16 --queue-timeout 0.5 --rate 1000 --burst 200",
+                        help="server.py arguments of the limited server")
+    parser.add_argument("--port", type=int, default=9897)
+    args = parser.parse_args()
+
+    file = temp_file()
+    write_customers(file, args.customers)
+    configs = [("no limits", ["--read-timeout", "0", "--write-timeout", "0"]), ("limits", args.limits.split())]
+
+    print("{:>10} {:>8} {:>9} {:>9} {:>9} {:>10} {:>8} {:>12} {:>10} {:>10} {:>10} {:>8}".format(
+        "server", "attack", "good/s", "p50 ms", "p99 ms", "p99.9 ms", "errors", "flood/s", "refused", "rejected", "timeouts", "shed"))
+    try:
+        for label, limits in configs:
+            server = start_server(file, args.port, "--mode", args.mode, *limits)
+            try:
+                for attack in (False, True):
+                    result = run_phase(args.port, attack)
+                    latencies = result["latencies"]
+                    print("{:>10} {:>8} {:>9.0f} {:>9.2f} {:>9.2f} {:>10.2f} {:>8} {:>12.0f} {:>10} {:>10} {:>10} {:>8}".format(
+                        label, "yes" if attack else "no", len(latencies) / args.duration, 1000 * percentile(latencies, 50),
+                        1000 * percentile(latencies, 99), 1000 * percentile(latencies, 99.9), result["errors"],
+                        result["flood"][0] / args.duration, result["counters"]["rate_limited"], result["counters"]["rejected_connections"],
+                        result["counters"]["timeouts"], result["counters"]["shed_requests"]))
+            finally:
+                stop_server(server)
+    finally:
+        remove_files(file)
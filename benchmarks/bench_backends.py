@@ -0,0 +1,100 @@
+"""
+The same workload against each storage backend: populate, reopen,
+random lookups, single updates and batched adds/deletes.
+
+    python -m benchmarks.bench_backends --size 100000 --ops 10000
+"""
+
+import time
+import random
+import argparse
+from typing import Dict, List
+from Server.database import Database
+from Server.wal import WriteAheadLog
+from benchmarks.common import customer, customer_name, temp_file, remove_files
+
+# Database options per backend, the text file is measured with its write-ahead log
+BACKENDS: Dict[str, Dict] = {
+    "text-rewrite": {"backend": "text"},
+    "text-wal": {"backend": "text", "durability": Database.WAL},
+    "sqlite": {"backend": "sqlite"},
+    "mmap": {"backend": "mmap"},
+}
+
+def rate(count: int, seconds: float) -> float:
+    """Get an operation rate
+    :param count: The number of operations
+    :param seconds: The elapsed time
+    :return: The operations per second
+    """
+
+    return count / seconds if seconds else float("inf")
+
+def run(backend: str, size: int, ops: int, fsync: str, batch: int) -> List[float]:
+    """Run the workload against one backend
+    :param backend: The backend configuration name
+    :param size: The number of customers
+    :param ops: The number of operations of each kind
+    :param fsync: The fsync policy
+    :param batch: The batch size of the adds and deletes
+    :return: Populate, reopen, lookup, update and batch rates and times
+    """
+
+    file = temp_file()
+    options = dict(BACKENDS[backend], fsync=fsync)
+    rnd = random.Random(0)
+
+    try:
+        # Populate in batches
+        start = time.perf_counter()
+        database = Database(file, **options)
+        for i in range(0, size, batch):
+            database.add_customers([customer(j) for j in range(i, min(size, i + batch))])
+        populate = time.perf_counter() - start
+        database.close()
+
+        # Reopen
+        start = time.perf_counter()
+        database = Database(file, **options)
+        reopen = time.perf_counter() - start
+
+        # Random lookups
+        names = [customer_name(rnd.randrange(size)) for _ in range(ops)]
+        start = time.perf_counter()
+        for name in names:
+            database.get_customer(name)
+        lookups = rate(ops, time.perf_counter() - start)
+
+        # Single updates, each persisted on its own
+        start = time.perf_counter()
+        for name in names:
+            database.update_age(name, rnd.randint(18, 90))
+        updates = rate(ops, time.perf_counter() - start)
+
+        # Batched adds then deletes of new customers
+        added = [customer(size + i) for i in range(ops)]
+        start = time.perf_counter()
+        for i in range(0, ops, batch):
+            database.add_customers(added[i:i + batch])
+        for i in range(0, ops, batch):
+            database.delete_customers([data[0] for data in added[i:i + batch]])
+        batches = rate(2 * ops, time.perf_counter() - start)
+
+        database.close()
+        return [rate(size, populate), reopen, lookups, updates, batches]
+    finally:
+        remove_files(file, file + ".log", file + ".log.1", file + "-wal", file + "-shm")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--fsync", choices=WriteAheadLog.FSYNC_POLICIES, default=WriteAheadLog.FSYNC_NEVER)
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=["text-wal", "sqlite", "mmap"])
+    args = parser.parse_args()
+
+    print("{:>13} {:>12} {:>10} {:>12} {:>12} {:>12}".format("backend", "populate/s", "reopen s", "lookups/s", "updates/s", "batch ops/s"))
+    for backend in args.backends:
+        print("{:>13} {:>12.0f} {:>10.3f} {:>12.0f} {:>12.0f} {:>12.0f}".format(backend, *run(backend, args.size, args.ops, args.fsync, args.batch)))
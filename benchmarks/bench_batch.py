@@ -0,0 +1,124 @@
+"""
+Bulk import throughput: one add_customer round trip per customer versus
+pipelined add_many batches over the binary protocol.
+
+    python -m benchmarks.bench_batch --customers 1000000 --durability wal
+"""
+
+import time
+import socket
+import argparse
+from typing import List
+from Server import protocol
+from benchmarks.common import customer, temp_file, remove_files, start_server, stop_server
+
+class BinaryConnection:
+    """Minimal binary protocol connection."""
+
+    def __init__(self, port: int) -> None:
+        """Open the connection and negotiate the protocol
+        :param port: The server port
+        """
+
+        self.sock = socket.create_connection(("localhost", port))
+        self.sock.sendall((protocol.BINARY + "\n").encode())
+        self.reader = protocol.FrameReader(self.sock.recv_into)
+        self.reader.read()
+        self.request_id = 0
+
+    def pipeline(self, requests: List, depth: int) -> int:
+        """Send requests a window at a time
+        :param requests: The (opcode, fields) requests
+        :param depth: The maximum number of requests in flight
+        :return: The number of response fields
+        """
+
+        fields = 0
+        for start in range(0, len(requests), depth):
+            window = requests[start:start + depth]
+            frames = []
+            for opcode, values in window:
+                self.request_id += 1
+                frames.append(protocol.encode_frame(opcode, self.request_id, values))
+            self.sock.sendall(b"".join(frames))
+            for _ in window:
+                fields += len(self.reader.read()[2])
+
+        return fields
+
+    def close(self) -> None:
+        """End the session"""
+
+        self.sock.sendall(protocol.encode_frame(protocol.END, 0, []))
+        self.sock.close()
+
+def import_single(port: int, start: int, count: int, budget: float) -> float:
+    """Import customers one round trip each
+    :param port: The server port
+    :param start: The first customer index
+    :param count: The number of customers
+    :param budget: The time budget in seconds
+    :return: The customers per second
+    """
+
+    connection = BinaryConnection(port)
+    opcode = protocol.OPCODES["add_customer"]
+    begin = time.perf_counter()
+    done = 0
+    while done < count and time.perf_counter() - begin < budget:
+        connection.pipeline([(opcode, customer(start + done))], 1)
+        done += 1
+    elapsed = time.perf_counter() - begin
+    connection.close()
+
+    return done / elapsed
+
+def import_batched(port: int, start: int, count: int, batch: int, depth: int) -> float:
+    """Import customers with pipelined add_many batches
+    :param port: The server port
+    :param start: The first customer index
+    :param count: The number of customers
+    :param batch: The customers per batch
+    :param depth: The batches in flight
+    :return: The customers per second
+    """
+
+    # Generate the batches up front
+    opcode = protocol.OPCODES["add_many"]
+    requests = []
+    for first in range(start, start + count, batch):
+        values = []
+        for i in range(first, min(first + batch, start + count)):
+            values.extend(customer(i))
+        requests.append((opcode, values))
+
+    connection = BinaryConnection(port)
+    begin = time.perf_counter()
+    added = connection.pipeline(requests, depth)
+    elapsed = time.perf_counter() - begin
+    connection.close()
+
+    return added / elapsed
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--durability", default="wal")
+    parser.add_argument("--budget", type=float, default=5.0, help="Seconds for the single-request import")
+    parser.add_argument("--port", type=int, default=9990)
+    args = parser.parse_args()
+
+    file = temp_file()
+    server = start_server(file, args.port, "--durability", args.durability)
+    try:
+        single = import_single(args.port, 0, args.customers, args.budget)
+        print("add_customer: {:>10.1f} customers/s, {:.1f} s for {}".format(single, args.customers / single, args.customers))
+
+        batched = import_batched(args.port, args.customers, args.customers, args.batch, args.depth)
+        print("add_many:     {:>10.1f} customers/s, {:.1f} s for {}".format(batched, args.customers / batched, args.customers))
+    finally:
+        stop_server(server)
+        remove_files(file, file + ".log", file + ".log.1", file + ".tmp")
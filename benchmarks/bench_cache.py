@@ -0,0 +1,82 @@
+"""
+find_customer throughput and hit ratio of the client cache under a
+Zipfian key distribution, with a share of writes invalidating entries.
+
+    python -m benchmarks.bench_cache --requests 50000 --sizes 0 100 1000 10000
+"""
+
+import time
+import random
+import argparse
+import itertools
+from typing import List
+from Client.database_client import Client
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server
+
+def zipf_names(customers: int, count: int, s: float, seed: int = 0) -> List[str]:
+    """Draw customer names with Zipfian popularity
+    :param customers: The number of customers
+    :param count: The number of draws
+    :param s: The Zipf exponent, larger is more skewed
+    :param seed: The random seed
+    :return: The names
+    """
+
+    rnd = random.Random(seed)
+    weights = list(itertools.accumulate(1 / (rank ** s) for rank in range(1, customers + 1)))
+
+    # Shuffle ranks so hot customers are spread over the key space
+    ranks = list(range(customers))
+    rnd.shuffle(ranks)
+    return [customer_name(ranks[i]) for i in rnd.choices(range(customers), cum_weights=weights, k=count)]
+
+def run(port: int, names: List[str], size: int, ttl: float, writes: float) -> List[float]:
+    """Run the workload on one session
+    :param port: The server port
+    :param names: The customers to look up
+    :param size: The cache size, 0 for no cache
+    :param ttl: The cache TTL in seconds
+    :param writes: The fraction of requests updating the customer instead
+    :return: The requests per second and the hit ratio
+    """
+
+    rnd = random.Random(1)
+    client = Client("localhost", port, session=True, cache_size=size, cache_ttl=ttl)
+    client.connect()
+
+    start = time.perf_counter()
+    for name in names:
+        if rnd.random() < writes:
+            client.send_command("update_age", name, rnd.randint(18, 90))
+            client.get_server_response()
+        else:
+            client.lookup(name)
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    return [len(names) / elapsed, client.cache.stats()["hit_ratio"] if client.cache else 0.0]
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100, 1000, 10000])
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--ttl", type=float, default=30.0)
+    parser.add_argument("--writes", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=9990)
+    args = parser.parse_args()
+
+    file = temp_file()
+    write_customers(file, args.customers)
+    names = zipf_names(args.customers, args.requests, args.zipf)
+
+    server = start_server(file, args.port, "--durability", "wal", "--fsync", "never")
+    try:
+        print("{:>8} {:>12} {:>10}".format("cache", "requests/s", "hit ratio"))
+        for size in args.sizes:
+            print("{:>8} {:>12.0f} {:>10.3f}".format(size, *run(args.port, names, size, args.ttl, args.writes)))
+    finally:
+        stop_server(server)
+        remove_files(file, file + ".log", file + ".log.1")
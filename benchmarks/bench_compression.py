@@ -0,0 +1,122 @@
+"""
+Compressed responses: bytes on the wire and time of a full report and of
+batch finds with each codec, then the CPU time per MB the codecs take to
+compress and decompress the report chunks in process.
+
+    python -m benchmarks.bench_compression --customers 100000 --codecs none zlib lz4
+    python -m benchmarks.bench_compression --mode async --batch 500
+"""
+
+import time
+import argparse
+from typing import Dict, List
+from Client.database_client import Client
+from Server import compression
+from Server.database import Database
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server
+
+def bytes_out(port: int) -> int:
+    """Read the bytes the server has sent so far
+    :param port: The server port
+    :return: The bytes_out counter
+    """
+
+    counters = Client("localhost", port).call("stats").split("\n")[0].split()
+    return int(dict(counter.split("=") for counter in counters)["bytes_out"])
+
+def transfer(port: int, codec: str, requests: List[List], session: bool) -> Dict[str, float]:
+    """Send requests with a codec, measuring the response bytes
+    :param port: The server port
+    :param codec: The codec to offer, none for uncompressed responses
+    :param requests: The (command, *fields) requests
+    :param session: Whether to send them on one session rather than a connection each
+    :return: The seconds taken, the bytes the server sent and the response characters
+    """
+
+    client = Client("localhost", port, session=session, compression=None if codec == "none" else codec)
+    before = bytes_out(port)
+    start = time.perf_counter()
+    characters = sum(len(client.call(*request)) for request in requests)
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    # Writes are counted once sent, give the handler of the last response time to count it
+    time.sleep(0.2)
+
+    # The counter is read before the stats response is sent, so the difference includes the first one
+    after = bytes_out(port)
+    overhead = bytes_out(port) - after
+    return {"seconds": elapsed, "bytes": after - before - overhead, "characters": characters}
+
+def cpu_per_mb(file: str, codecs: List[str], rounds: int) -> None:
+    """Print the CPU time the codecs take on the report chunks
+    :param file: The database file
+    :param codecs: The codec names
+    :param rounds: The times each codec runs over the report
+    """
+
+    database = Database(file)
+    chunks = list(database.iter_report())
+    database.close()
+    megabytes = sum(len(chunk) for chunk in chunks) / 1e6
+
+    print()
+    print("{:>8} {:>10} {:>16} {:>18}".format("codec", "ratio", "compress ms/MB", "decompress ms/MB"))
+    for codec in codecs:
+        if codec == "none":
+            continue
+
+        # Compress chunk by chunk as the server does, then decompress the stream
+        start = time.process_time()
+        for _ in range(rounds):
+            stream = compression.compress_chunks(codec, chunks)
+        compress = (time.process_time() - start) / rounds
+        start = time.process_time()
+        for _ in range(rounds):
+            compression.decompress(codec, stream)
+        decompress = (time.process_time() - start) / rounds
+
+        print("{:>8} {:>10.2f} {:>16.2f} {:>18.2f}".format(codec, megabytes * 1e6 / len(stream), 1000 * compress / megabytes, 1000 * decompress / megabytes))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--codecs", nargs="+", default=["none"] + list(compression.CODECS))
+    parser.add_argument("--mode", default="threaded", help="The server mode")
+    parser.add_argument("--reports", type=int, default=3, help="Full reports per codec")
+    parser.add_argument("--batch", type=int, default=1000, help="Customers per find_many")
+    parser.add_argument("--batches", type=int, default=50, help="find_many requests per codec, on one session")
+    parser.add_argument("--finds", type=int, default=2000, help="find_customer requests per codec, on one session, below the threshold")
+    parser.add_argument("--rounds", type=int, default=3, help="Runs over the report of each codec in process")
+    parser.add_argument("--port", type=int, default=9896)
+    parser.add_argument("server_args", nargs="*", help="Extra server.py arguments, after --")
+    args = parser.parse_args()
+
+    missing = [codec for codec in args.codecs if codec != "none" and codec not in compression.CODECS]
+    if missing:
+        parser.error("Codecs not available here: {}".format(", ".join(missing)))
+
+    file = temp_file()
+    write_customers(file, args.customers)
+    workloads = {
+        "print_report": ([["print_report"]] * args.reports, False),
+        "find_many": ([["find_many"] + [customer_name((i * args.batch + j) % args.customers) for j in range(args.batch)] for i in range(args.batches)], True),
+        "find_customer": ([["find_customer", customer_name(i % args.customers)] for i in range(args.finds)], True),
+    }
+
+    server = start_server(file, args.port, "--mode", args.mode, *args.server_args)
+    try:
+        print("{:>14} {:>8} {:>14} {:>14} {:>8} {:>10}".format("workload", "codec", "text bytes", "wire bytes", "ratio", "seconds"))
+        for workload, (requests, session) in workloads.items():
+            for codec in args.codecs:
+                result = transfer(args.port, codec, requests, session)
+                print("{:>14} {:>8} {:>14} {:>14} {:>8.2f} {:>10.3f}".format(
+                    workload, codec, result["characters"], result["bytes"], result["characters"] / max(1, result["bytes"]), result["seconds"]))
+    finally:
+        stop_server(server)
+
+    try:
+        cpu_per_mb(file, args.codecs, args.rounds)
+    finally:
+        remove_files(file)
@@ -0,0 +1,97 @@
+"""
+Load test of the server concurrency modes: p50/p99 latency and throughput
+of find_customer at several client concurrencies, optionally with stalled
+clients holding connections open.
+
+    python -m benchmarks.bench_concurrency --clients 1 64 1024 --stall 4
+"""
+
+import time
+import random
+import asyncio
+import argparse
+from typing import List, Tuple
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server, percentile
+
+async def request(port: int, query: str, timeout: float) -> float:
+    """Send one query and read the response
+    :param port: The server port
+    :param query: The query text
+    :param timeout: The request timeout in seconds
+    :return: The latency in seconds
+    """
+
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection("localhost", port), timeout)
+    writer.write(query.encode())
+    await writer.drain()
+    await asyncio.wait_for(reader.read(), timeout)
+    writer.close()
+    return time.perf_counter() - start
+
+async def load(port: int, clients: int, requests: int, customers: int, stall: int, timeout: float) -> Tuple[List[float], float, int]:
+    """Run concurrent clients against the server
+    :param port: The server port
+    :param clients: The number of concurrent clients
+    :param requests: The total number of requests
+    :param customers: The number of customers in the database
+    :param stall: The number of connections that never send a request
+    :param timeout: The request timeout in seconds
+    :return: The latencies, the elapsed time and the number of failed requests
+    """
+
+    # Open the stalled connections first
+    stalled = [await asyncio.open_connection("localhost", port) for _ in range(stall)]
+
+    latencies: List[float] = []
+    failures = 0
+    remaining = requests
+
+    async def client() -> None:
+        nonlocal remaining, failures
+        while remaining > 0:
+            remaining -= 1
+            name = customer_name(random.randrange(customers))
+            try:
+                latencies.append(await request(port, "find_customer\n{}\n".format(name), timeout))
+            except (OSError, asyncio.TimeoutError):
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    for reader, writer in stalled:
+        writer.close()
+
+    return latencies, elapsed, failures
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["single", "threaded", "async"])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 64, 1024])
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per run")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--stall", type=int, default=0, help="Connections that connect and never send")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Request timeout in seconds")
+    parser.add_argument("--port", type=int, default=9990)
+    args = parser.parse_args()
+
+    file = temp_file()
+    write_customers(file, args.customers)
+
+    print("{:>10} {:>8} {:>10} {:>10} {:>10} {:>8}".format("mode", "clients", "req/s", "p50 ms", "p99 ms", "failed"))
+    try:
+        for mode in args.modes:
+            server = start_server(file, args.port, "--mode", mode)
+            try:
+                for clients in args.clients:
+                    latencies, elapsed, failures = asyncio.run(load(args.port, clients, args.requests, args.customers, args.stall, args.timeout))
+                    print("{:>10} {:>8} {:>10.1f} {:>10.2f} {:>10.2f} {:>8}".format(
+                        mode, clients, len(latencies) / elapsed,
+                        percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, failures))
+            finally:
+                stop_server(server)
+    finally:
+        remove_files(file)
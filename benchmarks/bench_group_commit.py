@@ -0,0 +1,70 @@
+"""
+Write throughput and latency of concurrent writers against the group
+commit window, with fsync on every flush. "off" flushes each write on
+its own, as without group commit; 0 flushes whatever queued during the
+previous flush; a window waits that many milliseconds for more writers.
+
+    python -m benchmarks.bench_group_commit --windows off 0 1 2 5 --clients 32
+    python -m benchmarks.bench_group_commit --durability rewrite --customers 10000
+"""
+
+import time
+import random
+import argparse
+import multiprocessing
+from typing import List, Tuple
+from Client.database_client import Client
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server, percentile
+
+def worker(args: Tuple) -> Tuple[float, List[float]]:
+    """Update random customers from one process
+    :param args: The port, the customer count and the write count
+    :return: The elapsed seconds and the write latencies
+    """
+
+    port, customers, writes = args
+    rnd = random.Random()
+    client = Client("localhost", port, session=True)
+    client.connect()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(writes):
+        sent = time.perf_counter()
+        client.send_command("update_age", customer_name(rnd.randrange(customers)), rnd.randint(18, 90))
+        client.get_server_response()
+        latencies.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    return elapsed, latencies
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", nargs="+", default=["off", "0", "1", "2", "5"], help="Commit windows in milliseconds, off for none")
+    parser.add_argument("--batch", type=int, default=1000, help="The writes that flush a commit without waiting for its window")
+    parser.add_argument("--durability", choices=("wal", "rewrite"), default="wal")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--port", type=int, default=9890)
+    args = parser.parse_args()
+
+    print("{:>8} {:>10} {:>10} {:>10}".format("window", "writes/s", "p50 ms", "p99 ms"))
+    with multiprocessing.Pool(args.clients) as pool:
+        for window in args.windows:
+            file = temp_file()
+            write_customers(file, args.customers)
+
+            extra = [] if window == "off" else ["--commit-window", window, "--commit-batch", str(args.batch)]
+            server = start_server(file, args.port, "--mode", "threaded", "--workers", str(args.clients), "--durability", args.durability, "--fsync", "always", *extra)
+            try:
+                results = pool.map(worker, [(args.port, args.customers, args.writes)] * args.clients)
+
+                throughput = args.clients * args.writes / max(elapsed for elapsed, _ in results)
+                latencies = [latency for _, samples in results for latency in samples]
+                print("{:>8} {:>10.0f} {:>10.2f} {:>10.2f}".format(window, throughput, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+            finally:
+                stop_server(server)
+                remove_files(file, file + ".log", file + ".log.1")
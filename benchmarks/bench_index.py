@@ -0,0 +1,57 @@
+"""
+Maintained sorted index versus sorting the customer names on every call:
+ordered walks, first report pages, prefix queries and insert cost.
+
+    python -m benchmarks.bench_index --sizes 10000 100000 1000000
+"""
+
+import time
+import argparse
+from typing import Callable
+from Server.index import SortedIndex
+from benchmarks.common import customer_name
+
+def timed(function: Callable, repeat: int) -> float:
+    """Time a function
+    :param function: The function
+    :param repeat: The number of calls
+    :return: The mean time per call in microseconds
+    """
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:>10} {:>22} {:>14} {:>14}".format("customers", "operation", "sort/call us", "index us"))
+    for size in args.sizes:
+        # Insert in scrambled order
+        names = [customer_name((i * 7919) % size) for i in range(size)]
+        table = dict.fromkeys(names)
+        index = SortedIndex(names)
+        prefix = customer_name(size // 2)[:-2]
+
+        rows = [
+            ("full ordered walk", lambda: sorted(table), lambda: list(index)),
+            ("first page of 100", lambda: sorted(table)[:100], lambda: index.after(None, 100)),
+            ("page after cursor", lambda: [n for n in sorted(table) if n > prefix][:100], lambda: index.after(prefix, 100)),
+            ("prefix query", lambda: [n for n in sorted(table) if n.startswith(prefix)], lambda: index.prefix(prefix)),
+        ]
+        for operation, baseline, indexed in rows:
+            print("{:>10} {:>22} {:>14.1f} {:>14.1f}".format(size, operation, timed(baseline, args.repeat), timed(indexed, args.repeat)))
+
+        # Insert and delete cost of keeping the index
+        fresh = ["New{:08d}".format(i) for i in range(1000)]
+        start = time.perf_counter()
+        for name in fresh:
+            index.add(name)
+        for name in fresh:
+            index.discard(name)
+        print("{:>10} {:>22} {:>14} {:>14.1f}".format(size, "add + discard", "-", (time.perf_counter() - start) / len(fresh) * 1e6))
@@ -0,0 +1,78 @@
+"""
+Startup load time and peak RSS: the original readlines + rewrite path
+against the streaming loader and the parallel loader, each in a fresh
+process.
+
+    python -m benchmarks.bench_load --sizes 1000000 --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from Server.database import Database
+from Server.loader import peak_rss
+from benchmarks.common import write_customers, temp_file, remove_files
+
+def legacy_load(file: str) -> None:
+    """The startup path before the loader: read every line, add one by one, rewrite the file
+    :param file: The database file
+    """
+
+    empty = temp_file()
+    try:
+        database = Database(empty)
+        database.fName = file
+
+        with open(file) as f:
+            lines = f.readlines()
+            for line in lines:
+                customer = Database.process_line(line)
+                if customer != None:
+                    database.add_customer(customer, False)
+        database.update_file()
+    finally:
+        remove_files(empty)
+
+def child(mode: str, file: str, workers: int) -> None:
+    """Load the file once and print the measurements as JSON
+    :param mode: legacy, streaming or parallel
+    :param file: The database file
+    :param workers: The parallel loader processes
+    """
+
+    start = time.perf_counter()
+    if mode == "legacy":
+        legacy_load(file)
+    else:
+        Database(file, load_workers=workers if mode == "parallel" else 1).close()
+    print(json.dumps({"seconds": time.perf_counter() - start, "rss": peak_rss()}))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.workers)
+        sys.exit()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print("{:>10} {:>10} {:>10} {:>12}".format("customers", "loader", "seconds", "peak MB"))
+    for size in args.sizes:
+        file = temp_file()
+        try:
+            write_customers(file, size)
+            print("{:>10} {:>10} {:>10} {:>12}".format(size, "file MB", "", "{:.1f}".format(os.path.getsize(file) / 2 ** 20)))
+            for mode in ("legacy", "streaming", "parallel"):
+                output = subprocess.run([sys.executable, "-m", "benchmarks.bench_load", "--workers", str(args.workers), "--child", mode, file],
+                                        cwd=root, capture_output=True, text=True, check=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print("{:>10} {:>10} {:>10.2f} {:>12.1f}".format(size, mode, result["seconds"], result["rss"] / 2 ** 20))
+        finally:
+            remove_files(file)
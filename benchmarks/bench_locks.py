@@ -0,0 +1,102 @@
+"""
+Parallel updates of different customers in one process, one lock against
+lock stripes, with the contention the database metrics recorded. Threads
+only overlap on a free-threaded build (python3.13t -X gil=0); with the GIL
+the stripes mostly show their overhead.
+
+    python -m benchmarks.bench_locks --threads 1 4 16 --stripes 0 64
+    python -m benchmarks.bench_locks --reports --commit-window 1
+"""
+
+import sys
+import time
+import random
+import argparse
+import threading
+from typing import List
+from Server.database import Database
+from Server.wal import WriteAheadLog
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files
+
+def updater(database: Database, customers: int, updates: int, seed: int) -> None:
+    """Update random customers
+    :param database: The database
+    :param customers: The customer count
+    :param updates: The update count
+    :param seed: The random seed
+    """
+
+    rnd = random.Random(seed)
+    for _ in range(updates):
+        name = customer_name(rnd.randrange(customers))
+        if rnd.random() < 0.5:
+            database.update_age(name, rnd.randint(18, 90))
+        else:
+            database.update_phone(name, "555 {:03d}-{:04d}".format(rnd.randrange(1000), rnd.randrange(10000)))
+
+def reporter(database: Database, running: threading.Event, reports: List[int]) -> None:
+    """Run full reports until stopped, they take the whole lock to open their snapshot
+    :param database: The database
+    :param running: Set while the updates run
+    :param reports: The count of reports
+    """
+
+    while running.is_set():
+        for _ in database.iter_report():
+            pass
+        reports[0] += 1
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--stripes", type=int, nargs="+", default=[0, 64])
+    parser.add_argument("--updates", type=int, default=20000, help="Updates per thread")
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--indexes", nargs="*", default=["phone"], help="Secondary indexes, moved under their own lock")
+    parser.add_argument("--commit-window", type=float, help="Group commit window in milliseconds, else the log is appended in place")
+    parser.add_argument("--reports", action="store_true", help="Run full reports alongside")
+    args = parser.parse_args()
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print("Python {}, GIL {}".format(sys.version.split()[0], "enabled" if gil else "disabled"))
+
+    file = temp_file()
+    write_customers(file, args.customers)
+    print("{:>8} {:>8} {:>12} {:>10} {:>10} {:>12} {:>10}".format("threads", "stripes", "updates/s", "lock cont", "stripe cont", "wait p99 ms", "reports"))
+    try:
+        for threads in args.threads:
+            for stripes in args.stripes:
+                database = Database(file, durability=Database.WAL, fsync=WriteAheadLog.FSYNC_NEVER, indexes=args.indexes,
+                                    commit_window=args.commit_window, lock_stripes=stripes)
+                running = threading.Event()
+                running.set()
+                reports = [0]
+                background = threading.Thread(target=reporter, args=(database, running, reports)) if args.reports else None
+                if background is not None:
+                    background.start()
+
+                workers = [threading.Thread(target=updater, args=(database, args.customers, args.updates, i)) for i in range(threads)]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+
+                running.clear()
+                if background is not None:
+                    background.join()
+
+                # The waits on the whole lock and on the stripes
+                metrics = database.metrics
+                with metrics.lock:
+                    counters = metrics.totals()
+                waits = [metrics.steps[step].quantile(0.99) for step in ("lock_wait", "stripe_wait") if step in metrics.steps]
+                print("{:>8} {:>8} {:>12.0f} {:>10} {:>10} {:>12.3f} {:>10}".format(
+                    threads, stripes, threads * args.updates / elapsed, counters["lock_contended"],
+                    counters["stripe_contended"], 1000 * max(waits, default=0), reports[0]))
+                database.close()
+                remove_files(file + ".log", file + ".log.1")
+    finally:
+        remove_files(file, file + ".log", file + ".log.1")
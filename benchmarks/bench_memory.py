@@ -0,0 +1,45 @@
+"""
+Bytes per customer held by each in-memory record layout, including the
+name index.
+
+    python -m benchmarks.bench_memory --sizes 1000000 10000000
+"""
+
+import argparse
+import tracemalloc
+from Server.database import Database
+from Server.records import ENGINES
+from benchmarks.common import customer, temp_file, remove_files
+
+def measure(engine: str, size: int) -> float:
+    """Fill a database and measure what it retains
+    :param engine: The storage engine
+    :param size: The number of customers
+    :return: The bytes per customer
+    """
+
+    file = temp_file()
+    try:
+        tracemalloc.start()
+        database = Database(file, engine=engine)
+        for i in range(size):
+            database.add_customer(customer(i), False)
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        database.close()
+        return retained / size
+    finally:
+        remove_files(file)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>16}".format("customers", "engine", "bytes/customer"))
+    for size in args.sizes:
+        for engine in args.engines:
+            print("{:>10} {:>10} {:>16.1f}".format(size, engine, measure(engine, size)))
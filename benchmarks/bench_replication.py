@@ -0,0 +1,128 @@
+"""
+Read throughput as replicas are added, with reader processes spreading
+their find_customer calls over the replicas, then the replication lag
+under a burst of writes on the primary.
+
+    python -m benchmarks.bench_replication --replicas 0 1 2 4 --readers 8
+"""
+
+import time
+import random
+import argparse
+import multiprocessing
+from typing import Dict, List, Tuple
+from Client.database_client import Client
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server
+
+def status(port: int) -> Dict[str, str]:
+    """Get the replication status of a server
+    :param port: The server port
+    :return: The status fields
+    """
+
+    client = Client("localhost", port, session=True)
+    client.connect()
+    client.send_command("replication")
+    response = client.get_server_response()
+    client.close()
+    return dict(pair.split("=", 1) for pair in response.split())
+
+def wait_caught_up(ports: List[int], timeout: float = 120) -> None:
+    """Wait until replicas have applied everything they know of
+    :param ports: The replica ports
+    :param timeout: The seconds to wait
+    """
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        states = [status(port) for port in ports]
+        if all(state["state"] == "streaming" and state["lag"] == "0" for state in states):
+            return
+        time.sleep(0.1)
+
+    raise RuntimeError("Replicas did not catch up")
+
+def reader(args: Tuple) -> float:
+    """Run lookups from one process
+    :param args: The primary port, the replica ports, the customer count and the number of lookups
+    :return: The elapsed seconds
+    """
+
+    port, replicas, customers, count = args
+    rnd = random.Random()
+    client = Client("localhost", port, session=True, replicas=[("localhost", replica) for replica in replicas])
+    client.connect()
+
+    start = time.perf_counter()
+    for _ in range(count):
+        client.lookup(customer_name(rnd.randrange(customers)))
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    return elapsed
+
+def writer_lag(port: int, replicas: List[int], customers: int, writes: int) -> float:
+    """Update customers on the primary while sampling the replica lag
+    :param port: The primary port
+    :param replicas: The replica ports
+    :param customers: The customer count
+    :param writes: The number of updates
+    :return: The largest lag seen, in events
+    """
+
+    client = Client("localhost", port, session=True)
+    client.connect()
+    rnd = random.Random(0)
+
+    worst = 0
+    for i in range(writes):
+        client.send_command("update_age", customer_name(rnd.randrange(customers)), rnd.randint(18, 90))
+        client.get_server_response()
+        if i % 500 == 0:
+            worst = max([worst] + [int(status(replica)["lag"]) for replica in replicas])
+
+    client.close()
+    return worst
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--port", type=int, default=9970)
+    args = parser.parse_args()
+
+    file = temp_file()
+    write_customers(file, args.customers)
+    files = [temp_file() for _ in range(max(args.replicas))]
+    servers = []
+
+    try:
+        # The primary logs its writes so that the lag test measures replication, not file rewrites
+        servers.append(start_server(file, args.port, "--mode", "threaded", "--durability", "wal", "--fsync", "never"))
+        primary = "localhost:{}".format(args.port)
+
+        print("{:>9} {:>12} {:>10}".format("replicas", "lookups/s", "max lag"))
+        ports = []
+        with multiprocessing.Pool(args.readers) as pool:
+            for count in args.replicas:
+                # Add replicas up to the count
+                while len(ports) < count:
+                    port = args.port + 1 + len(ports)
+                    servers.append(start_server(files[len(ports)], port, "--mode", "threaded", "--primary", primary))
+                    ports.append(port)
+                wait_caught_up(ports)
+
+                # Readers spread over the replicas, or all on the primary
+                elapsed = pool.map(reader, [(args.port, ports, args.customers, args.lookups)] * args.readers)
+                throughput = args.readers * args.lookups / max(elapsed)
+
+                lag = writer_lag(args.port, ports, args.customers, args.writes) if ports else 0
+                print("{:>9} {:>12.0f} {:>10}".format(count, throughput, lag))
+    finally:
+        for server in servers:
+            stop_server(server)
+        remove_files(file, file + ".log", file + ".log.1", *files)
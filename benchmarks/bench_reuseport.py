@@ -0,0 +1,107 @@
+"""
+Throughput of a lookup/update mix on one port served by 1 to N reader
+processes with SO_REUSEPORT, following one writer process. Each update
+is read back on the same connection, counting any stale read so that
+the read-your-writes guarantee is checked under load.
+
+    python -m benchmarks.bench_reuseport --processes 1 2 4 --clients 16
+"""
+
+import os
+import time
+import random
+import argparse
+import multiprocessing
+from typing import List, Tuple
+from Client.database_client import Client
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server, percentile
+
+def wait_caught_up(port: int, timeout: float = 120) -> None:
+    """Wait until the readers reached by new connections have loaded the writer's data
+    :param port: The server port
+    :param timeout: The seconds to wait
+    """
+
+    deadline = time.time() + timeout
+    ready = 0
+    while time.time() < deadline:
+        # Successive connections land on different readers
+        client = Client("localhost", port, session=True)
+        client.connect()
+        client.send_command("replication")
+        status = dict(pair.split("=", 1) for pair in client.get_server_response().split())
+        client.close()
+
+        ready = ready + 1 if status["role"] == "primary" or (status["state"] == "streaming" and status["lag"] == "0") else 0
+        if ready >= 32:
+            return
+        time.sleep(0.01)
+
+    raise RuntimeError("Readers did not catch up")
+
+def worker(args: Tuple) -> Tuple[float, int, List[float]]:
+    """Run the operation mix from one process
+    :param args: The port, the customer count, the request count and the update ratio
+    :return: The elapsed seconds, the stale reads and the update latencies
+    """
+
+    port, customers, requests, updates = args
+    rnd = random.Random()
+    client = Client("localhost", port, session=True)
+    client.connect()
+
+    stale = 0
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        name = customer_name(rnd.randrange(customers))
+        if rnd.random() < updates:
+            # Write, then read it back on the same connection
+            age = rnd.randint(18, 90)
+            sent = time.perf_counter()
+            client.send_command("update_age", name, age)
+            client.get_server_response()
+            latencies.append(time.perf_counter() - sent)
+
+            client.send_command("find_customer", name)
+            if client.get_server_response().split("|")[1] != str(age):
+                stale += 1
+        else:
+            client.send_command("find_customer", name)
+            client.get_server_response()
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    return elapsed, stale, latencies
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count()}))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--updates", type=float, default=0.1)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--port", type=int, default=9880)
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>14} {:>8}".format("processes", "requests/s", "update p99 ms", "stale"))
+    with multiprocessing.Pool(args.clients) as pool:
+        for processes in args.processes:
+            file = temp_file()
+            write_customers(file, args.customers)
+
+            # One process serves everything, or readers share the port
+            extra = ["--processes", str(processes)] if processes > 1 else []
+            server = start_server(file, args.port, "--mode", "threaded", "--durability", "wal", "--fsync", "never", *extra)
+            try:
+                wait_caught_up(args.port)
+                results = pool.map(worker, [(args.port, args.customers, args.requests, args.updates)] * args.clients)
+
+                throughput = args.clients * args.requests / max(elapsed for elapsed, _, _ in results)
+                latencies = [latency for _, _, samples in results for latency in samples]
+                stale = sum(count for _, count, _ in results)
+                print("{:>10} {:>12.0f} {:>14.2f} {:>8}".format(processes, throughput, percentile(latencies, 99) * 1000, stale))
+            finally:
+                stop_server(server)
+                remove_files(file, file + ".log", file + ".log.1")
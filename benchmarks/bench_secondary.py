@@ -0,0 +1,79 @@
+"""
+Memory cost and query latency of the secondary indexes on age, address
+and phone, against a full scan of the table.
+
+    python -m benchmarks.bench_secondary --sizes 10000 100000 1000000
+"""
+
+import time
+import random
+import argparse
+import tracemalloc
+from typing import Callable
+from Server.database import Database
+from benchmarks.common import write_customers, customer, temp_file, remove_files
+
+def load(file: str, indexes) -> tuple:
+    """Load a database and measure the memory it holds
+    :param file: The database file
+    :param indexes: The indexed fields
+    :return: The database and its traced size in bytes
+    """
+
+    tracemalloc.start()
+    database = Database(file, Database.WAL, indexes=indexes)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return database, size
+
+def timed(function: Callable, repeat: int) -> float:
+    """Time a function
+    :param function: The function
+    :param repeat: The number of calls
+    :return: The mean time per call in microseconds
+    """
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        file = temp_file()
+        try:
+            write_customers(file, size)
+
+            plain, plainBytes = load(file, ())
+            plain.close()
+            database, indexedBytes = load(file, list(Database.FIELDS))
+            print("{} customers: {:.1f} bytes/customer without indexes, {:.1f} with age/address/phone indexes".format(
+                size, plainBytes / size, indexedBytes / size))
+
+            # Query values taken from existing customers
+            sample = customer(random.randrange(size))
+            table = database.database
+            scans = {
+                "phone": lambda: sorted(n for n, r in table.items() if r[2] == sample[3]),
+                "address": lambda: sorted(n for n, r in table.items() if r[1] == sample[2]),
+                "age 30-40": lambda: sorted((r[0], n) for n, r in table.items() if 30 <= r[0] <= 40)[:100],
+            }
+            lookups = {
+                "phone": lambda: database.find_by_phone(sample[3]),
+                "address": lambda: database.find_by_address(sample[2]),
+                "age 30-40": lambda: database.find_by_age(30, 40, 100),
+            }
+
+            print("{:>12} {:>14} {:>14}".format("query", "scan us", "index us"))
+            for query in scans:
+                print("{:>12} {:>14.1f} {:>14.1f}".format(query, timed(scans[query], args.repeat), timed(lookups[query], args.repeat)))
+            database.close()
+        finally:
+            remove_files(file, file + ".log")
@@ -0,0 +1,90 @@
+"""
+Per-request latency of one connection per command versus a persistent
+session on loopback.
+
+    python -m benchmarks.bench_session --requests 5000
+"""
+
+import time
+import random
+import socket
+import argparse
+from typing import List
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server, percentile
+
+def read_frame(f) -> bytes:
+    """Read a framed session response
+    :param f: The socket file
+    :return: The payload
+    """
+
+    return f.read(int(f.readline()))
+
+def one_shot(port: int, names: List[str]) -> List[float]:
+    """Send each query on a new connection
+    :param port: The server port
+    :param names: The customers to find
+    :return: The latencies in seconds
+    """
+
+    latencies = []
+    for name in names:
+        start = time.perf_counter()
+        with socket.create_connection(("localhost", port)) as sock:
+            sock.sendall("find_customer\n{}\n".format(name).encode())
+            while sock.recv(4096):
+                pass
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+def session(port: int, names: List[str]) -> List[float]:
+    """Send all queries on one session
+    :param port: The server port
+    :param names: The customers to find
+    :return: The latencies in seconds
+    """
+
+    latencies = []
+    with socket.create_connection(("localhost", port)) as sock:
+        f = sock.makefile("rb")
+        sock.sendall(b"session\n")
+        read_frame(f)
+
+        for name in names:
+            start = time.perf_counter()
+            sock.sendall("find_customer\n{}\n".format(name).encode())
+            read_frame(f)
+            latencies.append(time.perf_counter() - start)
+
+        sock.sendall(b"end\n")
+
+    return latencies
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["single", "threaded", "async"])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--port", type=int, default=9990)
+    args = parser.parse_args()
+
+    file = temp_file()
+    write_customers(file, args.customers)
+    names = [customer_name(random.randrange(args.customers)) for _ in range(args.requests)]
+
+    print("{:>10} {:>10} {:>10} {:>10} {:>10}".format("mode", "protocol", "mean us", "p50 us", "p99 us"))
+    try:
+        for mode in args.modes:
+            server = start_server(file, args.port, "--mode", mode)
+            try:
+                for protocol, run in (("one-shot", one_shot), ("session", session)):
+                    latencies = run(args.port, names)
+                    print("{:>10} {:>10} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                        mode, protocol, sum(latencies) / len(latencies) * 1e6,
+                        percentile(latencies, 50) * 1e6, percentile(latencies, 99) * 1e6))
+            finally:
+                stop_server(server)
+    finally:
+        remove_files(file)
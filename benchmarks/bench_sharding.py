@@ -0,0 +1,86 @@
+"""
+Throughput of a lookup/update mix as the customers are sharded over
+1 to N server processes, with client processes using ShardedClient.
+
+    python -m benchmarks.bench_sharding --shards 1 2 4 8 --clients 16
+"""
+
+import os
+import glob
+import time
+import socket
+import random
+import argparse
+import multiprocessing
+from typing import Tuple
+from Client.sharded_client import ShardedClient
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files, start_server, stop_server
+
+def wait_port(port: int, timeout: float = 60) -> None:
+    """Wait until a port accepts connections
+    :param port: The port
+    :param timeout: The seconds to wait
+    """
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+    raise RuntimeError("Shard on port {} did not start".format(port))
+
+def worker(args: Tuple) -> float:
+    """Run the operation mix from one process
+    :param args: The first port, the shard count, the customer count, the request count and the update ratio
+    :return: The elapsed seconds
+    """
+
+    port, shards, customers, requests, updates = args
+    rnd = random.Random()
+    client = ShardedClient([("localhost", port + i) for i in range(shards)])
+    client.connect()
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        name = customer_name(rnd.randrange(customers))
+        if rnd.random() < updates:
+            client.send_command("update_age", name, rnd.randint(18, 90))
+        else:
+            client.send_command("find_customer", name)
+        client.get_server_response()
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    return elapsed
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count()}))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--updates", type=float, default=0.2)
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--port", type=int, default=9900)
+    args = parser.parse_args()
+
+    print("{:>7} {:>12}".format("shards", "requests/s"))
+    with multiprocessing.Pool(args.clients) as pool:
+        for shards in args.shards:
+            file = temp_file()
+            write_customers(file, args.customers)
+
+            # The first process splits the file and starts the other shards
+            server = start_server(file, args.port, "--mode", "threaded", "--durability", "wal", "--fsync", "never", "--shards", str(shards))
+            try:
+                for i in range(1, shards):
+                    wait_port(args.port + i)
+
+                elapsed = pool.map(worker, [(args.port, shards, args.customers, args.requests, args.updates)] * args.clients)
+                print("{:>7} {:>12.0f}".format(shards, args.clients * args.requests / max(elapsed)))
+            finally:
+                stop_server(server)
+                remove_files(file, *glob.glob(file + ".shard*"))
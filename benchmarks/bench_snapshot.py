@@ -0,0 +1,146 @@
+"""
+Stress test of snapshot reads: full reports run back to back while writer
+processes change groups of customers atomically with update_many, add_many
+and delete_many. A report from a point-in-time view never shows a group
+half updated or half added, so every torn group is counted. Writer
+latency is measured with and without the reports running.
+
+    python -m benchmarks.bench_snapshot --groups 20000 --writers 8 --duration 10
+"""
+
+import time
+import random
+import argparse
+import threading
+import multiprocessing
+from typing import Dict, List, Tuple
+from Client.database_client import Client
+from benchmarks.common import temp_file, remove_files, start_server, stop_server, percentile
+
+def member(prefix: str, group: int, index: int) -> str:
+    """Get the name of a group member
+    :param prefix: Group for the groups of the file, Extra for the ones added and deleted
+    :param group: The group index
+    :param index: The member index
+    :return: The customer name
+    """
+
+    return "{}{:07d}-{:02d}".format(prefix, group, index)
+
+def writer(args: Tuple) -> List[float]:
+    """Change whole groups until the end of the run
+    :param args: The port, the group count, the group size, the extra groups and the seconds to run
+    :return: The write latencies
+    """
+
+    port, groups, size, extras, duration = args
+    rnd = random.Random()
+    client = Client("localhost", port, session=True)
+    client.connect()
+
+    latencies = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        sent = time.perf_counter()
+        if rnd.random() < 0.8:
+            # Give every member of a group the same new age
+            group, age = rnd.randrange(groups), rnd.randint(18, 90)
+            client.call("update_many", *[field for i in range(size) for field in (member("Group", group, i), "age", age)])
+        else:
+            # Add or delete a whole extra group
+            group = rnd.randrange(extras)
+            if rnd.random() < 0.5:
+                client.call("add_many", *[field for i in range(size) for field in (member("Extra", group, i), 1, "1 Extra St", "555 000-0000")])
+            else:
+                client.call("delete_many", *[member("Extra", group, i) for i in range(size)])
+        latencies.append(time.perf_counter() - sent)
+
+    client.close()
+    return latencies
+
+def check_report(report: str, size: int) -> Tuple[int, int]:
+    """Count the groups a report shows torn
+    :param report: The report
+    :param size: The group size
+    :return: The customers and the torn groups
+    """
+
+    ages: Dict[str, set] = {}
+    members: Dict[str, int] = {}
+    customers = 0
+    for line in report.split("\n"):
+        if not line:
+            continue
+        name, age = line.split("|", 2)[:2]
+        group = name.rsplit("-", 1)[0]
+        ages.setdefault(group, set()).add(age)
+        members[group] = members.get(group, 0) + 1
+        customers += 1
+
+    torn = sum(1 for group in members if members[group] != size or (group.startswith("Group") and len(ages[group]) != 1))
+    return customers, torn
+
+def run_writers(pool: multiprocessing.Pool, port: int, duration: float) -> List[float]:
+    """Run the writers for a while
+    :param pool: The writer processes
+    :param port: The server port
+    :param duration: The seconds to run
+    :return: The write latencies
+    """
+
+    results = pool.map(writer, [(port, args.groups, args.size, args.extras, duration)] * args.writers)
+    return [latency for latencies in results for latency in latencies]
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=7, help="Customers per group")
+    parser.add_argument("--extras", type=int, default=20, help="Groups added and deleted by the writers")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=9895)
+    parser.add_argument("server_args", nargs="*", help="Extra server.py arguments, after --")
+    args = parser.parse_args()
+
+    # Groups of customers sharing an age
+    file = temp_file()
+    with open(file, "w") as f:
+        for group in range(args.groups):
+            for i in range(args.size):
+                f.write("{}|30|{} Main St|555 000-0000\n".format(member("Group", group, i), group))
+
+    server = start_server(file, args.port, "--mode", "threaded", "--durability", "wal", "--fsync", "never", *args.server_args)
+    try:
+        with multiprocessing.Pool(args.writers) as pool:
+            # Writers alone
+            quiet = run_writers(pool, args.port, args.duration)
+
+            # Writers while reports run back to back
+            reports: List[Tuple[float, int, int]] = []
+            running = threading.Event()
+            running.set()
+
+            def reporter() -> None:
+                """Run full reports until stopped"""
+
+                while running.is_set():
+                    start = time.perf_counter()
+                    report = Client("localhost", args.port).call("print_report")
+                    reports.append((time.perf_counter() - start,) + check_report(report, args.size))
+
+            thread = threading.Thread(target=reporter)
+            thread.start()
+            busy = run_writers(pool, args.port, args.duration)
+            running.clear()
+            thread.join()
+    finally:
+        stop_server(server)
+        remove_files(file, file + ".log", file + ".log.1")
+
+    print("{:>16} {:>10} {:>10} {:>10}".format("writers", "writes/s", "p50 ms", "p99 ms"))
+    for label, latencies in (("alone", quiet), ("during reports", busy)):
+        print("{:>16} {:>10.0f} {:>10.2f} {:>10.2f}".format(label, len(latencies) / args.duration, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+    print("Reports: {}, mean {:.2f} s, {:.0f} customers, torn groups {}".format(
+        len(reports), sum(seconds for seconds, _, _ in reports) / max(1, len(reports)),
+        sum(customers for _, customers, _ in reports) / max(1, len(reports)), sum(torn for _, _, torn in reports)))
@@ -0,0 +1,56 @@
+"""
+Compares mutations per second of the full-file rewrite path and the
+append-only log at several table sizes.
+
+    python -m benchmarks.bench_wal --sizes 10000 100000 1000000
+"""
+
+import time
+import argparse
+from Server.database import Database
+from Server.wal import WriteAheadLog
+from benchmarks.common import write_customers, customer_name, temp_file, remove_files
+
+def run(size: int, durability: str, fsync: str, budget: float, limit: int) -> float:
+    """Run update_age mutations against a database of a given size
+    :param size: The number of customers
+    :param durability: The durability mode
+    :param fsync: The log fsync policy
+    :param budget: The time budget in seconds
+    :param limit: The maximum number of mutations
+    :return: The mutations per second
+    """
+
+    file = temp_file()
+    try:
+        write_customers(file, size)
+        database = Database(file, durability, fsync)
+
+        # Mutate until the budget or the limit runs out
+        count = 0
+        start = time.perf_counter()
+        while count < limit and time.perf_counter() - start < budget:
+            database.update_age(customer_name(count % size), count % 100)
+            count += 1
+        elapsed = time.perf_counter() - start
+
+        database.close()
+        return count / elapsed
+    finally:
+        remove_files(file, file + ".log", file + ".log.1", file + ".tmp")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--budget", type=float, default=5.0, help="Seconds per run")
+    parser.add_argument("--limit", type=int, default=100000, help="Maximum mutations per run")
+    args = parser.parse_args()
+
+    print("{:>10} {:>24} {:>14}".format("customers", "mode", "mutations/s"))
+    for size in args.sizes:
+        modes = [(Database.REWRITE, None)] + [(Database.WAL, policy) for policy in WriteAheadLog.FSYNC_POLICIES]
+        for durability, fsync in modes:
+            rate = run(size, durability, fsync or WriteAheadLog.FSYNC_ALWAYS, args.budget, args.limit)
+            mode = durability if fsync is None else "{} (fsync={})".format(durability, fsync)
+            print("{:>10} {:>24} {:>14.1f}".format(size, mode, rate))
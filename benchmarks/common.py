@@ -0,0 +1,114 @@
+
+
+import os
+import sys
+import time
+import socket
+import random
+import tempfile
+import subprocess
+from typing import List
+
+# Sample values for generated customers
+STREETS: List[str] = ["Main St", "Oak Ave", "Maple Rd", "Cedar Ln", "Pine Blvd", "Elm Dr"]
+CITIES: List[str] = ["Montreal", "Toronto", "Ottawa", "Quebec", "Laval", "Gatineau"]
+
+def customer_name(i: int) -> str:
+    """Get the name of the i-th generated customer
+    :param i: The customer index
+    :return: The customer name
+    """
+
+    return "Customer{:08d}".format(i)
+
+def customer(i: int) -> List:
+    """Generate a customer record
+    :param i: The customer index
+    :return: The customer data [name, age, address, phone]
+    """
+
+    rnd = random.Random(i)
+    address = "{} {}, {}".format(rnd.randint(1, 9999), rnd.choice(STREETS), rnd.choice(CITIES))
+    phone = "{:03d} {:03d}-{:04d}".format(rnd.randint(200, 999), rnd.randint(200, 999), rnd.randint(0, 9999))
+    return [customer_name(i), rnd.randint(18, 90), address, phone]
+
+def write_customers(file: str, count: int) -> None:
+    """Write a database file with generated customers
+    :param file: The database file
+    :param count: The number of customers
+    """
+
+    with open(file, "w") as f:
+        for i in range(count):
+            f.write("{}|{}|{}|{}\n".format(*customer(i)))
+
+def temp_file(suffix: str = ".txt") -> str:
+    """Create an empty temporary file
+    :param suffix: The file suffix
+    :return: The file path
+    """
+
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return path
+
+def remove_files(*files: str) -> None:
+    """Remove files, ignoring missing ones
+    :param files: The files to remove
+    """
+
+    for file in files:
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+
+def start_server(file: str, port: int, *args: str) -> subprocess.Popen:
+    """Start server.py in a subprocess and wait until it accepts connections
+    :param file: The database file
+    :param port: The server port
+    :param args: Extra server.py arguments
+    :return: The server process
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, os.path.join(root, "server.py"), file, "--port", str(port)] + list(args),
+                               cwd=root, stdout=subprocess.DEVNULL)
+
+    # Poll the port
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited with code {}".format(process.returncode))
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+
+    process.kill()
+    raise RuntimeError("Server did not start")
+
+def stop_server(process: subprocess.Popen) -> None:
+    """Stop a server started by start_server
+    :param process: The server process
+    """
+
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def percentile(samples: List[float], p: float) -> float:
+    """Get a percentile of samples
+    :param samples: The samples
+    :param p: The percentile (0 to 100)
+    :return: The value at the percentile
+    """
+
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
@@ -0,0 +1,130 @@
+
+
+from typing import Dict, List, Tuple
+
+class Histogram:
+    """Integer value histogram with bounded relative error, in the bucket layout of HdrHistogram.
+
+    Values below the sub-bucket count are kept exactly; above, each power of two is split into
+    half that many sub-buckets, so every value is recorded within 10 ** -significant_figures.
+    """
+
+    # Percentiles summarized by default
+    percentiles: Tuple = (50, 75, 90, 95, 99, 99.9, 99.99, 100)
+
+    def __init__(self, significant_figures: int = 3) -> None:
+        """Initialize an empty histogram
+        :param significant_figures: The decimal digits of precision of recorded values
+        """
+
+        # Sub-buckets of the first bucket, a power of two covering the precision
+        self.subBucketBits: int = (2 * 10 ** significant_figures - 1).bit_length()
+        self.subBucketCount: int = 1 << self.subBucketBits
+        self.subBucketHalf: int = self.subBucketCount // 2
+
+        self.counts: Dict[int, int] = {}
+        self.total: int = 0
+        self.minimum: int = None
+        self.maximum: int = 0
+        self.sum: int = 0
+
+    def index(self, value: int) -> int:
+        """Get the bucket index of a value
+        :param value: The value, 0 or more
+        :return: The index
+        """
+
+        if value < self.subBucketCount:
+            return value
+
+        # The top bits of the value select the sub-bucket within its power of two
+        shift = value.bit_length() - self.subBucketBits
+        return self.subBucketCount + (shift - 1) * self.subBucketHalf + (value >> shift) - self.subBucketHalf
+
+    def value(self, index: int) -> int:
+        """Get the highest value of a bucket
+        :param index: The bucket index
+        :return: The highest value recorded in the bucket
+        """
+
+        if index < self.subBucketCount:
+            return index
+
+        shift, sub = divmod(index - self.subBucketCount, self.subBucketHalf)
+        return ((sub + self.subBucketHalf + 1) << (shift + 1)) - 1
+
+    def record(self, value: int, count: int = 1) -> None:
+        """Record a value
+        :param value: The value, negative values count as 0
+        :param count: The number of times it occurred
+        """
+
+        value = max(0, int(value))
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+
+        self.total += count
+        self.sum += value * count
+        self.maximum = max(self.maximum, value)
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+
+    def add(self, other: "Histogram") -> None:
+        """Merge the values of another histogram of the same precision
+        :param other: The other histogram
+        """
+
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+
+        self.total += other.total
+        self.sum += other.sum
+        self.maximum = max(self.maximum, other.maximum)
+        if other.minimum is not None:
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+
+    def percentile(self, p: float) -> int:
+        """Get the value at a percentile
+        :param p: The percentile (0 to 100)
+        :return: The highest value of the bucket reaching the percentile, 0 if empty
+        """
+
+        if not self.total:
+            return 0
+
+        # The rank of the percentile, at least the first value
+        rank = max(1, -int(-p * self.total // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.value(index), self.maximum)
+
+        return self.maximum
+
+    def mean(self) -> float:
+        """Get the mean value
+        :return: The mean, 0 if empty
+        """
+
+        return self.sum / self.total if self.total else 0.0
+
+    def buckets(self) -> List[List[int]]:
+        """Get the non-empty buckets
+        :return: The [highest value, count] of each bucket, in value order
+        """
+
+        return [[self.value(index), self.counts[index]] for index in sorted(self.counts)]
+
+    def summary(self) -> Dict:
+        """Summarize the histogram for a JSON report
+        :return: The count, the bounds, the mean, the percentiles and the buckets
+        """
+
+        return {
+            "count": self.total,
+            "min": self.minimum or 0,
+            "max": self.maximum,
+            "mean": round(self.mean(), 1),
+            "percentiles": {str(p): self.percentile(p) for p in Histogram.percentiles},
+            "buckets": self.buckets(),
+        }
@@ -5,15 +5,16 @@ Assignment 2
 """
 
 if __name__ == "__main__":
-    from Client.database_client import Client
+    from Client.api import DatabaseClient
+    from Client.menu import Menu
 
     # Set client address
     HOST: str = "localhost"
     PORT: int = 9999
-    client: Client = Client(HOST, PORT)
+    menu: Menu = Menu(DatabaseClient(HOST, PORT, pool_size=1))
 
     print("Welcome to the Client interface\n")
 
     #Loop until user quits
-    while client.active:
-        client.query()
\ No newline at end of file
+    while menu.active:
+        menu.query()
\ No newline at end of file
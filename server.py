@@ -2,21 +2,179 @@
 
 if __name__ == "__main__":
     
+    import os
     import sys
-    from Server.database_server import DatabaseServer, DatabaseHandler
+    import time
+    import signal
+    import argparse
+    import subprocess
+    from Server.database import Database
+    from Server.database_server import DatabaseServer, ThreadPoolDatabaseServer, DatabaseHandler
+    from Server.async_server import AsyncDatabaseServer
+    from Server.wal import WriteAheadLog
+    from Server.loader import peak_rss
+    from Server.storage import BACKENDS
+    from Server.sharding import split_file, shard_file
+    from Server.metrics import serve_metrics
+    from Server.admission import RateLimiter, ConnectionLimit
+
+    # Parse the command line
+    parser = argparse.ArgumentParser(description="Customer database server")
+    parser.add_argument("file", nargs="?", default="data.txt", help="The database file")
+    parser.add_argument("--host", default="localhost", help="The server host")
+    parser.add_argument("--port", type=int, default=9999, help="The server port")
+    parser.add_argument("--mode", choices=("single", "threaded", "async"), default="threaded", help="Serve with a thread pool, an asyncio loop or one connection at a time")
+    parser.add_argument("--workers", type=int, default=32, help="The worker threads for the threaded and async modes")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="Seconds a session may wait for its next command")
+    parser.add_argument("--read-timeout", type=float, default=10.0, help="Seconds a request may take to arrive once started, 0 for no limit")
+    parser.add_argument("--write-timeout", type=float, default=30.0, help="Seconds a client may take to read each response write, 0 for no limit")
+    parser.add_argument("--max-line", type=int, default=65536, help="Longest request line in bytes")
+    parser.add_argument("--max-request", type=int, default=64 * 1024 * 1024, help="Largest request in bytes, batches included")
+    parser.add_argument("--max-connections", type=int, default=0, help="Connections open at once before new ones are closed right away, 0 for no limit")
+    parser.add_argument("--max-client-connections", type=int, default=0, help="Connections open at once from one client host, 0 for no limit")
+    parser.add_argument("--queue-timeout", type=float, default=0, help="Seconds a request may wait for a worker before it is answered busy, 0 to wait")
+    parser.add_argument("--rate", type=float, default=0, help="Requests per second of each client host, 0 for no limit")
+    parser.add_argument("--burst", type=float, help="Requests a client host may send at once, the rate by default")
+    parser.add_argument("--durability", choices=(Database.REWRITE, Database.WAL), default=Database.REWRITE, help="Rewrite the file on each mutation or append to a log")
+    parser.add_argument("--fsync", choices=WriteAheadLog.FSYNC_POLICIES, default=WriteAheadLog.FSYNC_ALWAYS, help="The log fsync policy")
+    parser.add_argument("--fsync-interval", type=int, default=100, help="The log fsync interval in milliseconds")
+    parser.add_argument("--commit-window", type=float, help="Group commit: coalesce the writes arriving within this many milliseconds into one flush, 0 for those queued during the previous flush")
+    parser.add_argument("--commit-batch", type=int, default=1000, help="Group commit: the writes that flush a commit without waiting for its window")
+    parser.add_argument("--lock-stripes", type=int, default=64, help="Lock stripes updates of different customers run on in parallel with the log or group commit, 0 for one lock")
+    parser.add_argument("--compact-log-bytes", type=int, default=64 * 1024 * 1024, help="Snapshot once the log reaches this size")
+    parser.add_argument("--compact-dirty", type=int, default=100000, help="Snapshot once this many mutations were logged")
+    parser.add_argument("--indexes", nargs="*", choices=list(Database.FIELDS), default=[], help="Fields to index for lookups")
+    parser.add_argument("--engine", choices=("list", "tuple", "packed"), default="list", help="The in-memory record layout")
+    parser.add_argument("--backend", choices=["text"] + list(BACKENDS), default="text", help="The storage backend")
+    parser.add_argument("--primary", metavar="HOST:PORT", help="Serve as a read-only replica of this primary")
+    parser.add_argument("--shards", type=int, default=1, help="Partition the file by name over this many server processes on consecutive ports")
+    parser.add_argument("--shard-index", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--processes", type=int, default=1, help="Serve the port from this many reader processes with SO_REUSEPORT, following one writer process")
+    parser.add_argument("--writer-port", type=int, help="The local port of the writer process, the server port + 1 by default")
+    parser.add_argument("--process-role", choices=("writer", "reader"), help=argparse.SUPPRESS)
+    parser.add_argument("--process-index", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics over HTTP on this local port, the next ports for other shards or processes")
+    parser.add_argument("--load-workers", type=int, default=1, help="Processes parsing the database file at startup")
+    args = parser.parse_args()
+    if args.processes > 1 and (args.shards > 1 or args.primary):
+        parser.error("--processes cannot be combined with --shards or --primary")
+    if args.shards > 1 and args.backend != "text":
+        parser.error("--shards partitions the text file, it cannot be combined with --backend {}".format(args.backend))
 
     # Set the server address
-    HOST: str = "localhost"
-    PORT: int = 9999
+    HOST: str = args.host
+    PORT: int = args.port
+    FILE: str = args.file
+    OPTIONS = {"durability": args.durability, "fsync": args.fsync, "fsync_interval": args.fsync_interval,
+               "compact_log_bytes": args.compact_log_bytes, "compact_dirty": args.compact_dirty, "indexes": args.indexes,
+               "engine": args.engine, "load_workers": args.load_workers, "backend": args.backend,
+               "commit_window": args.commit_window, "commit_batch": args.commit_batch, "lock_stripes": args.lock_stripes}
+
+    # Serve one shard per process
+    SHARDS = []
+    if args.shards > 1:
+        if args.shard_index == 0:
+            # Partition the file, then start the other shards
+            split_file(FILE, args.shards)
+            SHARDS = [subprocess.Popen([sys.executable] + sys.argv + ["--shard-index", str(i)]) for i in range(1, args.shards)]
+
+            # Stop them with this process
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        PORT += args.shard_index
+        FILE = shard_file(FILE, args.shard_index)
+
+    # Replicate a primary
+    PRIMARY = None
+    if args.primary:
+        primary_host, _, primary_port = args.primary.rpartition(":")
+        PRIMARY = (primary_host or "localhost", int(primary_port))
+
+    # Share the port between reader processes following one writer process
+    FORWARD = False
+    if args.processes > 1:
+        WRITER = ("localhost", args.writer_port or PORT + 1)
+
+        if args.process_role is None:
+            # Start the writer and the readers, they stop together
+            command = [sys.executable] + sys.argv + ["--process-role"]
+            PROCESSES = [subprocess.Popen(command + ["writer"])] + [subprocess.Popen(command + ["reader", "--process-index", str(i)]) for i in range(args.processes)]
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            print("Processes: {} readers on {}:{}, writer on {}:{}".format(args.processes, HOST, PORT, *WRITER))
+            print("Server PID: {}".format(os.getpid()))
 
-    if len(sys.argv) > 1:
-        FILE = int(sys.argv[1])
+            try:
+                while all(process.poll() is None for process in PROCESSES):
+                    time.sleep(0.5)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                for process in PROCESSES:
+                    process.terminate()
+                for process in PROCESSES:
+                    process.wait()
+            sys.exit(0)
+
+        # Close the database cleanly when stopped
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        if args.process_role == "writer":
+            # The only process with the file, it serves the readers alone
+            HOST, PORT = WRITER
+            args.mode = "async"
+        else:
+            # Readers keep no file, they load from the writer and send it their writes
+            FILE = os.devnull
+            OPTIONS.update(durability=Database.REWRITE, backend="text", load_workers=1, commit_window=None)
+            PRIMARY = WRITER
+            FORWARD = True
+
+    # Create the server for the concurrency mode
+    if args.mode == "threaded":
+        server = ThreadPoolDatabaseServer(FILE, (HOST, PORT), DatabaseHandler, database_options=OPTIONS, workers=args.workers, primary=PRIMARY, forward_writes=FORWARD, reuse_port=FORWARD)
+    elif args.mode == "async":
+        server = AsyncDatabaseServer(FILE, (HOST, PORT), database_options=OPTIONS, workers=args.workers, primary=PRIMARY, forward_writes=FORWARD, reuse_port=FORWARD)
     else:
-        FILE = "data.txt"
-
-    with DatabaseServer(HOST, PORT, DatabaseHandler, FILE) as server:
-        print("Server started")
-        print("Database file: {}".format(FILE))
-        print("Server address: {}:{}".format(HOST, PORT))
-        print("Server PID: {}".format(server.getpid))
-        server.serve_forever()
\ No newline at end of file
+        server = DatabaseServer(FILE, (HOST, PORT), DatabaseHandler, database_options=OPTIONS, primary=PRIMARY, forward_writes=FORWARD, reuse_port=FORWARD)
+
+    # Admission control, the writer keeps the sessions of its readers open and unlimited
+    server.idle_timeout = None if args.process_role == "writer" else args.idle_timeout
+    server.read_timeout = args.read_timeout or None
+    server.write_timeout = None if args.process_role == "writer" else args.write_timeout or None
+    server.max_line = args.max_line
+    server.max_request = args.max_request
+    server.connections = ConnectionLimit(args.max_connections, args.max_client_connections) if args.max_connections or args.max_client_connections else None
+    server.queue_timeout = args.queue_timeout or None
+    server.limiter = RateLimiter(args.rate, args.burst) if args.rate and args.process_role != "writer" else None
+
+    # Expose the metrics, each process of a group on its own port
+    METRICS = None
+    if args.metrics_port is not None:
+        offset = args.shard_index + (args.process_index + 1 if args.process_role == "reader" else 0)
+        METRICS = serve_metrics(server.database.metrics, ("localhost", args.metrics_port + offset))
+
+    try:
+        with server:
+            print("Server started")
+            print("Database file: {}".format(FILE))
+            print("Durability: {}".format(OPTIONS["durability"]))
+            if OPTIONS["commit_window"] is not None:
+                print("Group commit: {} ms window, {} writes per flush".format(OPTIONS["commit_window"], OPTIONS["commit_batch"]))
+            print("Concurrency: {}".format(args.mode))
+            if server.connections is not None or server.queue_timeout or server.limiter is not None:
+                print("Admission: {} connections, {} per client, {} s queue, {} requests/s per client".format(
+                    args.max_connections or "unlimited", args.max_client_connections or "unlimited", server.queue_timeout or "unlimited", args.rate or "unlimited"))
+            if PRIMARY is not None:
+                print("Replica of: {}:{}{}".format(*PRIMARY, ", forwarding writes" if FORWARD else ""))
+            print("Loaded {} customers in {:.2f} s, peak RSS {:.1f} MB".format(len(server.database.database), server.database.loadSeconds, peak_rss() / 2 ** 20))
+            print("Server address: {}:{}".format(HOST, PORT))
+            print("Server PID: {}".format(server.getpid))
+            if args.shards > 1:
+                print("Shard: {} of {}".format(args.shard_index, args.shards))
+            if METRICS is not None:
+                print("Metrics: http://localhost:{}/metrics".format(METRICS.server_address[1]))
+            server.serve_forever()
+    finally:
+        if METRICS is not None:
+            METRICS.shutdown()
+        for shard in SHARDS:
+            shard.terminate()
@@ -0,0 +1,67 @@
+
+
+import os
+import tempfile
+import unittest
+
+from Server.database import Database
+
+class InvalidFileTest(unittest.TestCase):
+    """A file failing to load partway leaves an empty, consistent database."""
+
+    def setUp(self) -> None:
+        # Good lines followed by a line that is not UTF-8
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "db.txt")
+        with open(self.file, "wb") as f:
+            f.write(b"".join("Name{:05}|1|a|b\n".format(i).encode() for i in range(5000)))
+            f.write(b"Bad\xff|1|a|b\n")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_partial_load_is_dropped(self) -> None:
+        database = Database(self.file, indexes=["age", "phone"])
+        self.assertIsNone(database.get_customer("Name00001"))
+        self.assertEqual(database.report(), "")
+        self.assertEqual(database.find_by_age(1, 1), [])
+        self.assertEqual(database.find_by_phone("b"), [])
+
+        # The next customer is both found and reported
+        database.add_customer(["Ann", 2, "c", "d"])
+        self.assertEqual(database.get_customer("Ann"), "Ann|2|c|d")
+        self.assertEqual(database.report(), "Ann|2|c|d\n")
+        database.close()
+
+class RotateLogTest(unittest.TestCase):
+    """A log left by a failed compaction survives the next rotation."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "db.txt")
+        open(self.file, "w").close()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_rotation_keeps_unsnapshotted_log(self) -> None:
+        # A rotation whose snapshot was never written, then another
+        database = Database(self.file, Database.WAL)
+        database.add_customer(["Ann", 1, "a", "b"])
+        with database.lock:
+            database.rotate_log()
+        database.add_customer(["Zed", 9, "q", "r"])
+        with database.lock:
+            rotated = database.rotate_log()
+        database.close()
+
+        # Both mutations are in the rotated log, and replay after a crash
+        with open(rotated) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        database = Database(self.file, Database.WAL)
+        self.assertEqual(database.get_customer("Ann"), "Ann|1|a|b")
+        self.assertEqual(database.get_customer("Zed"), "Zed|9|q|r")
+        database.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+
+
+import time
+import threading
+import unittest
+from typing import List
+
+from Server.group_commit import GroupCommitter
+
+class GroupCommitterTest(unittest.TestCase):
+    """Batches flush when full, when their window closes and on close, their writers seeing any failure."""
+
+    def setUp(self) -> None:
+        # Record the flushes
+        self.flushes: List[List[List]] = []
+        self.failures: int = 0
+
+    def flush(self, records: List[List]) -> None:
+        # Fail as often as asked, then record
+        if self.failures:
+            self.failures -= 1
+            raise OSError("Disk full")
+        self.flushes.append(list(records))
+
+    def test_full_batch_flushes_before_its_window(self) -> None:
+        committer = GroupCommitter(self.flush, window=60000, batch_size=3)
+        try:
+            batch = committer.submit([["d", "Ann"], ["d", "Bob"]])
+            self.assertFalse(batch.done.wait(0.1))
+
+            # The third record fills it
+            self.assertIs(committer.submit([["d", "Cid"]]), batch)
+            self.assertTrue(batch.done.wait(5))
+            committer.wait(batch)
+            self.assertEqual(self.flushes, [[["d", "Ann"], ["d", "Bob"], ["d", "Cid"]]])
+        finally:
+            committer.close()
+
+    def test_window_closes_the_batch(self) -> None:
+        committer = GroupCommitter(self.flush, window=50, batch_size=1000)
+        try:
+            start = time.monotonic()
+            batch = committer.submit([["d", "Ann"]])
+            self.assertIs(committer.submit([["d", "Bob"]]), batch)
+            self.assertTrue(batch.done.wait(5))
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+            self.assertEqual(self.flushes, [[["d", "Ann"], ["d", "Bob"]]])
+
+            # The next records open a new batch
+            later = committer.submit([["d", "Cid"]])
+            self.assertIsNot(later, batch)
+            committer.wait(later)
+            self.assertEqual(self.flushes[1:], [[["d", "Cid"]]])
+        finally:
+            committer.close()
+
+    def test_failure_reaches_every_waiter(self) -> None:
+        self.failures = 1
+        committer = GroupCommitter(self.flush, window=60000, batch_size=2)
+        try:
+            batch = committer.submit([["d", "Ann"]])
+            errors = []
+
+            def waiter() -> None:
+                try:
+                    committer.wait(batch)
+                except OSError as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=waiter) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            committer.submit([["d", "Bob"]])
+            for thread in threads:
+                thread.join(5)
+            self.assertEqual([str(e) for e in errors], ["Disk full"] * 3)
+            self.assertEqual(self.flushes, [])
+
+            # Later batches still flush
+            later = committer.submit([["d", "Cid"], ["d", "Dan"]])
+            committer.wait(later)
+            self.assertEqual(self.flushes, [[["d", "Cid"], ["d", "Dan"]]])
+        finally:
+            committer.close()
+
+    def test_close_flushes_the_open_batch(self) -> None:
+        committer = GroupCommitter(self.flush, window=60000, batch_size=1000)
+        batch = committer.submit([["d", "Ann"]])
+        committer.close()
+
+        self.assertTrue(batch.done.is_set())
+        committer.wait(batch)
+        self.assertEqual(self.flushes, [[["d", "Ann"]]])
+        with self.assertRaises(ValueError):
+            committer.submit([["d", "Bob"]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+
+
+import random
+import unittest
+
+from Server.index import SortedIndex
+
+class SortedIndexTest(unittest.TestCase):
+    """Range queries across block boundaries agree with a sorted list."""
+
+    def setUp(self) -> None:
+        # Small blocks so that queries cross many of them
+        self.index = SortedIndex()
+        self.index.load = 4
+        self.keys = random.Random(1).sample(range(1000), 300)
+        for key in self.keys:
+            self.index.add(key)
+        for key in self.keys[:50]:
+            self.index.discard(key)
+        self.expected = sorted(self.keys[50:])
+
+    def test_range_and_after(self) -> None:
+        for low in (None, -1, 0, 333, 999, 1000):
+            start = 0 if low is None else next((i for i, key in enumerate(self.expected) if key >= low), len(self.expected))
+            self.assertEqual(self.index.range(low, 700, 10), [key for key in self.expected[start:] if key < 700][:10])
+            after = 0 if low is None else next((i for i, key in enumerate(self.expected) if key > low), len(self.expected))
+            self.assertEqual(self.index.after(low, 7), self.expected[after:after + 7])
+
+    def test_prefix(self) -> None:
+        index = SortedIndex("Name{:04}".format(i) for i in range(100))
+        self.assertEqual(index.prefix("Name004"), ["Name{:04}".format(i) for i in range(40, 50)])
+        self.assertEqual(index.prefix("Name00", 3), ["Name0000", "Name0001", "Name0002"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+
+
+import threading
+import unittest
+
+from Server.metrics import Metrics, StripedLock
+
+class StripedLockTest(unittest.TestCase):
+    """Single-key writers exclude the whole holder and each other on a stripe, not across stripes."""
+
+    def test_whole_holder_excludes_stripes(self) -> None:
+        lock = StripedLock(Metrics(), 4)
+        entered = threading.Event()
+
+        def writer() -> None:
+            with lock.stripe("Ann"):
+                entered.set()
+
+        with lock:
+            thread = threading.Thread(target=writer)
+            thread.start()
+            self.assertFalse(entered.wait(0.1))
+        thread.join(5)
+        self.assertTrue(entered.is_set())
+
+    def test_stripes_run_in_parallel(self) -> None:
+        lock = StripedLock(Metrics(), 64)
+        names = ["Name{}".format(i) for i in range(100)]
+        other = next(name for name in names if hash(name) % 64 != hash("Ann") % 64)
+        entered = threading.Event()
+
+        def writer() -> None:
+            with lock.stripe(other):
+                entered.set()
+
+        with lock.stripe("Ann"):
+            thread = threading.Thread(target=writer)
+            thread.start()
+            self.assertTrue(entered.wait(5))
+        thread.join(5)
+
+    def test_counters_are_summed(self) -> None:
+        metrics = Metrics()
+        lock = StripedLock(metrics, 8)
+        for name in ("Ann", "Bob", "Zed"):
+            with lock.stripe(name):
+                pass
+        with lock:
+            pass
+
+        with metrics.lock:
+            totals = metrics.totals()
+        self.assertEqual(totals["stripe_acquires"], 3)
+        self.assertEqual(totals["lock_acquires"], 1)
+        self.assertIn("stripe_acquires=3", metrics.stats()[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+
+
+import unittest
+
+from Server import protocol
+
+class ValidFieldsTest(unittest.TestCase):
+    """Binary fields must map onto text lines and file fields one to one."""
+
+    def test_separators_are_rejected(self) -> None:
+        self.assertFalse(protocol.valid_fields(["Bob", "Apt 1\nMain St"]))
+        self.assertFalse(protocol.valid_fields(["Bob", 3, "a|b", "555"]))
+
+    def test_plain_fields_pass(self) -> None:
+        self.assertTrue(protocol.valid_fields(["Bob", 3, "Apt 1, Main St", "555"]))
+        self.assertTrue(protocol.valid_fields([]))
+
+class DecodeFieldsTest(unittest.TestCase):
+    """Malformed payloads fail as ValueError, which the servers answer or close on."""
+
+    def test_truncated_fields(self) -> None:
+        payload = protocol.encode_fields([42, "Bob"])
+        for end in range(1, len(payload)):
+            if end == 9:
+                # Right after the int, a whole field
+                continue
+            with self.assertRaises(ValueError):
+                protocol.decode_fields(memoryview(payload[:end]))
+
+        self.assertEqual(protocol.decode_fields(memoryview(payload)), [42, "Bob"])
+
+class FrameStreamTest(unittest.TestCase):
+    """A streamed response reads back as the text written, with or without a codec."""
+
+    def round_trip(self, codec: str) -> None:
+        # Stream the chunks into frames
+        sent = []
+        stream = protocol.FrameStream(sent.append, protocol.OPCODES["print_report"], 7, codec)
+        chunks = ["Name{:05}|1|a|b\n".format(i) * 50 for i in range(20)]
+        for chunk in chunks:
+            stream.write(chunk.encode())
+        stream.close()
+
+        # Read them back through a frame reader
+        data = memoryview(b"".join(sent))
+        def readinto(view: memoryview) -> int:
+            nonlocal data
+            count = min(len(view), len(data))
+            view[:count] = data[:count]
+            data = data[count:]
+            return count
+
+        reader = protocol.FrameReader(readinto, codec)
+        response = protocol.StreamedResponse(codec)
+        frame = reader.read()
+        while frame[0] == protocol.STREAM:
+            self.assertEqual(frame[1], 7)
+            response.add(frame[2][0])
+            frame = reader.read()
+
+        self.assertEqual(frame, (protocol.OPCODES["print_report"], 7, []))
+        self.assertEqual(response.text(), "".join(chunks))
+
+    def test_plain(self) -> None:
+        self.round_trip(None)
+
+    def test_zlib(self) -> None:
+        self.round_trip("zlib")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+
+
+import os
+import tempfile
+import unittest
+
+from Server.database import Database
+from Server.sharding import HashRing, split_file
+
+class ResplitTest(unittest.TestCase):
+    """Shard files follow the ring they are served with."""
+
+    def setUp(self) -> None:
+        # A database file of a hundred customers
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "db.txt")
+        with open(self.file, "w") as f:
+            f.write("".join("Name{:03}|1|a|b\n".format(i) for i in range(100)))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_shard_count_change_moves_customers(self) -> None:
+        # Split, then write to a shard as its server would
+        files = split_file(self.file, 4)
+        database = Database(files[HashRing(4).shard("Zed")], Database.WAL)
+        database.add_customer(["Zed", 9, "q", "r"])
+        database.close()
+
+        # Every customer is on the shard the new ring routes it to, the write included
+        files = split_file(self.file, 2)
+        ring = HashRing(2)
+        names = ["Name{:03}".format(i) for i in range(100)] + ["Zed"]
+        for index, file in enumerate(files):
+            database = Database(file)
+            self.assertEqual(sorted(name for name in names if ring.shard(name) == index),
+                             [line.split("|")[0] for line in database.report().splitlines()])
+            database.close()
+        self.assertFalse(os.path.exists(self.file + ".shard2"))
+
+    def test_same_layout_is_reused(self) -> None:
+        files = split_file(self.file, 3)
+        with open(files[0], "a") as f:
+            f.write("Kept|1|a|b\n")
+
+        split_file(self.file, 3)
+        with open(files[0]) as f:
+            self.assertIn("Kept|1|a|b\n", f.read())
+
+if __name__ == "__main__":
+    unittest.main()
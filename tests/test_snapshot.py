@@ -0,0 +1,81 @@
+
+
+import os
+import tempfile
+import unittest
+
+from Server.database import Database
+
+class SnapshotPageTest(unittest.TestCase):
+    """An open snapshot reads the customers as they were, whatever writers do meanwhile."""
+
+    def setUp(self) -> None:
+        # Twenty customers in a scratch directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "db.txt")
+        with open(self.file, "w") as f:
+            f.write("".join("Name{:02}|{}|a|b\n".format(i, i) for i in range(20)))
+        self.database = Database(self.file)
+        self.before = self.database.report()
+
+    def tearDown(self) -> None:
+        self.database.close()
+        self.directory.cleanup()
+
+    def assertView(self, snapshot) -> None:
+        # Every page size puts page boundaries inside the saved names
+        for chunk in range(1, 22):
+            report = "".join(self.database.iter_report(chunk=chunk, snapshot=snapshot))
+            self.assertEqual(report, self.before, "chunk {}".format(chunk))
+
+    def test_deleted_customers_stay_in_view(self) -> None:
+        with self.database.snapshot() as snapshot:
+            for i in (0, 3, 4, 5, 11, 19):
+                self.assertTrue(self.database.delete_customer("Name{:02}".format(i)))
+            self.assertView(snapshot)
+
+    def test_readded_customers_show_their_old_record(self) -> None:
+        with self.database.snapshot() as snapshot:
+            for i in (2, 7, 8, 15):
+                self.database.delete_customer("Name{:02}".format(i))
+                self.database.add_customer(["Name{:02}".format(i), 99, "new", "new"])
+            self.database.update_age("Name09", 77)
+            self.assertView(snapshot)
+
+        # The live data moved on
+        self.assertEqual(self.database.get_customer("Name07"), "Name07|99|new|new")
+        self.assertEqual(self.database.get_customer("Name09"), "Name09|77|a|b")
+
+    def test_customers_added_since_are_hidden(self) -> None:
+        with self.database.snapshot() as snapshot:
+            # Added and kept, added then deleted, around and between the existing names
+            for name in ("A", "Name05x", "Name10x", "Zed"):
+                self.database.add_customer([name, 1, "c", "d"])
+            for name in ("Name05x", "Zed"):
+                self.database.delete_customer(name)
+
+            # Mixed with deletions of existing customers next to them
+            for i in (5, 6, 10):
+                self.database.delete_customer("Name{:02}".format(i))
+            self.assertView(snapshot)
+
+        # Closed, the report is live again
+        report = self.database.report()
+        self.assertIn("A|1|c|d\n", report)
+        self.assertIn("Name10x|1|c|d\n", report)
+        self.assertNotIn("Name05x", report)
+        self.assertNotIn("Name06|", report)
+
+    def test_limit_and_start_after(self) -> None:
+        with self.database.snapshot() as snapshot:
+            for i in range(4, 12):
+                self.database.delete_customer("Name{:02}".format(i))
+
+            # Resume inside the deleted names, a limit ending inside them too
+            lines = self.before.splitlines(keepends=True)
+            for chunk in (1, 2, 3, 5):
+                report = "".join(self.database.iter_report("Name05", 4, chunk, snapshot))
+                self.assertEqual(report, "".join(lines[6:10]), "chunk {}".format(chunk))
+
+if __name__ == "__main__":
+    unittest.main()
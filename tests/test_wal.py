@@ -0,0 +1,53 @@
+
+
+import os
+import tempfile
+import unittest
+
+from Server.database import Database
+from Server.wal import WriteAheadLog
+
+class TornTailTest(unittest.TestCase):
+    """Recovery from a log whose last record was cut short by a crash."""
+
+    def setUp(self) -> None:
+        # A database file and its log in a scratch directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "db.txt")
+        open(self.file, "w").close()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_writes_after_recovery_survive(self) -> None:
+        # Log a customer, then leave a torn record behind it
+        database = Database(self.file, Database.WAL)
+        database.add_customer(["Ann", 1, "a", "b"])
+        database.close()
+        with open(self.file + ".log", "ab") as f:
+            f.write(b'["g","Ann",2')
+
+        # Recover, then log a write on top
+        database = Database(self.file, Database.WAL)
+        self.assertEqual(database.get_customer("Ann"), "Ann|1|a|b")
+        database.add_customer(["Zed", 9, "q", "r"])
+        database.close()
+
+        # The write made after the recovery must replay
+        database = Database(self.file, Database.WAL)
+        self.assertEqual(database.get_customer("Ann"), "Ann|1|a|b")
+        self.assertEqual(database.get_customer("Zed"), "Zed|9|q|r")
+        database.close()
+
+    def test_record_without_newline_is_torn(self) -> None:
+        # A whole record whose newline never reached the disk
+        log = os.path.join(self.directory.name, "only.log")
+        with open(log, "wb") as f:
+            f.write(b'["d","Ann"]\n["d","Bob"]')
+
+        self.assertEqual(list(WriteAheadLog.replay(log)), [["d", "Ann"]])
+        with open(log, "rb") as f:
+            self.assertEqual(f.read(), b'["d","Ann"]\n')
+
+if __name__ == "__main__":
+    unittest.main()